@@ -0,0 +1,399 @@
+"""Headless JSON API over ContentDatabase
+
+    python api.py --db contentmood.db --port 8000
+
+Endpoints:
+    GET  /health
+    GET  /content?limit=50&q=potter
+    GET  /moods
+    GET  /content-with-moods
+    GET  /stats/quick | /stats/genres | /stats/content-types
+    POST /content            one entry object or a list of them
+    GET  /sessions?limit=50  per-item totals of logged progress checkpoints
+    GET  /sessions/curves?content_id=1&content_id=2   checkpoints of those items
+    POST /sessions           one checkpoint object or a list of them
+    GET  /changes?since=0    change log export for sync.py (limit, exclude_origin)
+    POST /changes            apply an export from another database
+    GET  /sync/cursor?peer=  this device id and the last seq applied from peer
+
+Every GET accepts the sidebar filters as query parameters:
+type and genre (repeatable), from and to (YYYY-MM-DD), min_rating, max_rating.
+
+GET responses carry an ETag derived from the database data version and
+answer If-None-Match with 304. Bodies are gzipped when the client accepts it.
+Errors come back as {"error": ...}: 400 for a bad request, 500 otherwise.
+"""
+import argparse
+import gzip
+import json
+import queue
+import socket
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from database import CONTENT_FIELDS, MOOD_FIELDS, SESSION_FIELDS, ContentDatabase
+from filters import ContentFilter
+
+GZIP_MIN_BYTES = 1024
+REQUIRED_FIELDS = ("title", "content_type", "date_consumed")
+REQUIRED_SESSION_FIELDS = ("content_id", "mood")
+# JSON values an entry field may hold
+SCALAR_TYPES = (str, int, float, type(None))
+
+
+class WriteBatcher:
+    """Funnel concurrent writes through one thread and commit them together
+
+    Requests that arrive within max_delay of each other share a single
+    transaction, so a burst of POSTs costs one fsync instead of one each.
+    write takes the combined list and returns the new ids (default:
+    db.add_entries).
+    """
+
+    def __init__(self, db, max_batch=500, max_delay=0.005, write=None):
+        self.db = db
+        self.write = write or db.add_entries
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="api-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, entries):
+        """Queue entries for writing; the future resolves to their new ids"""
+        future = Future()
+        self._queue.put((entries, future))
+        return future
+
+    def _run(self):
+        while True:
+            pending = [self._queue.get()]
+            size = len(pending[0][0])
+            deadline = time.monotonic() + self.max_delay
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                pending.append(item)
+                size += len(item[0])
+            self._commit(pending)
+
+    def _commit(self, pending):
+        entries = [entry for batch, _ in pending for entry in batch]
+        try:
+            ids = self.write(entries)
+        except Exception as exc:
+            if len(pending) == 1:
+                pending[0][1].set_exception(exc)
+                return
+            # One request's bad entry must not fail the others batched with it
+            for item in pending:
+                self._commit([item])
+            return
+        offset = 0
+        for batch, future in pending:
+            future.set_result(ids[offset:offset + len(batch)])
+            offset += len(batch)
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _validate_entry(entry):
+    if not isinstance(entry, dict):
+        raise ApiError(400, "each entry must be a JSON object")
+    missing = [field for field in REQUIRED_FIELDS if not entry.get(field)]
+    if missing:
+        raise ApiError(400, f"missing required fields: {', '.join(missing)}")
+    unknown = set(entry) - set(CONTENT_FIELDS) - set(MOOD_FIELDS)
+    if unknown:
+        raise ApiError(400, f"unknown fields: {', '.join(sorted(unknown))}")
+    nested = sorted(field for field, value in entry.items() if not isinstance(value, SCALAR_TYPES))
+    if nested:
+        raise ApiError(400, f"fields must be strings, numbers or null: {', '.join(nested)}")
+    return entry
+
+
+def _validate_session_event(event):
+    if not isinstance(event, dict):
+        raise ApiError(400, "each checkpoint must be a JSON object")
+    missing = [field for field in REQUIRED_SESSION_FIELDS if event.get(field) is None]
+    if missing:
+        raise ApiError(400, f"missing required fields: {', '.join(missing)}")
+    unknown = set(event) - set(SESSION_FIELDS)
+    if unknown:
+        raise ApiError(400, f"unknown fields: {', '.join(sorted(unknown))}")
+    if not isinstance(event["content_id"], int):
+        raise ApiError(400, "content_id must be an integer")
+    if not isinstance(event["mood"], int) or not 1 <= event["mood"] <= 10:
+        raise ApiError(400, "mood must be an integer from 1 to 10")
+    for field in ("chapter", "episode"):
+        if not isinstance(event.get(field), (int, type(None))):
+            raise ApiError(400, f"{field} must be an integer or null")
+    if not isinstance(event.get("minutes"), (int, float, type(None))):
+        raise ApiError(400, "minutes must be a number or null")
+    if not isinstance(event.get("logged_at"), (str, type(None))):
+        raise ApiError(400, "logged_at must be a timestamp string or null")
+    return event
+
+
+def _int_param(params, name, default):
+    try:
+        return int(params.get(name, [default])[0])
+    except ValueError:
+        raise ApiError(400, f"{name} must be an integer")
+
+
+def _float_param(params, name):
+    if name not in params:
+        return None
+    try:
+        return float(params[name][0])
+    except ValueError:
+        raise ApiError(400, f"{name} must be a number")
+
+
+def _filters(params):
+    return ContentFilter(
+        date_from=params.get("from", [None])[0],
+        date_to=params.get("to", [None])[0],
+        content_types=params.get("type"),
+        genres=params.get("genre"),
+        min_rating=_float_param(params, "min_rating"),
+        max_rating=_float_param(params, "max_rating"),
+    )
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "ContentMoodAPI/1.0"
+
+    # Set by make_server
+    db = None
+    batcher = None
+    session_batcher = None
+
+    def setup(self):
+        super().setup()
+        # Headers and body go out in separate writes; without this Nagle's
+        # algorithm adds a delayed-ACK round trip to every keep-alive request
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def _routes(self):
+        return {
+            "/health": lambda params: {"status": "ok"},
+            "/content": self._get_content,
+            "/moods": lambda params: self.db.get_all_moods(_filters(params)),
+            "/content-with-moods": lambda params: self.db.get_content_with_moods(_filters(params), with_text=True),
+            "/stats/quick": lambda params: self.db.get_quick_stats(_filters(params)),
+            "/stats/genres": lambda params: self.db.get_genre_stats(_filters(params)),
+            "/stats/content-types": lambda params: self.db.get_content_type_stats(_filters(params)),
+            "/sessions": lambda params: self.db.get_session_rollups(
+                _filters(params), _int_param(params, "limit", 100)),
+            "/sessions/curves": self._get_session_curves,
+            "/changes": lambda params: self.db.export_changes(
+                _int_param(params, "since", 0), params.get("exclude_origin", [None])[0],
+                _int_param(params, "limit", 5000)),
+            "/sync/cursor": lambda params: {
+                "device_id": self.db.get_device_id(),
+                "last_seq": self.db.get_sync_cursor(params.get("peer", [""])[0])},
+        }
+
+    def _get_content(self, params):
+        limit = _int_param(params, "limit", 100)
+        term = params.get("q", [""])[0]
+        if term:
+            return self.db.search_content(term, limit, _filters(params), with_notes=True)
+        return self.db.get_all_content(limit, _filters(params), with_notes=True)
+
+    def _get_session_curves(self, params):
+        try:
+            content_ids = [int(value) for value in params.get("content_id", [])]
+        except ValueError:
+            raise ApiError(400, "content_id must be an integer")
+        return self.db.get_session_curves(content_ids)
+
+    def _guarded(self, method):
+        """Run method, answering a JSON 500 for anything it doesn't handle itself"""
+        try:
+            method()
+        except Exception as exc:
+            # The request body may be half read: don't reuse the connection
+            self.close_connection = True
+            self._send_json(500, {"error": f"internal error: {exc}"})
+
+    def do_GET(self):
+        self._guarded(self._get)
+
+    def do_POST(self):
+        self._guarded(self._post)
+
+    def _get(self):
+        url = urlparse(self.path)
+        handler = self._routes().get(url.path)
+        if handler is None:
+            self._send_json(404, {"error": "not found"})
+            return
+        version = self.db.get_data_version()
+        if url.path.startswith("/sessions"):
+            version = f"{version}.{self.db.get_sessions_version()}"
+        elif url.path == "/sync/cursor":
+            # Cursors and the device id move without a data version bump
+            peer = parse_qs(url.query).get("peer", [""])[0]
+            version = f"{version}.{self.db.get_sync_cursor(peer)}.{self.db.get_device_id()}"
+        etag = f'W/"{version}-{zlib.crc32(self.path.encode("utf-8")):x}"'
+        if etag in self.headers.get("If-None-Match", ""):
+            self._send(304, b"", extra_headers={"ETag": etag})
+            return
+        try:
+            result = handler(parse_qs(url.query))
+        except ApiError as exc:
+            self._send_json(exc.status, {"error": exc.message})
+            return
+        body = result.to_json(orient="records") if hasattr(result, "to_json") else json.dumps(result)
+        self._send(200, body.encode("utf-8"), extra_headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = self.rfile.read(length)
+        if self.headers.get("Content-Encoding") == "gzip":
+            try:
+                payload = gzip.decompress(payload)
+            except (OSError, EOFError, zlib.error):
+                raise ApiError(400, "body is not valid gzip")
+        try:
+            return json.loads(payload or b"null")
+        except ValueError:
+            raise ApiError(400, "body must be JSON")
+
+    def _post(self):
+        path = urlparse(self.path).path
+        if path == "/changes":
+            self._post_changes()
+            return
+        if path == "/sessions":
+            self._post_sessions()
+            return
+        if path != "/content":
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            data = self._read_json()
+            entries = data if isinstance(data, list) else [data]
+            entries = [_validate_entry(entry) for entry in entries]
+        except ApiError as exc:
+            self._send_json(exc.status, {"error": exc.message})
+            return
+        try:
+            ids = self.batcher.submit(entries).result()
+        except Exception as exc:
+            self._send_json(500, {"error": f"write failed: {exc}"})
+            return
+        self._send_json(201, {"ids": ids})
+
+    def _post_sessions(self):
+        try:
+            data = self._read_json()
+            events = data if isinstance(data, list) else [data]
+            events = [_validate_session_event(event) for event in events]
+        except ApiError as exc:
+            self._send_json(exc.status, {"error": exc.message})
+            return
+        try:
+            ids = self.session_batcher.submit(events).result()
+        except ValueError as exc:
+            # Checkpoints for items that don't exist
+            self._send_json(400, {"error": str(exc)})
+            return
+        except Exception as exc:
+            self._send_json(500, {"error": f"write failed: {exc}"})
+            return
+        self._send_json(201, {"ids": ids})
+
+    def _post_changes(self):
+        try:
+            data = self._read_json()
+            if not isinstance(data, dict) or not isinstance(data.get("changes"), list):
+                raise ApiError(400, "body must be an export with a list of changes")
+            applied = self.db.apply_changes(data["changes"], data.get("device_id"), data.get("last_seq"))
+        except ApiError as exc:
+            self._send_json(exc.status, {"error": exc.message})
+            return
+        except (KeyError, TypeError, ValueError) as exc:
+            self._send_json(400, {"error": f"malformed change: {exc}"})
+            return
+        self._send_json(200, {"applied": applied})
+
+    def _send_json(self, status, data):
+        self._send(status, json.dumps(data).encode("utf-8"))
+
+    def _send(self, status, body, extra_headers=None):
+        self.send_response(status)
+        headers = dict(extra_headers or {})
+        if body:
+            headers["Content-Type"] = "application/json"
+            if len(body) >= GZIP_MIN_BYTES and "gzip" in self.headers.get("Accept-Encoding", ""):
+                body = gzip.compress(body, compresslevel=5)
+                headers["Content-Encoding"] = "gzip"
+            headers["Vary"] = "Accept-Encoding"
+        headers["Content-Length"] = str(len(body))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(db_name="contentmood.db", host="127.0.0.1", port=8000, pool_size=8, maintenance_interval=0,
+                backup_interval=0, shared_cache_bytes=0):
+    """Build a threaded HTTP server sharing one pooled ContentDatabase"""
+    db = ContentDatabase(db_name, pool_size=pool_size, maintenance_interval=maintenance_interval,
+                         backup_interval=backup_interval, shared_cache_bytes=shared_cache_bytes)
+    # Checkpoints can arrive far more often than entries: they get their own writer
+    session_batcher = WriteBatcher(db, write=db.add_session_events)
+    handler = type("BoundApiHandler", (ApiHandler,), {"db": db, "batcher": WriteBatcher(db),
+                                                     "session_batcher": session_batcher})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ContentMood JSON API")
+    parser.add_argument("--db", default="contentmood.db")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--pool-size", type=int, default=8)
+    parser.add_argument("--maintenance-interval", type=float, default=300.0,
+                        help="seconds between maintenance checks (see maintenance.py), 0 for none")
+    parser.add_argument("--backup-interval", type=float, default=86400.0,
+                        help="seconds between online backups when the data changed (see backup.py), 0 for none")
+    parser.add_argument("--shared-cache-mb", type=float, default=0,
+                        help="results cache shared with other processes on this host (see cache.py), 0 for none")
+    args = parser.parse_args()
+    server = make_server(args.db, args.host, args.port, args.pool_size, args.maintenance_interval,
+                         args.backup_interval, int(args.shared_cache_mb * 1024 * 1024))
+    print(f"📡 ContentMood API listening on http://{args.host}:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
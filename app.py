@@ -1,9 +1,14 @@
+import os
+import time
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 from datetime import datetime, timedelta
 from database import ContentDatabase
+from filters import ContentFilter
+from metrics import RERUN_SECONDS, start_exporter_from_env
+from predictor import load_predictor
+
+rerun_started = time.perf_counter()
+start_exporter_from_env()
 
 # Page configuration
 st.set_page_config(
@@ -221,6 +226,8 @@ def get_mood_emoji(mood_score):
     else:
         return "😊"
 
+CONTENT_TYPES = ["Book", "Movie", "TV Show", "Anime", "Manga", "Game", "Podcast"]
+
 def get_content_icon(content_type):
     icons = {
         "Book": "📚",
@@ -233,8 +240,31 @@ def get_content_icon(content_type):
     }
     return icons.get(content_type, "📌")
 
-# Initialize database
-db = ContentDatabase()
+# Initialize database (CONTENTMOOD_READ_MODE=snapshot sends page reads to a
+# periodically refreshed copy so big renders never hold up the Add form, and
+# CONTENTMOOD_BACKEND=duckdb answers them from a columnar mirror; query results
+# are cached per data version within CONTENTMOOD_CACHE_MB megabytes; every
+# CONTENTMOOD_MAINTENANCE_INTERVAL seconds the file gets whatever ANALYZE,
+# checkpoint or vacuum it is due, 0 turns that off, and an online backup lands
+# in backups/ every CONTENTMOOD_BACKUP_INTERVAL seconds when the data changed;
+# CONTENTMOOD_SHARED_CACHE_MB > 0 shares results between worker processes;
+# a page's independent queries run CONTENTMOOD_PARALLEL_READS at a time)
+db = ContentDatabase(
+    read_mode=os.environ.get("CONTENTMOOD_READ_MODE", "primary"),
+    snapshot_max_age=float(os.environ.get("CONTENTMOOD_SNAPSHOT_MAX_AGE", "30")),
+    backend=os.environ.get("CONTENTMOOD_BACKEND", "sqlite"),
+    cache_bytes=int(float(os.environ.get("CONTENTMOOD_CACHE_MB", "64")) * 1024 * 1024),
+    maintenance_interval=float(os.environ.get("CONTENTMOOD_MAINTENANCE_INTERVAL", "300")),
+    backup_interval=float(os.environ.get("CONTENTMOOD_BACKUP_INTERVAL", "86400")),
+    shared_cache_bytes=int(float(os.environ.get("CONTENTMOOD_SHARED_CACHE_MB", "0")) * 1024 * 1024),
+    shared_cache_dir=os.environ.get("CONTENTMOOD_SHARED_CACHE_DIR") or None,
+    parallel_reads=int(os.environ.get("CONTENTMOOD_PARALLEL_READS", str(min(4, os.cpu_count() or 1))))
+)
+
+# Notes the Insights page scores inline per rerun
+NOTES_SCORED_PER_RERUN = 2000
+# Histories larger than this open Analytics in approximate mode
+APPROXIMATE_MODE_ROWS = 1000000
 
 # Sidebar Navigation
 with st.sidebar:
@@ -245,146 +275,336 @@ with st.sidebar:
     page = st.radio(
         "Navigate",
         ["🏠 Dashboard", "➕ Add New Content", "📊 Analytics", "💡 Insights"],
-        label_visibility="collapsed"
+        label_visibility="collapsed",
+        key="page"
+    )
+    
+    st.markdown("---")
+    st.markdown("### 🔎 Filters")
+    
+    # Every page reads through this filter; it is compiled to a WHERE clause
+    # and applied inside the database queries rather than in pandas
+    filter_options = db.get_filter_options()
+    date_range = ()
+    if filter_options["first_date"]:
+        first_date = datetime.strptime(filter_options["first_date"][:10], "%Y-%m-%d").date()
+        last_date = datetime.strptime(filter_options["last_date"][:10], "%Y-%m-%d").date()
+        date_range = st.date_input(
+            "📆 Date range",
+            value=(first_date, last_date),
+            min_value=first_date,
+            max_value=last_date
+        )
+    selected_types = st.multiselect("📁 Content type", filter_options["content_types"])
+    selected_genres = st.multiselect("🎭 Genre", filter_options["genres"])
+    rating_range = st.slider("⭐ Rating", 0.0, 10.0, (0.0, 10.0), 0.5)
+    
+    content_filter = ContentFilter(
+        # The full range is no restriction; leaving it out keeps the plain table scan
+        date_from=date_range[0] if len(date_range) > 0 and date_range[0] != first_date else None,
+        date_to=date_range[1] if len(date_range) > 1 and date_range[1] != last_date else None,
+        content_types=selected_types,
+        genres=selected_genres,
+        min_rating=rating_range[0] if rating_range[0] > 0 else None,
+        max_rating=rating_range[1] if rating_range[1] < 10 else None
     )
     
     st.markdown("---")
     st.markdown("### Quick Stats")
     
-    # Get quick stats
-    content_df = db.get_all_content()
-    mood_df = db.get_content_with_moods()
+    # Get quick stats (aggregated in SQL so pages without charts never load pandas)
+    quick_stats = db.get_quick_stats(content_filter)
     
-    if not content_df.empty:
-        st.metric("Total Content", len(content_df))
+    if quick_stats["total_content"]:
+        st.metric("Total Content", quick_stats["total_content"])
         
-        if not mood_df.empty and 'mood_change' in mood_df.columns:
-            avg_mood_boost = mood_df['mood_change'].mean()
+        if quick_stats["avg_mood_change"] is not None:
+            avg_mood_boost = quick_stats["avg_mood_change"]
             st.metric("Avg Mood Boost", f"+{avg_mood_boost:.1f}")
     
    
-# Main Content Area
-if page == "🏠 Dashboard":
-    st.title("📚 Welcome to Your Reading Journey")
+# Page sections
+# Each section is a fragment that shows only the data it needs: a widget inside
+# one reruns just that function instead of the whole script, and full reruns
+# (sidebar filters, navigation) stay cheap because no section loads more rows
+# than it needs. The Dashboard fetches its sections' data together and passes
+# it in; a fragment rerun reuses it.
+@st.fragment
+def dashboard_metrics(summary):
+    col1, col2, col3, col4 = st.columns(4)
     
-    if content_df.empty:
-        st.info("👋 Start by adding your first book, show, or anime!")
-    else:
-        # Top metrics
-        col1, col2, col3, col4 = st.columns(4)
-        
+    with col1:
+        st.metric("📚 Total Content", summary["total_content"])
+    
+    with col2:
+        st.metric("📖 Books Read", summary["type_counts"].get("Book", 0))
+    
+    with col3:
+        st.metric("🎌 Anime Watched", summary["type_counts"].get("Anime", 0))
+    
+    with col4:
+        avg_rating = summary["avg_rating"]
+        st.metric("⭐ Avg Rating", f"{avg_rating:.1f}/10" if avg_rating is not None else "–")
+
+
+@st.fragment
+def habits():
+    today = datetime.now().date()
+    streak = db.get_streaks(today)
+    goals = db.get_goal_progress(today)
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("🔥 Current Streak", f"{streak['current']} day{'s' if streak['current'] != 1 else ''}")
+        if streak["current"] and not streak["active_today"]:
+            st.caption("Log something today to keep it going!")
+    with col2:
+        st.metric("🏆 Longest Streak", f"{streak['longest']} day{'s' if streak['longest'] != 1 else ''}")
+        if streak["longest"]:
+            st.caption(f"{streak['longest_start']} → {streak['longest_end']}")
+    
+    if goals:
+        st.subheader("🎯 Goals")
+    for goal in goals:
+        col1, col2 = st.columns([6, 1])
         with col1:
-            st.metric("📚 Total Content", len(content_df))
-        
+            st.progress(
+                min(goal["done"] / goal["target"], 1.0),
+                text=f"{'✅ ' if goal['done'] >= goal['target'] else ''}{goal['title']}: "
+                     f"{goal['done']}/{goal['target']} this {goal['period']}"
+            )
         with col2:
-            books_count = len(content_df[content_df['content_type'] == 'Book'])
-            st.metric("📖 Books Read", books_count)
+            if st.button("🗑️", key=f"delete_goal_{goal['id']}", help="Remove this goal"):
+                db.delete_goal(goal["id"])
+                st.rerun()
+    
+    with st.expander("🎯 Set a goal"):
+        with st.form("add_goal_form", clear_on_submit=True):
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                target = st.number_input("How many", min_value=1, value=50)
+            with col2:
+                content_type = st.selectbox(
+                    "Of",
+                    ["Anything", "Book", "Movie", "TV Show", "Anime", "Manga", "Game", "Podcast"]
+                )
+            with col3:
+                period = st.selectbox("Per", ["year", "month", "week"])
+            title = st.text_input("Name", placeholder=f"e.g. {target} books this year")
+            if st.form_submit_button("✨ Add Goal"):
+                label = "entries" if content_type == "Anything" else f"{content_type.lower()}s"
+                db.add_goal(
+                    title=title or f"{target} {label} per {period}",
+                    period=period,
+                    target=int(target),
+                    content_type=None if content_type == "Anything" else content_type
+                )
+                st.rerun()
+
+
+@st.fragment
+def recent_content(recent):
+    import pandas as pd
+    
+    st.subheader("☀️ Recently Consumed")
+    
+    cols = st.columns(3)
+    for idx, (_, row) in enumerate(recent.iterrows()):
+        with cols[idx % 3]:
+            # Create a card with hover effect
+            st.markdown(f"""
+            <div class="content-card">
+                <h3 style="color: #6B5444; margin-top: 0;">{get_content_icon(row['content_type'])} {row['title']}</h3>
+                <p style="color: #8B7355; font-weight: 600; margin: 8px 0;">{row['genre']}</p>
+                <p style="color: #A0826D; margin: 8px 0;">{f"{'⭐' * int(row['rating'])} {row['rating']}/10" if pd.notna(row['rating']) else '☆ unrated'}</p>
+                <p style="color: #6B5444; font-style: italic; font-size: 14px; margin: 8px 0;">
+                    {row['notes'][:60] + '...' if pd.notna(row['notes']) and len(str(row['notes'])) > 60 else (row['notes'] if pd.notna(row['notes']) else '')}
+                </p>
+            </div>
+            """, unsafe_allow_html=True)
+
+
+@st.fragment
+def mood_journey(mood_df, rollups):
+    import pandas as pd
+    import plotly.graph_objects as go
+    
+    st.subheader("📈 Your Mood Journey")
+    
+    if not mood_df.empty and 'mood_after' in mood_df.columns:
+        # Rolling averages make long histories readable; changing this only reruns the chart
+        smoothing = st.radio(
+            "📏 Smoothing",
+            ["None", "7 entries", "30 entries"],
+            horizontal=True,
+            key="mood_journey_smoothing"
+        )
+        window = 1 if smoothing == "None" else int(smoothing.split()[0])
         
-        with col3:
-            anime_count = len(content_df[content_df['content_type'] == 'Anime'])
-            st.metric("🎌 Anime Watched", anime_count)
+        mood_df['date_consumed'] = pd.to_datetime(mood_df['date_consumed'])
+        mood_df_sorted = mood_df.sort_values('date_consumed')
+        mood_after = mood_df_sorted['mood_after'].rolling(window, min_periods=1).mean()
+        mood_before = mood_df_sorted['mood_before'].rolling(window, min_periods=1).mean()
         
-        with col4:
-            avg_rating = content_df['rating'].mean()
-            st.metric("⭐ Avg Rating", f"{avg_rating:.1f}/10")
+        fig = go.Figure()
         
-        st.markdown("---")
+        fig.add_trace(go.Scatter(
+            x=mood_df_sorted['date_consumed'],
+            y=mood_after,
+            name='Mood After',
+            line=dict(color='#8B7355', width=3),
+            mode='lines',
+            fill='tozeroy',
+            fillcolor='rgba(139, 115, 85, 0.2)'
+        ))
         
-        # Recently consumed content
-        st.subheader("☀️ Recently Consumed")
-        recent = content_df.head(6)
-        
-        cols = st.columns(3)
-        for idx, (_, row) in enumerate(recent.iterrows()):
-            with cols[idx % 3]:
-                # Create a card with hover effect
-                st.markdown(f"""
-                <div class="content-card">
-                    <h3 style="color: #6B5444; margin-top: 0;">{get_content_icon(row['content_type'])} {row['title']}</h3>
-                    <p style="color: #8B7355; font-weight: 600; margin: 8px 0;">{row['genre']}</p>
-                    <p style="color: #A0826D; margin: 8px 0;">{'⭐' * int(row['rating'])} {row['rating']}/10</p>
-                    <p style="color: #6B5444; font-style: italic; font-size: 14px; margin: 8px 0;">
-                        {row['notes'][:60] + '...' if pd.notna(row['notes']) and len(str(row['notes'])) > 60 else (row['notes'] if pd.notna(row['notes']) else '')}
-                    </p>
-                </div>
-                """, unsafe_allow_html=True)
+        fig.add_trace(go.Scatter(
+            x=mood_df_sorted['date_consumed'],
+            y=mood_before,
+            name='Mood Before',
+            line=dict(color='#D4A574', dash='dash', width=2),
+            mode='lines'
+        ))
         
-        st.markdown("---")
+        fig.update_layout(
+            plot_bgcolor='white',
+            paper_bgcolor='#FAF6F0',
+            font=dict(color='#6B5444', family='Georgia', size=12),
+            xaxis_title="Date",
+            yaxis_title="Mood Score",
+            yaxis=dict(
+                range=[0, 11], 
+                gridcolor='#E8D5C4', 
+                tickfont=dict(color='#6B5444'),
+                title_font=dict(color='#6B5444')
+            ),
+            xaxis=dict(
+                gridcolor='#E8D5C4', 
+                tickfont=dict(color='#6B5444'),
+                title_font=dict(color='#6B5444')
+            ),
+            hovermode='x unified',
+            legend=dict(
+                orientation="h",
+                yanchor="bottom",
+                y=1.02,
+                xanchor="right",
+                x=1,
+                font=dict(color='#6B5444')
+            )
+        )
         
-        # Mood Journey
-        st.subheader("📈 Your Mood Journey")
+        st.plotly_chart(fig, use_container_width=True)
+    else:
+        st.info("Add mood tracking to see your emotional journey!")
+    
+    # Checkpoints logged along the way show how the mood moved inside a series
+    if not rollups.empty:
+        st.markdown("**🎬 Inside a Series**")
+        names = dict(zip(rollups["id"].tolist(), rollups["title"]))
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            picked = st.multiselect(
+                "Series",
+                list(names),
+                default=list(names)[:1],
+                format_func=names.get,
+                max_selections=5,
+                key="mood_journey_series",
+                label_visibility="collapsed"
+            )
+        with col2:
+            along = st.radio("Along", ["Checkpoints", "Minutes in"], horizontal=True,
+                             key="mood_journey_along", label_visibility="collapsed")
+        curves = db.get_session_curves(picked)
+        x = "checkpoint" if along == "Checkpoints" else "elapsed_minutes"
         
-        if not mood_df.empty and 'mood_after' in mood_df.columns:
-            mood_df['date_consumed'] = pd.to_datetime(mood_df['date_consumed'])
-            mood_df_sorted = mood_df.sort_values('date_consumed')
-            
-            fig = go.Figure()
-            
-            fig.add_trace(go.Scatter(
-                x=mood_df_sorted['date_consumed'],
-                y=mood_df_sorted['mood_after'],
-                name='Mood After',
-                line=dict(color='#8B7355', width=3),
-                mode='lines',
-                fill='tozeroy',
-                fillcolor='rgba(139, 115, 85, 0.2)'
-            ))
-            
+        fig = go.Figure()
+        for content_id, curve in curves.groupby("content_id", sort=False):
+            where = [f"Chapter {chapter:.0f}" if pd.notna(chapter) else (f"Episode {episode:.0f}" if pd.notna(episode) else "")
+                     for chapter, episode in zip(curve["chapter"], curve["episode"])]
             fig.add_trace(go.Scatter(
-                x=mood_df_sorted['date_consumed'],
-                y=mood_df_sorted['mood_before'],
-                name='Mood Before',
-                line=dict(color='#D4A574', dash='dash', width=2),
-                mode='lines'
+                x=curve[x],
+                y=curve["mood"],
+                name=names.get(content_id, str(content_id)),
+                mode='lines+markers',
+                text=where,
+                hovertemplate='%{text}<br>Mood %{y}<extra>%{fullData.name}</extra>'
             ))
-            
-            fig.update_layout(
-                plot_bgcolor='white',
-                paper_bgcolor='#FAF6F0',
-                font=dict(color='#6B5444', family='Georgia', size=12),
-                xaxis_title="Date",
-                yaxis_title="Mood Score",
-                yaxis=dict(
-                    range=[0, 11], 
-                    gridcolor='#E8D5C4', 
-                    tickfont=dict(color='#6B5444'),
-                    title_font=dict(color='#6B5444')
-                ),
-                xaxis=dict(
-                    gridcolor='#E8D5C4', 
-                    tickfont=dict(color='#6B5444'),
-                    title_font=dict(color='#6B5444')
-                ),
-                hovermode='x unified',
-                legend=dict(
-                    orientation="h",
-                    yanchor="bottom",
-                    y=1.02,
-                    xanchor="right",
-                    x=1,
-                    font=dict(color='#6B5444')
-                )
-            )
-            
-            st.plotly_chart(fig, use_container_width=True)
-        else:
-            st.info("Add mood tracking to see your emotional journey!")
+        
+        fig.update_layout(
+            plot_bgcolor='white',
+            paper_bgcolor='#FAF6F0',
+            font=dict(color='#6B5444', family='Georgia', size=12),
+            xaxis_title="Checkpoint" if x == "checkpoint" else "Minutes in",
+            yaxis_title="Mood Score",
+            yaxis=dict(range=[0, 11], gridcolor='#E8D5C4'),
+            xaxis=dict(gridcolor='#E8D5C4'),
+            colorway=['#8B7355', '#D4A574', '#A0826D', '#6B5444', '#C9A882'],
+            height=320
+        )
+        
+        st.plotly_chart(fig, use_container_width=True)
 
-elif page == "➕ Add New Content":
-    st.title("➕ Add New Content")
-    st.markdown("*Log what you've been reading, watching, or experiencing*")
+
+def pick_suggestion(field):
+    """Copy a clicked suggestion into its text box; a known title also brings
+    its usual type, and its genre and creator where those are still blank"""
+    from autocomplete import get_suggester
     
-    with st.form("add_content_form"):
+    picked = st.session_state[f"pick_{field}"]
+    st.session_state[f"pick_{field}"] = None
+    if not picked:
+        return
+    st.session_state[f"add_{field}"] = picked
+    if field == "title":
+        usual = get_suggester(db).usual(picked) or {}
+        if usual.get("content_type") in CONTENT_TYPES:
+            st.session_state["add_content_type"] = usual["content_type"]
+        for name in ("genre", "creator"):
+            if usual.get(name) and not st.session_state.get(f"add_{name}"):
+                st.session_state[f"add_{name}"] = usual[name]
+
+
+def suggestion_pills(field, text):
+    """Known values close to what was typed, as clickable pills"""
+    from autocomplete import get_suggester, normalize
+    
+    if not text:
+        return
+    suggestions = [value for value, _ in get_suggester(db).suggest(field, text)
+                   if normalize(value) != normalize(text)]
+    if suggestions:
+        st.pills(f"Known {field}s", suggestions, key=f"pick_{field}", on_change=pick_suggestion,
+                 args=(field,), label_visibility="collapsed")
+
+
+@st.fragment
+def add_content_form():
+    from autocomplete import get_suggester
+    
+    # Caught up once per rerun (rebuilt in the background when that is slow):
+    # the suggestion lookups below only read the index
+    get_suggester(db).ready()
+    
+    if "added_title" in st.session_state:
+        st.success(f"✨ {st.session_state.pop('added_title')} added successfully!")
+        st.snow()  # Falling pages effect!
+        st.markdown("✨📚☕ *Added to your collection!*")
+    
+    # Plain widgets rather than st.form, so the predicted mood follows every edit
+    with st.container(border=True):
         col1, col2 = st.columns(2)
         
+        # Each text box offers the spellings already in use (typos included)
         with col1:
-            title = st.text_input("📚 Title *")
-            content_type = st.selectbox(
-                "📁 Content Type *",
-                ["Book", "Movie", "TV Show", "Anime", "Manga", "Game", "Podcast"]
-            )
-            genre = st.text_input("🎭 Genre")
-            creator = st.text_input("✍️ Creator/Author")
+            title = st.text_input("📚 Title *", key="add_title")
+            suggestion_pills("title", title)
+            content_type = st.selectbox("📁 Content Type *", CONTENT_TYPES, key="add_content_type")
+            genre = st.text_input("🎭 Genre", key="add_genre")
+            suggestion_pills("genre", genre)
+            creator = st.text_input("✍️ Creator/Author", key="add_creator")
+            suggestion_pills("creator", creator)
         
         with col2:
             release_year = st.number_input("📅 Release Year", min_value=1900, max_value=2025, value=2024)
@@ -426,7 +646,13 @@ elif page == "➕ Add New Content":
             placeholder="happy, sad, excited, inspired..."
         )
         
-        submitted = st.form_submit_button("✨ Add to Collection")
+        model = load_predictor(db)
+        if model.updates:
+            predicted = model.predict(genre, content_type, creator, rating, int(mood_before))
+            st.info(f"🔮 Predicted mood after: **{predicted:.1f}**/10 "
+                    f"({predicted - int(mood_before):+.1f}, learned from {model.updates:,} logs)")
+        
+        submitted = st.button("✨ Add to Collection")
         
         if submitted:
             if title:
@@ -449,17 +675,409 @@ elif page == "➕ Add New Content":
                     log_date=date_consumed.strftime('%Y-%m-%d')
                 )
                 
-                st.success(f"✨ {title} added successfully!")
-                st.snow()  # Falling pages effect!
-                st.markdown("✨📚☕ *Added to your collection!*")
+                # The sidebar stats changed too, so rerun the whole page
+                st.session_state["added_title"] = title
+                st.rerun()
             else:
                 st.error("Please fill in the required fields (Title)")
 
+
+@st.fragment
+def session_logger():
+    with st.expander("⏱️ Log a Session Checkpoint"):
+        st.caption("Partway through a long series? Note where you are and how you feel, as often as you like.")
+        if "logged_checkpoint" in st.session_state:
+            st.success(f"✨ Checkpoint logged for {st.session_state.pop('logged_checkpoint')}")
+        
+        # Series already in progress first, then the latest entries
+        choices = db.get_session_choices(in_progress=20, recent=50)
+        items, progress = {}, {}
+        for choice in choices:
+            content_id = choice["id"]
+            if content_id not in items:
+                label = f"{get_content_icon(choice['content_type'])} {choice['title']}"
+                # The box tells options apart by label: number repeated titles
+                items[content_id] = label if label not in items.values() else f"{label} (#{content_id})"
+                if "events" in choice:
+                    progress[content_id] = choice
+        if not items:
+            st.info("Add something first, then log your sessions with it here.")
+            return
+        
+        content_id = st.selectbox("📚 Item", list(items), format_func=items.get, key="session_item")
+        last = progress.get(content_id)
+        if last is not None:
+            where = (f"chapter {last['last_chapter']:.0f}, " if last["last_chapter"] is not None else
+                     f"episode {last['last_episode']:.0f}, " if last["last_episode"] is not None else "")
+            st.caption(f"Last checkpoint: {where}mood {last['last_mood']} {get_mood_emoji(last['last_mood'])} "
+                       f"({last['events']} so far, {last['minutes'] or 0:.0f} minutes)")
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            chapter = st.number_input("📖 Chapter", min_value=0, value=None, step=1, key="session_chapter")
+        with col2:
+            episode = st.number_input("📺 Episode", min_value=0, value=None, step=1, key="session_episode")
+        with col3:
+            minutes = st.number_input("⏱️ Minutes this session", min_value=0, value=30, step=5, key="session_minutes")
+        mood = st.slider("🎭 Mood right now", 1, 10, 6, key="session_mood")
+        
+        if st.button("⏱️ Log Checkpoint"):
+            db.add_session_events([{
+                "content_id": content_id,
+                "chapter": chapter,
+                "episode": episode,
+                "minutes": minutes,
+                "mood": mood
+            }])
+            st.session_state["logged_checkpoint"] = items[content_id]
+            st.rerun()
+
+
+@st.fragment
+def import_section():
+    with st.expander("📥 Import from Goodreads, Letterboxd or MyAnimeList"):
+        from importers import import_stream
+        
+        if "import_result" in st.session_state:
+            imported, skipped = st.session_state.pop("import_result")
+            st.success(f"✨ Imported {imported:,} entries ({skipped:,} records skipped)")
+        
+        import_sources = {
+            "Goodreads (library export CSV)": "goodreads",
+            "Letterboxd (diary/ratings CSV)": "letterboxd",
+            "MyAnimeList (anime/manga XML)": "myanimelist"
+        }
+        source_label = st.selectbox("Source", list(import_sources.keys()))
+        uploaded = st.file_uploader("Export file", type=["csv", "xml", "gz"])
+        
+        if uploaded is not None and st.button("📥 Import"):
+            progress_bar = st.progress(0.0, text="Importing...")
+            
+            def show_progress(records, imported, bytes_read, total_bytes):
+                fraction = min(bytes_read / total_bytes, 1.0) if total_bytes else 0.0
+                progress_bar.progress(fraction, text=f"{records:,} records read, {imported:,} imported")
+            
+            records, imported, skipped = import_stream(
+                db, import_sources[source_label], uploaded, uploaded.name, uploaded.size,
+                progress=show_progress
+            )
+            progress_bar.progress(1.0, text="Done!")
+            st.session_state["import_result"] = (imported, skipped)
+            st.rerun()
+
+
+def approximate_analytics(content_filter):
+    import pandas as pd
+    import plotly.express as px
+    from sketches import get_sketches
+    
+    summary = get_sketches(db).summary()
+    if not summary["content_rows"]:
+        st.info("No data yet! Start adding content to see analytics.")
+        return
+    if not content_filter.is_empty():
+        st.caption("ℹ️ Approximate mode summarizes your whole history; the sidebar filters don't apply here.")
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("📚 Entries", f"{summary['content_rows']:,}")
+    for column, label, key in ((col2, "✍️ Distinct Creators", "distinct_creators"),
+                               (col3, "🎭 Distinct Genres", "distinct_genres")):
+        with column:
+            estimate = summary[key]
+            st.metric(label, f"≈ {estimate['estimate']:,.0f}")
+            st.caption(f"± {estimate['error']:,.0f} (95%)")
+    
+    def quantile_table(rows, label):
+        return pd.DataFrame({
+            "Percentile": [f"p{row['quantile'] * 100:.0f}" for row in rows],
+            label: [row["value"] for row in rows],
+            "Rank error": ["exact" if not row["rank_error"] else f"± {row['rank_error']:.2%}" for row in rows],
+        })
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("⭐ Ratings Distribution")
+        counts, edges = summary["rating_histogram"]
+        fig = px.bar(x=edges[:-1], y=counts, color_discrete_sequence=['#A0826D'])
+        fig.update_layout(
+            plot_bgcolor='white',
+            paper_bgcolor='#FAF6F0',
+            font=dict(color='#6B5444', family='Georgia', size=12),
+            xaxis_title="Rating",
+            yaxis_title="Count",
+            bargap=0.05
+        )
+        st.plotly_chart(fig, use_container_width=True)
+        st.dataframe(quantile_table(summary["rating_quantiles"], "Rating"), hide_index=True)
+    
+    with col2:
+        st.subheader("🏷️ Top Emotional Tags")
+        top_tags = summary["top_tags"]
+        if top_tags:
+            fig = px.bar(
+                x=[count for _, count in top_tags],
+                y=[tag for tag, _ in top_tags],
+                orientation='h',
+                color_discrete_sequence=['#A0826D']
+            )
+            fig.update_layout(
+                plot_bgcolor='white',
+                paper_bgcolor='#FAF6F0',
+                font=dict(color='#6B5444', family='Georgia', size=12),
+                xaxis_title="Count (upper estimate)",
+                yaxis_title="Tag",
+                yaxis=dict(autorange="reversed")
+            )
+            st.plotly_chart(fig, use_container_width=True)
+            st.caption(f"Counts may overstate by at most {summary['tag_error']:,.1f} "
+                       f"({summary['tag_confidence']:.1%} confidence)")
+        
+        st.subheader("🎭 Mood Change")
+        st.dataframe(quantile_table(summary["mood_change_quantiles"], "Mood change"), hide_index=True)
+    
+    st.caption(f"Sketches cover {summary['content_rows']:,} entries and {summary['mood_log_rows']:,} mood logs "
+               f"in {summary['sketch_bytes'] / 1024:,.0f} KiB.")
+
+
+@st.fragment
+def pivot_explorer():
+    import plotly.express as px
+    from cube import DIMENSION_LABELS, get_cube
+    
+    st.subheader("🧊 Pivot Explorer")
+    st.caption("Answered from precomputed rollups over your whole history; the sidebar filters don't apply here.")
+    cube = get_cube(db)
+    if not cube.ready():
+        # First build, or a rebuild after edits: it runs in the background
+        st.info("🧊 Building the cube from your history... this can take a few minutes on a large database.")
+        st.button("🔄 Check again", key="pivot_check")
+        return
+    dimensions = list(DIMENSION_LABELS)
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        rows = st.selectbox("Rows", dimensions, index=0, format_func=DIMENSION_LABELS.get, key="pivot_rows")
+    with col2:
+        columns = st.selectbox("Columns", [name for name in dimensions if name != rows],
+                               format_func=DIMENSION_LABELS.get, key="pivot_columns")
+    with col3:
+        measure = st.radio("Measure", ["entries", "avg_rating", "avg_mood_change"], key="pivot_measure",
+                           format_func={"entries": "📚 Entries", "avg_rating": "⭐ Avg rating",
+                                        "avg_mood_change": "🎭 Avg mood change"}.get)
+    with col4:
+        limit = st.slider("Top values", 5, 30, 12, key="pivot_limit")
+    
+    cells = cube.pivot(rows, columns, limit=limit)
+    if cells.empty:
+        st.info("Nothing to pivot yet! Add content and mood logs first.")
+        return
+    table = cells.pivot(index="row", columns="column", values=measure)
+    table = table.rename(index=lambda value: value or "(none)", columns=lambda value: value or "(none)")
+    fig = px.imshow(
+        table,
+        text_auto=".0f" if measure == "entries" else ".1f",
+        aspect="auto",
+        color_continuous_scale=['#FAF6F0', '#D4A574', '#8B7355']
+    )
+    fig.update_layout(
+        paper_bgcolor='#FAF6F0',
+        font=dict(color='#6B5444', family='Georgia', size=12),
+        xaxis_title=DIMENSION_LABELS[columns],
+        yaxis_title=DIMENSION_LABELS[rows]
+    )
+    st.plotly_chart(fig, use_container_width=True)
+    
+    # Drill-down: one row value across any other dimension
+    col1, col2 = st.columns(2)
+    with col1:
+        value = st.selectbox(f"Drill into {DIMENSION_LABELS[rows]}", list(table.index), key="pivot_value")
+    with col2:
+        by = st.selectbox("Broken down by", [name for name in dimensions if name != rows],
+                          format_func=DIMENSION_LABELS.get, key="pivot_by")
+    breakdown = cube.drill(rows, "" if value == "(none)" else value, by, limit=limit)
+    breakdown[by] = breakdown[by].replace("", "(none)")
+    st.dataframe(
+        breakdown.rename(columns={by: DIMENSION_LABELS[by], "entries": "📚 Entries",
+                                  "avg_rating": "⭐ Avg rating", "avg_mood_change": "🎭 Avg mood change"}),
+        hide_index=True,
+        use_container_width=True
+    )
+
+
+@st.fragment
+def tags_together():
+    import pandas as pd
+    import plotly.graph_objects as go
+    
+    st.subheader("🏷️ Tags That Go Together")
+    try:
+        from taggraph import get_tag_graph
+        graph = get_tag_graph(db)
+        tag_counts = graph.tag_counts(200)
+    except ImportError:
+        st.info("Install scipy to see which of your emotional tags go together: `pip install scipy`")
+        return
+    if not tag_counts:
+        st.info("Add a few emotional tags to your mood logs to see which ones go together!")
+        return
+    st.caption("Across your whole history; the sidebar filters don't apply here.")
+    
+    nodes, edges, positions = graph.network()
+    if edges:
+        where = {tag: position for (tag, _), position in zip(nodes, positions)}
+        fig = go.Figure()
+        fig.add_trace(go.Scatter(
+            x=[value for a, b, _ in edges for value in (where[a][0], where[b][0], None)],
+            y=[value for a, b, _ in edges for value in (where[a][1], where[b][1], None)],
+            mode="lines",
+            line=dict(color='#D4A574', width=1),
+            hoverinfo="skip"
+        ))
+        fig.add_trace(go.Scatter(
+            x=positions[:, 0],
+            y=positions[:, 1],
+            mode="markers+text",
+            text=[tag for tag, _ in nodes],
+            textposition="top center",
+            hovertext=[f"{tag}: {count} logs" for tag, count in nodes],
+            hoverinfo="text",
+            marker=dict(size=[10 + 20 * (count / nodes[0][1]) ** 0.5 for _, count in nodes],
+                        color='#A0826D', line=dict(color='#6B5444', width=1))
+        ))
+        fig.update_layout(
+            plot_bgcolor='white',
+            paper_bgcolor='#FAF6F0',
+            font=dict(color='#6B5444', family='Georgia', size=12),
+            showlegend=False,
+            xaxis=dict(visible=False),
+            yaxis=dict(visible=False),
+            height=450
+        )
+        st.plotly_chart(fig, use_container_width=True)
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        carrying = dict(tag_counts)
+        tag = st.selectbox("Pick a tag", list(carrying), format_func=lambda tag: f"{tag} ({carrying[tag]})",
+                           key="related_tag")
+        related = graph.related(tag)
+        if related:
+            st.dataframe(
+                pd.DataFrame(related)[["tag", "together", "lift", "npmi"]].rename(columns={
+                    "tag": "🏷️ Goes with", "together": "Logs together", "lift": "Lift", "npmi": "NPMI"}),
+                hide_index=True,
+                use_container_width=True
+            )
+        else:
+            st.markdown(f"*Not enough logs pair **{tag}** with another tag yet.*")
+    with col2:
+        genres = graph.genres_for(tag)
+        if genres:
+            st.markdown(f"**🎭 Where you feel *{tag}***")
+            st.dataframe(
+                pd.DataFrame(genres).rename(columns={"genre": "Genre", "together": "Logs", "lift": "Lift"}),
+                hide_index=True,
+                use_container_width=True
+            )
+    st.caption("Lift is how many times more often two tags meet than chance would have it; "
+               "NPMI runs from -1 (never together) to 1 (always together).")
+
+
+@st.fragment
+def year_in_review():
+    from report import collect, render
+    
+    st.subheader("📄 Year in Review")
+    options = db.get_filter_options()
+    if not options["first_date"]:
+        return
+    years = list(range(int(options["last_date"][:4]), int(options["first_date"][:4]) - 1, -1))
+    year = st.selectbox("Year", years, key="review_year")
+    st.caption("A one-page report of your year with charts, top boosters, genres, streaks and tags. "
+               "Open it in a browser and print to save a PDF; the sidebar filters don't apply here.")
+    # Built only on request, and kept until the year or the data changes
+    key = (year, db.get_data_version())
+    if st.session_state.get("review_report", (None, None))[0] != key:
+        if not st.button("🛠️ Build report", key="review_build"):
+            return
+        with st.spinner("Building your report..."):
+            st.session_state["review_report"] = (key, render(collect(db, year)))
+    st.download_button(
+        "📥 Download report",
+        data=st.session_state["review_report"][1],
+        file_name=f"contentmood-{year}-in-review.html",
+        mime="text/html"
+    )
+
+
+# Main Content Area
+# Heavy modules are imported per page: Python caches them after the first
+# import, and the Add page never pays for pandas or plotly at all
+if page == "🏠 Dashboard":
+    st.title("📚 Welcome to Your Reading Journey")
+    
+    if not quick_stats["total_content"]:
+        st.info("👋 Start by adding your first book, show, or anime!")
+    else:
+        # Every section's queries at once
+        summary, recent, mood_df, rollups = db.fetch_many([
+            lambda: db.get_content_summary(content_filter),
+            lambda: db.get_all_content(limit=6, filters=content_filter, with_notes=True),
+            lambda: db.get_content_with_moods(filters=content_filter),
+            lambda: db.get_session_rollups(content_filter, limit=50),
+        ])
+        
+        # Top metrics
+        dashboard_metrics(summary)
+        
+        st.markdown("---")
+        
+        # Streaks and goals (whole history, not filtered)
+        habits()
+        
+        st.markdown("---")
+        
+        # Recently consumed content
+        recent_content(recent)
+        
+        st.markdown("---")
+        
+        # Mood Journey
+        mood_journey(mood_df, rollups)
+
+elif page == "➕ Add New Content":
+    st.title("➕ Add New Content")
+    st.markdown("*Log what you've been reading, watching, or experiencing*")
+    
+    add_content_form()
+    
+    st.markdown("---")
+    
+    session_logger()
+    import_section()
+
 elif page == "📊 Analytics":
+    import pandas as pd
+    import plotly.express as px
+    
     st.title("📊 Analytics")
     st.markdown("*Dive deep into your consumption patterns*")
     
-    if content_df.empty:
+    approximate = st.toggle(
+        "≈ Approximate mode",
+        value=quick_stats["total_content"] > APPROXIMATE_MODE_ROWS,
+        help="Answer from maintained sketches instead of scanning every row, with error bounds"
+    )
+    if not approximate:
+        content_df, mood_df = db.fetch_many([
+            lambda: db.get_all_content(filters=content_filter),
+            lambda: db.get_content_with_moods(filters=content_filter),
+        ])
+    
+    if approximate:
+        approximate_analytics(content_filter)
+    elif content_df.empty:
         st.info("No data yet! Start adding content to see analytics.")
     else:
         tab1, tab2, tab3 = st.tabs(["📚 Content Breakdown", "🎭 Mood Analysis", "📈 Trends"])
@@ -573,7 +1191,9 @@ elif page == "📊 Analytics":
                 st.plotly_chart(fig4, use_container_width=True)
                 
                 st.subheader("✨ Top Mood Boosters")
-                top_boosters = mood_df.nlargest(5, 'mood_change')[['title', 'content_type', 'mood_change', 'emotional_tags']]
+                top_boosters = mood_df.nlargest(5, 'mood_change')[['title', 'content_type', 'mood_change', 'mood_log_id']]
+                # Tags are only decoded for the five rows shown
+                top_boosters['emotional_tags'] = db.get_texts("mood_logs", top_boosters['mood_log_id'])
                 for _, row in top_boosters.iterrows():
                     with st.container():
                         st.markdown(f"**{get_content_icon(row['content_type'])} {row['title']}**")
@@ -616,8 +1236,25 @@ elif page == "📊 Analytics":
                 )
             )
             st.plotly_chart(fig5, use_container_width=True)
+    
+    # Both modes: the cube is maintained whatever the history size
+    st.markdown("---")
+    pivot_explorer()
 
 elif page == "💡 Insights":
+    import pandas as pd
+    from sentiment import EMOTIONS, update_scores
+    
+    # Score notes added or edited since the last visit; big backlogs (e.g. after
+    # an import) are left to `python sentiment.py`, which uses every core
+    scored_rows, _ = update_scores(db, batch_size=NOTES_SCORED_PER_RERUN, max_rows=NOTES_SCORED_PER_RERUN)
+    
+    content_df, mood_df, notes_df = db.fetch_many([
+        lambda: db.get_all_content(filters=content_filter),
+        lambda: db.get_content_with_moods(filters=content_filter, with_tags=True),
+        lambda: db.get_note_sentiment(filters=content_filter),
+    ])
+    
     st.title("💡 Personalized Insights")
     st.markdown("*What do your reading habits reveal about you?*")
     
@@ -679,14 +1316,62 @@ elif page == "💡 Insights":
             
             with col3:
                 avg_rating = content_df['rating'].mean()
-                if avg_rating >= 8:
+                if pd.isna(avg_rating):
+                    rating_text = "Silent Critic"
+                elif avg_rating >= 8:
                     rating_text = "Generous Rater"
                 elif avg_rating >= 6:
                     rating_text = "Balanced Critic"
                 else:
                     rating_text = "Tough Critic"
                 st.metric("⭐ You're a", rating_text)
-                st.markdown(f"*Avg rating: {avg_rating:.1f}/10*")
+                st.markdown(f"*Avg rating: {avg_rating:.1f}/10*" if pd.notna(avg_rating) else "*No ratings yet*")
+        
+        st.markdown("---")
+        
+        tags_together()
+        
+        st.markdown("---")
+        
+        st.subheader("📝 What Your Notes Say")
+        
+        # Only notes with sentiment words and a mood log say anything about agreement
+        felt = notes_df[(notes_df['matched_words'] > 0) & notes_df['mood_change'].notna()]
+        if felt.empty:
+            st.info("Write a few words about how things made you feel to see what your notes reveal!")
+        else:
+            directional = felt[(felt['sentiment'].abs() >= 0.05) & (felt['mood_change'] != 0)]
+            col1, col2, col3 = st.columns(3)
+            
+            with col1:
+                st.metric("💭 Notes Analyzed", len(felt))
+                st.markdown(f"*Average tone: {felt['sentiment'].mean():+.2f}*")
+            
+            with col2:
+                if not directional.empty:
+                    agreement = ((directional['sentiment'] > 0) == (directional['mood_change'] > 0)).mean()
+                    st.metric("🤝 Notes Match Mood", f"{agreement:.0%}")
+                    st.markdown("*Upbeat notes when your mood rose, and vice versa*")
+            
+            with col3:
+                if len(felt) > 2 and felt['sentiment'].nunique() > 1 and felt['mood_after'].nunique() > 1:
+                    correlation = felt['sentiment'].corr(felt['mood_after'])
+                    st.metric("📈 Tone vs Mood After", f"{correlation:+.2f}")
+                    st.markdown("*Correlation between note tone and how you felt after*")
+            
+            emotion_mix = felt[list(EMOTIONS)].mean()
+            if emotion_mix.sum() > 0:
+                st.markdown("**Emotions in your notes**")
+                st.bar_chart(emotion_mix.rename(lambda emotion: emotion.title()), color="#A0826D")
+        
+        if scored_rows >= NOTES_SCORED_PER_RERUN:
+            st.caption("More notes are waiting to be scored; run `python sentiment.py` to score them all.")
+        
+        st.markdown("---")
+        
+        year_in_review()
 
 st.markdown("---")
-st.markdown("*Made with ☕ and 📚 for book lovers everywhere*")
\ No newline at end of file
+st.markdown("*Made with ☕ and 📚 for book lovers everywhere*")
+
+RERUN_SECONDS.observe(time.perf_counter() - rerun_started, page=page)
\ No newline at end of file
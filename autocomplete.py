@@ -0,0 +1,384 @@
+"""Typo-tolerant suggestions for the Add form's title, creator and genre
+
+    python autocomplete.py --db contentmood.db title "harry pott"
+
+Each field keeps its distinct values (case and spacing folded) in memory:
+a sorted list for prefix matches, with the most used completions of prefixes up
+to three letters kept ready, and a trigram index for near misses
+("hary poter"). Values are ranked by how many entries use them. The index
+catches up with new entries the way the sketches do: rows past the last
+indexed id are added when the data version moves, and an in-place update or
+delete (the content_rewrites counter) rebuilds it. The app catches small
+deltas up while the form renders; the first build, rebuilds and big deltas
+run in a background thread while lookups keep reading the index as it was.
+"""
+import argparse
+import sqlite3
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+import numpy as np
+
+from incremental import PerDatabase, read_meta, rewrite_counts, rewritten
+
+FIELDS = ("title", "creator", "genre")
+SUGGESTIONS = 8
+INDEX_CHUNK_ROWS = 200000
+# Batches this large are indexed in one pass rather than value by value
+BULK_VALUES = 1000
+# Prefixes this short match too many values to rank on the fly
+SHORT_PREFIX = 3
+# Longer prefixes rank at most this many matches (in key order)
+PREFIX_SCAN = 50000
+# Catch-ups up to this many new rows are indexed while the form renders;
+# bigger ones, and rebuilds, run in the background
+INLINE_SYNC_ROWS = 20000
+# Near misses are looked up in at most this many trigram postings entries;
+# the FUZZY_CANDIDATES likeliest are ranked by similarity, until FUZZY_SECONDS
+# after the lookup began
+FUZZY_BUDGET = 60000
+FUZZY_CANDIDATES = 100
+FUZZY_SECONDS = 0.003
+FUZZY_MIN_SIMILARITY = 0.3
+
+
+def normalize(value):
+    """Key a value is matched on: case-folded, inner whitespace collapsed"""
+    return " ".join(str(value).split()).casefold()
+
+
+def _trigrams(key):
+    """Trigrams of key (padded so starts count more), each packed into an int:
+    three 21-bit code points"""
+    points = [0, 0, *map(ord, key), 0]
+    return {(points[i] << 42) | (points[i + 1] << 21) | points[i + 2] for i in range(len(points) - 2)}
+
+
+class FieldIndex:
+    """Distinct values of one field, searchable by prefix and by trigrams"""
+
+    def __init__(self):
+        self.keys = []
+        self.values = []
+        self.counts = array("i")
+        # Number of distinct trigrams of each key
+        self.sizes = array("i")
+        self.ids = {}
+        self.ordered = []
+        # Value id of each entry in ordered
+        self.ordered_ids = np.empty(0, dtype=np.int32)
+        self.short = {}
+        self.postings = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def extend(self, values):
+        """Count one more use of each value; returns their ids (None for blanks)"""
+        if len(values) < BULK_VALUES:
+            return [self.add(value) if value is not None else None for value in values]
+        values = [" ".join(str(value).split()) if value is not None else "" for value in values]
+        keys = [value.casefold() or None for value in values]
+        uses = Counter(keys)
+        uses.pop(None, None)
+        # First spelling of each key (reversed, so the first one is written last)
+        spellings = dict(zip(reversed(keys), reversed(values)))
+        new_keys = [key for key in uses if key not in self.ids]
+        first_id = len(self.keys)
+        self.keys.extend(new_keys)
+        self.values.extend([spellings[key] for key in new_keys])
+        self.ids.update(zip(new_keys, range(first_id, first_id + len(new_keys))))
+        self.counts.extend([0] * len(new_keys))
+        counts = np.frombuffer(self.counts, dtype=np.int32)
+        counts[np.fromiter(map(self.ids.__getitem__, uses), dtype=np.int64, count=len(uses))] += \
+            np.fromiter(uses.values(), dtype=np.int32, count=len(uses))
+        del counts
+        self._index_trigrams(new_keys, first_id)
+        order = sorted(range(len(self.keys)), key=self.keys.__getitem__)
+        self.ordered = [self.keys[value_id] for value_id in order]
+        self.ordered_ids = np.array(order, dtype=np.int32)
+        self._rank_all_short()
+        return [None if key is None else self.ids[key] for key in keys]
+
+    def _index_trigrams(self, keys, first_id):
+        """_trigrams() of every key at once, appended to the postings"""
+        if not len(keys):
+            return
+        padded = [f"\0\0{key}\0" for key in keys]
+        points = np.frombuffer("".join(padded).encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+        lengths = np.fromiter(map(len, padded), dtype=np.int64, count=len(padded))
+        ends = np.cumsum(lengths)
+        # Trigram starting at each position that has two more characters of its own key
+        owners = np.repeat(np.arange(len(padded)), lengths)
+        valid = np.arange(len(points)) < (ends[owners] - 2)
+        positions = np.flatnonzero(valid)
+        codes = (points[positions] << 42) | (points[positions + 1] << 21) | points[positions + 2]
+        owners = owners[positions] + first_id
+        # Each key once per trigram, ids ascending within each posting
+        order = np.lexsort((owners, codes))
+        codes, owners = codes[order], owners[order].astype(np.int32)
+        keep = np.r_[True, (codes[1:] != codes[:-1]) | (owners[1:] != owners[:-1])]
+        codes, owners = codes[keep], owners[keep]
+        self.sizes.extend(np.bincount(owners - first_id, minlength=len(keys)).astype(np.int32).tolist())
+        boundaries = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        for code, group in zip(codes[boundaries].tolist(), np.split(owners, boundaries[1:])):
+            posting = self.postings.get(code)
+            if posting is None:
+                posting = self.postings[code] = array("i")
+            posting.frombytes(group.tobytes())
+
+    def _rank_all_short(self):
+        self.short = {}
+        keys = self.keys
+        for value_id in np.argsort(-np.frombuffer(self.counts, dtype=np.int32), kind="stable").tolist():
+            key = keys[value_id]
+            for length in range(1, min(SHORT_PREFIX, len(key)) + 1):
+                top = self.short.setdefault(key[:length], [])
+                if len(top) < SUGGESTIONS:
+                    top.append(value_id)
+
+    def add(self, value):
+        """Count one more use of value; returns its id"""
+        key = normalize(value)
+        if not key:
+            return None
+        value_id = self.ids.get(key)
+        if value_id is None:
+            value_id = self.ids[key] = len(self.keys)
+            self.keys.append(key)
+            self.values.append(" ".join(str(value).split()))
+            self.counts.append(0)
+            position = bisect_left(self.ordered, key)
+            self.ordered.insert(position, key)
+            self.ordered_ids = np.insert(self.ordered_ids, position, value_id)
+            trigrams = _trigrams(key)
+            self.sizes.append(len(trigrams))
+            for trigram in trigrams:
+                posting = self.postings.get(trigram)
+                if posting is None:
+                    posting = self.postings[trigram] = array("i")
+                posting.append(value_id)
+        self.counts[value_id] += 1
+        for length in range(1, min(SHORT_PREFIX, len(key)) + 1):
+            self._rank_short(key[:length], value_id)
+        return value_id
+
+    def _rank_short(self, prefix, value_id):
+        top = self.short.setdefault(prefix, [])
+        if value_id not in top:
+            if len(top) >= SUGGESTIONS and self.counts[top[-1]] >= self.counts[value_id]:
+                return
+            top.append(value_id)
+        top.sort(key=lambda other: -self.counts[other])
+        del top[SUGGESTIONS:]
+
+    def prefix(self, key, limit):
+        if len(key) <= SHORT_PREFIX:
+            return self.short.get(key, [])[:limit]
+        start = bisect_left(self.ordered, key)
+        end = min(bisect_left(self.ordered, key + "\U0010ffff", start), start + PREFIX_SCAN)
+        matches = self.ordered_ids[start:end]
+        uses = np.frombuffer(self.counts, dtype=np.int32)[matches]
+        if len(matches) > limit:
+            best = np.argpartition(-uses, limit)[:limit]
+            matches, uses = matches[best], uses[best]
+        return matches[np.argsort(-uses, kind="stable")].tolist()
+
+    def fuzzy(self, key, limit):
+        """Values sharing the most trigrams with key, most similar first
+
+        Only key's rarest trigrams are looked up, up to FUZZY_BUDGET ids in
+        all: a near miss keeps most of them whichever they are. Candidates
+        are ranked by the similarity that overlap implies, and the best
+        FUZZY_CANDIDATES are compared on all their trigrams, likeliest first,
+        for as long as FUZZY_SECONDS allows.
+        """
+        deadline = time.perf_counter() + FUZZY_SECONDS
+        query = _trigrams(key)
+        postings = sorted((self.postings[trigram] for trigram in query if trigram in self.postings), key=len)
+        taken, size = [], 0
+        for posting in postings:
+            if taken and size + len(posting) > FUZZY_BUDGET:
+                break
+            taken.append(np.frombuffer(posting, dtype=np.int32))
+            size += len(posting)
+        if not taken:
+            return []
+        candidates, shared = np.unique(np.concatenate(taken), return_counts=True)
+        del taken
+        sizes = np.frombuffer(self.sizes, dtype=np.int32)[candidates]
+        estimate = shared / (len(query) + sizes - shared)
+        if len(candidates) > FUZZY_CANDIDATES:
+            likeliest = np.argpartition(-estimate, FUZZY_CANDIDATES)[:FUZZY_CANDIDATES]
+            candidates, estimate = candidates[likeliest], estimate[likeliest]
+        scored = []
+        for value_id in candidates[np.argsort(-estimate, kind="stable")].tolist():
+            if scored and time.perf_counter() > deadline:
+                break
+            overlap = len(query & _trigrams(self.keys[value_id]))
+            similarity = overlap / (len(query) + self.sizes[value_id] - overlap)
+            if similarity >= FUZZY_MIN_SIMILARITY:
+                scored.append((-similarity, -self.counts[value_id], value_id))
+        return [value_id for _, _, value_id in sorted(scored)[:limit]]
+
+    def suggest(self, text, limit=SUGGESTIONS):
+        """Up to limit (value, uses) pairs: prefix matches first, then near misses"""
+        key = normalize(text)
+        if not key:
+            return []
+        found = self.prefix(key, limit)
+        if len(found) < limit and len(key) >= 3:
+            found += [value_id for value_id in self.fuzzy(key, limit) if value_id not in found]
+        return [(self.values[value_id], self.counts[value_id]) for value_id in found[:limit]]
+
+
+class Suggester:
+    """FieldIndex for each of FIELDS over one database, caught up by sync()
+    or ready()
+
+    Lookups only read the index: call ready() once per rerun, not per lookup.
+    Reads the live file over a connection of its own, kept open: a check per
+    rerun can't afford opening one (and parsing the schema) each time.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+        self._conn = None
+        self._builder = None
+        self._builder_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.fields = {field: FieldIndex() for field in FIELDS}
+        # Newest entry per title, for autofill
+        self.latest = array("i")
+        self.meta = {"content_through": 0, "content_rewrites": None, "data_version": None}
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db.db_name, check_same_thread=False)
+        return self._conn
+
+    def _sync(self):
+        conn = self._connection()
+        meta = read_meta(conn)
+        if self.meta["data_version"] == meta.get("data_version"):
+            return False
+        if rewritten(self.meta, meta, ("content",)):
+            self._reset()
+        rows = conn.execute("SELECT id, title, creator, genre FROM content WHERE id > ? ORDER BY id",
+                            (self.meta["content_through"],))
+        added = False
+        while chunk := rows.fetchmany(INDEX_CHUNK_ROWS):
+            content_ids, titles, creators, genres = zip(*chunk)
+            self.fields["creator"].extend(creators)
+            self.fields["genre"].extend(genres)
+            title_ids = self.fields["title"].extend(titles)
+            self.latest.extend([0] * (len(self.fields["title"]) - len(self.latest)))
+            for title_id, content_id in zip(title_ids, content_ids):
+                if title_id is not None:
+                    self.latest[title_id] = content_id
+            self.meta["content_through"] = content_ids[-1]
+            added = True
+        self.meta.update(data_version=meta.get("data_version"), **rewrite_counts(meta, ("content",)))
+        return added
+
+    def sync(self):
+        """Index entries added since the last sync; True if any were added"""
+        with self._lock:
+            return self._sync()
+
+    def _pending_rows(self):
+        """How many rows a sync would index (every row, for a first build or a rebuild)"""
+        conn = self._connection()
+        meta = read_meta(conn)
+        if self.meta["data_version"] == meta.get("data_version"):
+            return 0
+        rebuild = self.meta["data_version"] is None or rewritten(self.meta, meta, ("content",))
+        return max(0, conn.execute("SELECT COALESCE(MAX(id), 0) FROM content").fetchone()[0]
+                   - (0 if rebuild else self.meta["content_through"]))
+
+    def building(self):
+        """True while a background build is running"""
+        return self._builder is not None and self._builder.is_alive()
+
+    def ready(self):
+        """Catch the index up if that is quick and return True; otherwise start
+        a background build (unless one is running) and return False, lookups
+        reading the index as it was until the new one replaces it"""
+        if self.building():
+            return False
+        with self._lock:
+            if self._pending_rows() <= INLINE_SYNC_ROWS:
+                self._sync()
+                return True
+        with self._builder_lock:
+            if not self.building():
+                self._builder = threading.Thread(target=self._rebuild, name="suggest-build", daemon=True)
+                self._builder.start()
+        return False
+
+    def _rebuild(self):
+        fresh = Suggester(self.db)
+        try:
+            fresh.sync()
+        finally:
+            if fresh._conn is not None:
+                fresh._conn.close()
+        with self._lock:
+            self.fields, self.latest, self.meta = fresh.fields, fresh.latest, fresh.meta
+
+    def suggest(self, field, text, limit=SUGGESTIONS):
+        """Up to limit (value, uses) pairs of field for what has been typed so far"""
+        with self._lock:
+            return self.fields[field].suggest(text, limit)
+
+    def usual(self, title):
+        """content_type, genre and creator of the newest entry with this title,
+        as a dict, or None for a title not logged before"""
+        with self._lock:
+            title_id = self.fields["title"].ids.get(normalize(title))
+            if title_id is None:
+                return None
+            row = self._connection().execute("SELECT content_type, genre, creator FROM content WHERE id = ?",
+                                             (self.latest[title_id],)).fetchone()
+        return dict(zip(("content_type", "genre", "creator"), row)) if row else None
+
+
+_instances = PerDatabase(Suggester)
+
+
+def get_suggester(db):
+    """The shared Suggester for db's file"""
+    return _instances.get(db)
+
+
+def main():
+    from database import ContentDatabase
+
+    parser = argparse.ArgumentParser(description="Try the Add form's suggestions")
+    parser.add_argument("--db", default="contentmood.db")
+    parser.add_argument("field", choices=FIELDS)
+    parser.add_argument("text")
+    args = parser.parse_args()
+
+    suggester = get_suggester(ContentDatabase(args.db, cache_bytes=0))
+    started = time.perf_counter()
+    suggester.sync()
+    print(f"📇 Indexed {len(suggester.fields[args.field]):,} {args.field}s in {time.perf_counter() - started:.2f}s")
+    started = time.perf_counter()
+    suggestions = suggester.suggest(args.field, args.text)
+    elapsed = (time.perf_counter() - started) * 1000
+    for value, uses in suggestions:
+        print(f"  {value}  ({uses})")
+    print(f"⏱️ {elapsed:.2f} ms")
+    if args.field == "title" and suggestions:
+        print(f"✨ Usual for {suggestions[0][0]!r}: {suggester.usual(suggestions[0][0])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Storage backends that answer ContentDatabase's read queries
+
+SQLite stays the system of record: every write lands there, with its triggers
+and snapshots. An analytic backend only decides where the read queries behind
+get_all_content, get_content_with_moods, get_genre_stats and friends run.
+"""
+import os
+import threading
+
+# Columns mirrored into columnar engines, with their portable types. Notes and
+# emotional tags stay in SQLite (compressed, see textstore.py) and are attached
+# to results by ContentDatabase only where a view shows them.
+MIRRORED_TABLES = {
+    "content": (
+        ("id", "BIGINT"), ("title", "VARCHAR"), ("content_type", "VARCHAR"), ("genre", "VARCHAR"),
+        ("creator", "VARCHAR"), ("release_year", "BIGINT"), ("date_consumed", "VARCHAR"),
+        ("rating", "DOUBLE"), ("created_at", "VARCHAR"),
+    ),
+    "mood_logs": (
+        ("id", "BIGINT"), ("content_id", "BIGINT"), ("mood_before", "BIGINT"), ("mood_after", "BIGINT"),
+        ("log_date", "VARCHAR"), ("created_at", "VARCHAR"),
+    ),
+}
+# Bumped when MIRRORED_TABLES changes so existing mirrors are rebuilt
+MIRROR_LAYOUT = 2
+
+# Rows copied per round trip when (re)loading a mirror
+MIRROR_CHUNK_ROWS = 100000
+
+
+class StorageBackend:
+    """Engine that runs ContentDatabase read queries and returns DataFrames"""
+    name = None
+
+    def read_frame(self, query, params=()):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SQLiteBackend(StorageBackend):
+    """Run reads directly on the SQLite database (pool, snapshot and session aware)"""
+    name = "sqlite"
+
+    def __init__(self, db):
+        self.db = db
+
+    def read_frame(self, query, params=()):
+        import pandas as pd
+        with self.db._reader() as conn:
+            return pd.read_sql_query(query, conn, params=params)
+
+
+class DuckDBBackend(StorageBackend):
+    """Run reads on a DuckDB mirror of content and mood_logs
+
+    The mirror lives in a local file next to the SQLite database and is brought
+    up to date lazily, keyed on the data version: appends are copied by id,
+    while any UPDATE or DELETE since the last sync reloads that table.
+    """
+    name = "duckdb"
+
+    def __init__(self, db, path=None):
+        try:
+            import duckdb
+        except ImportError as exc:
+            raise ImportError("The DuckDB backend needs the duckdb package: pip install duckdb") from exc
+        self.db = db
+        self.path = path or f"{os.path.splitext(db.db_name)[0]}.duckdb"
+        try:
+            self.conn = duckdb.connect(self.path)
+        except duckdb.IOException:
+            # Another process holds the file lock; keep a private in-memory mirror
+            self.conn = duckdb.connect(":memory:")
+        self._lock = threading.Lock()
+        self.conn.execute("CREATE TABLE IF NOT EXISTS mirror_meta (key VARCHAR PRIMARY KEY, value BIGINT)")
+
+    def _mirrored(self, key):
+        row = self.conn.execute("SELECT value FROM mirror_meta WHERE key = ?", [key]).fetchone()
+        return row[0] if row else None
+
+    def _set_mirrored(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO mirror_meta VALUES (?, ?)", [key, value])
+
+    def sync(self):
+        """Bring the mirror up to the primary's data version"""
+        with self.db._reader() as source:
+            meta = dict(source.execute("SELECT key, value FROM db_meta").fetchall())
+            with self._lock:
+                current_layout = self._mirrored("layout") == MIRROR_LAYOUT
+                if current_layout and self._mirrored("data_version") == meta.get("data_version"):
+                    return False
+                # One transaction: readers on other cursors keep seeing the last
+                # complete mirror, never a table emptied by a reload
+                self.conn.execute("BEGIN TRANSACTION")
+                try:
+                    self._copy(source, meta, current_layout)
+                except Exception:
+                    self.conn.execute("ROLLBACK")
+                    raise
+                self.conn.execute("COMMIT")
+        return True
+
+    def _copy(self, source, meta, current_layout):
+        """Append new rows to each mirrored table, or reload it after a rewrite"""
+        import pandas as pd
+        for table, columns in MIRRORED_TABLES.items():
+            names = ", ".join(name for name, _ in columns)
+            rewrites = meta.get(f"{table}_rewrites", 0)
+            if not current_layout or self._mirrored(f"{table}_rewrites") != rewrites:
+                ddl = ", ".join(f"{name} {kind}" for name, kind in columns)
+                self.conn.execute(f"CREATE OR REPLACE TABLE {table} ({ddl})")
+                last_id = 0
+            else:
+                last_id = self.conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+            chunks = pd.read_sql_query(
+                f"SELECT {names} FROM {table} WHERE id > ? ORDER BY id", source,
+                params=(last_id,), chunksize=MIRROR_CHUNK_ROWS,
+            )
+            for chunk in chunks:
+                self.conn.register("incoming", chunk)
+                self.conn.execute(f"INSERT INTO {table} SELECT {names} FROM incoming")
+                self.conn.unregister("incoming")
+            self._set_mirrored(f"{table}_rewrites", rewrites)
+        self._set_mirrored("data_version", meta.get("data_version"))
+        self._set_mirrored("layout", MIRROR_LAYOUT)
+
+    def read_frame(self, query, params=()):
+        self.sync()
+        # SQLite's LIKE ignores ASCII case; DuckDB's ILIKE is the equivalent
+        query = query.replace(" LIKE ", " ILIKE ")
+        cursor = self.conn.cursor()
+        try:
+            return cursor.execute(query, list(params)).df()
+        finally:
+            cursor.close()
+
+    def close(self):
+        self.conn.close()
+
+
+BACKENDS = {"sqlite": SQLiteBackend, "duckdb": DuckDBBackend}
+
+# Analytic backends are shared per database file within a process
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def get_backend(db, name="sqlite"):
+    """Backend instance for db; non-SQLite engines are shared per database file"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown storage backend: {name}")
+    if name == "sqlite":
+        return SQLiteBackend(db)
+    key = (name, os.path.abspath(db.db_name))
+    with _instances_lock:
+        if key not in _instances:
+            _instances[key] = BACKENDS[name](db)
+        return _instances[key]
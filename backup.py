@@ -0,0 +1,384 @@
+"""Online backups of a ContentMood database
+
+    python backup.py --db contentmood.db create                 # back up now
+    python backup.py --db contentmood.db list                   # kept backups, newest first
+    python backup.py --db contentmood.db verify [--deep] [NAME] # check one, or every kept backup
+    python backup.py --db contentmood.db restore NAME           # put a backup back (stop the app first)
+
+A backup is taken with the SQLite online backup API while the app keeps
+running, a few hundred pages per step, pausing between steps. The database
+is switched to WAL first (as snapshot read mode does), so the copy reads one
+pinned snapshot and writers never wait on it. Where WAL is not available
+each step holds a shared lock only for its own pages; a write between steps
+restarts the copy, and after MAX_RESTARTS the backup gives up with
+BackupError, to be retried later, rather than lock writers out for the
+whole file.
+
+Each copy gets a full integrity_check before it is compressed (zstd when the
+zstandard package is installed, gzip otherwise) into backups/ next to the
+database. A JSON manifest alongside records its SHA-256, source data_version
+and timings. Only the newest KEEP_BACKUPS are kept. The maintenance scheduler
+(see maintenance.py) runs create_backup every backup_interval seconds when
+the data changed since the newest backup.
+"""
+import argparse
+import glob
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+KEEP_BACKUPS = 7
+# Pages copied per backup step (4 MiB at the default 4096-byte page)
+BACKUP_PAGES = 1024
+# Pause after each step, as a share of the time the step took
+BACKUP_PAUSE_SHARE = 1.0
+# Without WAL only: restarts tolerated before giving up until the next attempt
+MAX_RESTARTS = 3
+ZSTD_LEVEL = 3
+GZIP_LEVEL = 6
+CHUNK_BYTES = 1024 * 1024
+# Files rebuilt from the database, which would be out of step with a restored one
+DERIVED_SUFFIXES = (".sketches.npz", ".taggraph.npz", ".duckdb", ".duckdb.wal")
+
+
+class BackupError(Exception):
+    """A backup could not be taken, verified or restored"""
+
+
+def default_directory(db_name):
+    return os.path.join(os.path.dirname(os.path.abspath(db_name)), "backups")
+
+
+def _prefix(db_name):
+    return os.path.splitext(os.path.basename(db_name))[0]
+
+
+class _Throttle:
+    """backup() progress callback: pauses between steps and counts restarts"""
+
+    def __init__(self, pause_share, max_restarts):
+        self.pause_share = pause_share
+        self.max_restarts = max_restarts
+        self.restarts = 0
+        self.steps = 0
+        self.longest_step = 0.0
+        self._remaining = None
+        self._mark = time.perf_counter()
+
+    def __call__(self, status, remaining, total):
+        step = time.perf_counter() - self._mark
+        self.steps += 1
+        self.longest_step = max(self.longest_step, step)
+        if self._remaining is not None and remaining > self._remaining:
+            self.restarts += 1
+            if self.restarts > self.max_restarts:
+                raise _Restarting()
+        self._remaining = remaining
+        if remaining:
+            time.sleep(step * self.pause_share)
+        self._mark = time.perf_counter()
+
+
+class _Restarting(Exception):
+    """Writers keep restarting a stepped copy"""
+
+
+def _copy(db_name, path, pages, pause_share, max_restarts):
+    """Back db_name up into a plain SQLite file at path; returns the throttle's counters"""
+    source = sqlite3.connect(db_name, isolation_level=None)
+    target = sqlite3.connect(path)
+    throttle = _Throttle(pause_share, max_restarts)
+    switched = False
+    try:
+        wal = source.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        if not wal:
+            try:
+                wal = switched = source.execute("PRAGMA journal_mode=WAL").fetchone()[0] == "wal"
+            except sqlite3.OperationalError:
+                # Another connection is mid-transaction; copy with the journal as it is
+                pass
+        if wal:
+            # One snapshot for the whole copy: writers carry on in the WAL and
+            # the copy never restarts
+            source.execute("BEGIN")
+            source.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+        try:
+            source.backup(target, pages=pages, progress=throttle)
+        except _Restarting:
+            raise BackupError(f"writers restarted the copy {throttle.restarts} times; try again later")
+        if wal:
+            source.execute("COMMIT")
+        # A copy of a WAL database would still want a -wal file next to it
+        target.execute("PRAGMA journal_mode=DELETE")
+        integrity = [row[0] for row in target.execute("PRAGMA integrity_check").fetchall()]
+        if integrity != ["ok"]:
+            raise BackupError(f"integrity check failed: {'; '.join(integrity[:5])}")
+        try:
+            data_version = target.execute("SELECT value FROM db_meta WHERE key = 'data_version'").fetchone()
+        except sqlite3.OperationalError:
+            # Never opened by ContentDatabase, so no db_meta yet
+            data_version = None
+        page_size = target.execute("PRAGMA page_size").fetchone()[0]
+        page_count = target.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        target.close()
+        source.close()
+    return {"data_version": data_version[0] if data_version else 0, "page_size": page_size, "pages": page_count,
+            "steps": throttle.steps, "restarts": throttle.restarts, "switched_to_wal": switched,
+            "longest_step_ms": round(throttle.longest_step * 1000, 2)}
+
+
+def _compress(path, target, codec):
+    """Compress path into target with codec ("zst" or "gz"); returns the SHA-256 of what was written"""
+    digest = hashlib.sha256()
+
+    class Hashing:
+        def __init__(self, file):
+            self.file = file
+
+        def write(self, data):
+            digest.update(data)
+            return self.file.write(data)
+
+        def flush(self):
+            self.file.flush()
+
+    with open(path, "rb") as source, open(target, "wb") as raw:
+        output = Hashing(raw)
+        if codec == "zst":
+            with zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(output, closefd=False) as writer:
+                shutil.copyfileobj(source, writer, CHUNK_BYTES)
+        else:
+            with gzip.GzipFile(fileobj=output, mode="wb", compresslevel=GZIP_LEVEL, mtime=0) as writer:
+                shutil.copyfileobj(source, writer, CHUNK_BYTES)
+    return digest.hexdigest()
+
+
+def _decompress(path, target):
+    with open(path, "rb") as source, open(target, "wb") as output:
+        if path.endswith(".zst"):
+            if zstandard is None:
+                raise ImportError("Restoring a .zst backup needs zstandard: pip install zstandard")
+            with zstandard.ZstdDecompressor().stream_reader(source) as reader:
+                shutil.copyfileobj(reader, output, CHUNK_BYTES)
+        else:
+            with gzip.GzipFile(fileobj=source, mode="rb") as reader:
+                shutil.copyfileobj(reader, output, CHUNK_BYTES)
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(CHUNK_BYTES):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def create_backup(db_name, directory=None, keep=KEEP_BACKUPS, pages=BACKUP_PAGES,
+                  pause_share=BACKUP_PAUSE_SHARE, max_restarts=MAX_RESTARTS):
+    """Take a verified, compressed backup of db_name; returns its manifest"""
+    directory = directory or default_directory(db_name)
+    os.makedirs(directory, exist_ok=True)
+    started = time.perf_counter()
+    created = datetime.now()
+    extension = ".db.zst" if zstandard is not None else ".db.gz"
+    path = os.path.join(directory, f"{_prefix(db_name)}-{created:%Y%m%d-%H%M%S-%f}{extension}")
+    copy_path = f"{path}.{os.getpid()}.copy"
+    packed_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        manifest = _copy(db_name, copy_path, pages, pause_share, max_restarts)
+        copied = time.perf_counter()
+        manifest.update(bytes=os.path.getsize(copy_path), sha256=_compress(copy_path, packed_path, path.rsplit(".", 1)[1]))
+        manifest.update(compressed_bytes=os.path.getsize(packed_path), source=os.path.abspath(db_name),
+                        created_at=created.isoformat(timespec="seconds"), integrity="ok",
+                        copy_seconds=round(copied - started, 3),
+                        seconds=round(time.perf_counter() - started, 3))
+        os.replace(packed_path, path)
+        _write_manifest(path, manifest)
+    finally:
+        for leftover in (copy_path, packed_path):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    rotate(db_name, directory, keep)
+    return dict(manifest, path=path)
+
+
+def _write_manifest(path, manifest):
+    tmp_path = f"{path}.json.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(tmp_path, f"{path}.json")
+
+
+def list_backups(db_name, directory=None):
+    """Manifests (with path) of db_name's backups, newest first"""
+    directory = directory or default_directory(db_name)
+    backups = []
+    for manifest_path in glob.glob(os.path.join(glob.escape(directory), f"{glob.escape(_prefix(db_name))}-*.db.*.json")):
+        path = manifest_path[:-len(".json")]
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(manifest_path) as file:
+                backups.append(dict(json.load(file), path=path))
+        except ValueError:
+            continue
+    return sorted(backups, key=lambda manifest: manifest["path"], reverse=True)
+
+
+def rotate(db_name, directory=None, keep=KEEP_BACKUPS):
+    """Delete all but the newest keep backups; returns the deleted paths"""
+    removed = []
+    for manifest in list_backups(db_name, directory)[keep:]:
+        for path in (manifest["path"], f"{manifest['path']}.json"):
+            if os.path.exists(path):
+                os.remove(path)
+        removed.append(manifest["path"])
+    return removed
+
+
+def _manifest(path):
+    try:
+        with open(f"{path}.json") as file:
+            return json.load(file)
+    except (OSError, ValueError) as exc:
+        raise BackupError(f"no readable manifest for {os.path.basename(path)}: {exc}")
+
+
+def verify_backup(path, deep=False):
+    """Check a backup against its manifest's checksum; deep also decompresses
+    it and runs integrity_check. Returns a short description, raises BackupError"""
+    manifest = _manifest(path)
+    if _sha256(path) != manifest["sha256"]:
+        raise BackupError(f"{os.path.basename(path)} does not match its checksum")
+    if not deep:
+        return "checksum ok"
+    copy_path = f"{path}.{os.getpid()}.verify"
+    try:
+        _decompress(path, copy_path)
+        conn = sqlite3.connect(f"file:{copy_path}?mode=ro", uri=True)
+        try:
+            integrity = [row[0] for row in conn.execute("PRAGMA integrity_check").fetchall()]
+        finally:
+            conn.close()
+    finally:
+        if os.path.exists(copy_path):
+            os.remove(copy_path)
+    if integrity != ["ok"]:
+        raise BackupError(f"{os.path.basename(path)} fails integrity_check: {'; '.join(integrity[:5])}")
+    return "checksum and integrity_check ok"
+
+
+def restore_backup(path, db_name):
+    """Replace db_name with a backup; returns where the replaced file was moved
+
+    The backup is checked against its checksum, decompressed next to db_name
+    and renamed over it, so the database is never half written. The current
+    file (and its -wal and -shm) moves aside to db_name.pre-restore. Files
+    derived from the database (sketches, tag graph, DuckDB mirror, snapshot,
+    shared result cache) are deleted and rebuild on next use. The restored
+    file gets a new sync identity: its change log is rewound, and peers have
+    already seen the old identity's later seqs. Stop the app and API first:
+    their in-memory caches still describe the old file.
+    """
+    from database import ContentDatabase
+
+    verify_backup(path)
+    tmp_path = f"{db_name}.restore-{os.getpid()}.tmp"
+    try:
+        _decompress(path, tmp_path)
+        aside = f"{db_name}.pre-restore"
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(aside + suffix):
+                os.remove(aside + suffix)
+            if os.path.exists(db_name + suffix):
+                os.replace(db_name + suffix, aside + suffix)
+        os.replace(tmp_path, db_name)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    base = os.path.splitext(db_name)[0]
+    for derived in [f"{base}{suffix}" for suffix in DERIVED_SUFFIXES] + [f"{db_name}.snapshot"]:
+        if os.path.exists(derived):
+            os.remove(derived)
+    # Results cached per data version, which the restored file may repeat
+    shutil.rmtree(f"{db_name}.cache", ignore_errors=True)
+    ContentDatabase(db_name, cache_bytes=0).reset_device_id()
+    return aside if os.path.exists(aside) else None
+
+
+def _find(db_name, directory, name):
+    """Path of the backup called name (or ending in it), newest first"""
+    for manifest in list_backups(db_name, directory):
+        if os.path.basename(manifest["path"]) == name or manifest["path"].endswith(name):
+            return manifest["path"]
+    if os.path.exists(name):
+        return name
+    raise BackupError(f"no backup called {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Online backups of a ContentMood database")
+    parser.add_argument("--db", default="contentmood.db")
+    parser.add_argument("--dir", help="backup directory (default: backups/ next to the database)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    create_parser = subparsers.add_parser("create", help="back up now")
+    create_parser.add_argument("--keep", type=int, default=KEEP_BACKUPS)
+    create_parser.add_argument("--pages", type=int, default=BACKUP_PAGES, help="pages copied per step")
+    subparsers.add_parser("list", help="kept backups, newest first")
+    verify_parser = subparsers.add_parser("verify", help="check backups against their checksums")
+    verify_parser.add_argument("name", nargs="?")
+    verify_parser.add_argument("--deep", action="store_true", help="also decompress and run integrity_check")
+    restore_parser = subparsers.add_parser("restore", help="replace the database with a backup")
+    restore_parser.add_argument("name")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "create":
+            manifest = create_backup(args.db, args.dir, args.keep, args.pages)
+            print(f"💾 {os.path.basename(manifest['path'])}: {manifest['bytes'] / 2**20:,.1f} MiB → "
+                  f"{manifest['compressed_bytes'] / 2**20:,.1f} MiB in {manifest['seconds']:.1f}s "
+                  f"({manifest['steps']} steps, {manifest['restarts']} restarts, "
+                  f"longest {manifest['longest_step_ms']:.1f} ms), integrity ok")
+        elif args.command == "list":
+            backups = list_backups(args.db, args.dir)
+            for manifest in backups:
+                print(f"💾 {os.path.basename(manifest['path'])}  {manifest['created_at']}  "
+                      f"{manifest['compressed_bytes'] / 2**20:8.1f} MiB  data version {manifest['data_version']}")
+            if not backups:
+                print("No backups yet")
+        elif args.command == "verify":
+            paths = ([_find(args.db, args.dir, args.name)] if args.name
+                     else [manifest["path"] for manifest in list_backups(args.db, args.dir)])
+            failed = 0
+            for path in paths:
+                try:
+                    print(f"✅ {os.path.basename(path)}: {verify_backup(path, args.deep)}")
+                except BackupError as exc:
+                    failed += 1
+                    print(f"❌ {exc}")
+            if failed:
+                raise SystemExit(1)
+        else:
+            path = _find(args.db, args.dir, args.name)
+            started = time.perf_counter()
+            aside = restore_backup(path, args.db)
+            print(f"♻️ Restored {os.path.basename(path)} in {time.perf_counter() - started:.1f}s"
+                  + (f"; the previous file is at {aside}" if aside else ""))
+    except BackupError as exc:
+        print(f"❌ {exc}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
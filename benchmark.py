@@ -0,0 +1,1258 @@
+"""Performance benchmarks for ContentMood Analytics
+
+Run from the repository root, e.g.:
+
+    python benchmark.py startup
+    python benchmark.py api --rows 100000
+    python benchmark.py backends --rows 1000000
+    python benchmark.py fragments --rows 100000
+    python benchmark.py sentiment --rows 1000000
+    python benchmark.py sync --rows 100000
+    python benchmark.py predictor --rows 100000
+    python benchmark.py sketches --rows 1000000
+    python benchmark.py habits --rows 1000000
+    python benchmark.py textstore --rows 1000000
+    python benchmark.py maintenance --rows 200000
+    python benchmark.py cube --rows 100000
+    python benchmark.py taggraph --rows 1000000
+    python benchmark.py autocomplete --rows 1000000
+    python benchmark.py sessions --events 1000000
+    python benchmark.py backup --rows 200000
+    python benchmark.py sharedcache --rows 1000000 --workers 4
+    python benchmark.py reports --users 500 --workers 1 4
+    python benchmark.py parallel --rows 1000000
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+from database import ContentDatabase
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(ROOT, "app.py")
+PAGES = ["🏠 Dashboard", "➕ Add New Content", "📊 Analytics", "💡 Insights"]
+
+CONTENT_TYPES = ["Book", "Movie", "TV Show", "Anime", "Manga", "Game", "Podcast"]
+GENRES = ["Young Adult Fantasy", "Dystopian Fiction", "Romance", "Thriller", "Comedy Shounen",
+          "Drama", "Sitcom", "Horror Mystery Thriller", "Science Fiction", "Slice of Life"]
+TAGS = ["happy", "sad", "crying", "emotional", "hyped", "cozy", "inspired", "shocked",
+        "romantic", "nostalgic", "wholesome", "mindblown", "anxious", "calm", "epic"]
+NOTES = ["Emotionally destroyed, cried so much", "Comfort show, calm lazy day vibes",
+         "So good! Magic and found family vibes", "Mind-bending and heartbreaking",
+         "Intrigued and interested", "Pure chaos, loved every second"]
+
+
+def make_synthetic_db(path, rows, seed=7):
+    """Create a database at path with rows content entries and one mood log each"""
+    db = ContentDatabase(path)
+    db.create_tables()
+    rng = random.Random(seed)
+    start = date(2015, 1, 1)
+    conn = sqlite3.connect(path)
+    content, moods = [], []
+    for content_id in range(1, rows + 1):
+        consumed = (start + timedelta(days=rng.randrange(3650))).isoformat()
+        content.append((
+            content_id, f"Title {content_id}", rng.choice(CONTENT_TYPES), rng.choice(GENRES),
+            f"Creator {rng.randrange(rows // 10 + 1)}", rng.randrange(1950, 2025), consumed,
+            rng.randrange(0, 21) / 2, rng.choice(NOTES),
+        ))
+        before = rng.randrange(1, 10)
+        moods.append((
+            content_id, before, min(10, before + rng.randrange(-2, 5)),
+            ",".join(rng.sample(TAGS, 3)), consumed,
+        ))
+    conn.executemany('''
+        INSERT INTO content (id, title, content_type, genre, creator, release_year,
+                             date_consumed, rating, notes)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', content)
+    conn.executemany('''
+        INSERT INTO mood_logs (content_id, mood_before, mood_after, emotional_tags, log_date)
+        VALUES (?, ?, ?, ?, ?)
+    ''', moods)
+    conn.commit()
+    conn.close()
+    return path
+
+
+def _run_python(code, cwd):
+    """Run code in a fresh interpreter and return its stdout"""
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=cwd, capture_output=True, text=True, check=True,
+        env={**os.environ, "PYTHONPATH": ROOT},
+    )
+    return result.stdout.strip().splitlines()[-1]
+
+
+def bench_startup(args):
+    """Cold import time and time-to-first-render per page"""
+    workdir = tempfile.mkdtemp(prefix="contentmood-startup-")
+    make_synthetic_db(os.path.join(workdir, "contentmood.db"), args.rows)
+
+    print(f"Cold start on {args.rows} rows (best of {args.repeat} fresh interpreters)")
+    imports = {
+        "database": "import database",
+        "database write path": (
+            "import database; database.ContentDatabase('contentmood.db')"
+            ".add_content('t', 'Book', 'g', 'c', 2024, '2024-01-01', 5.0)"
+        ),
+        "pandas": "import pandas",
+        "plotly.express": "import plotly.express",
+    }
+    for label, statement in imports.items():
+        code = (
+            "import time, sys; t = time.perf_counter(); " + statement + "; "
+            "print(time.perf_counter() - t, 'pandas' in sys.modules)"
+        )
+        samples = [_run_python(code, workdir).split() for _ in range(args.repeat)]
+        best = min(float(seconds) for seconds, _ in samples)
+        print(f"  import {label:<22} {best * 1000:8.1f} ms   pandas loaded: {samples[0][1]}")
+
+    for page in PAGES:
+        code = (
+            "import time\n"
+            "from streamlit.testing.v1 import AppTest\n"
+            f"at = AppTest.from_file({APP_PATH!r}, default_timeout=600)\n"
+            f"at.session_state['page'] = {page!r}\n"
+            "t = time.perf_counter()\n"
+            "at.run()\n"
+            "assert not at.exception, at.exception\n"
+            "print(time.perf_counter() - t)\n"
+        )
+        best = min(float(_run_python(code, workdir)) for _ in range(args.repeat))
+        print(f"  first render {page:<20} {best * 1000:8.1f} ms")
+
+
+def _load(port, duration, clients, request):
+    """Hammer a local server from several keep-alive clients; returns req/s"""
+    done = []
+    stop_at = time.perf_counter() + duration
+
+    def client():
+        conn = http.client.HTTPConnection("127.0.0.1", port)
+        count = 0
+        while time.perf_counter() < stop_at:
+            method, path, body, headers = request()
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            assert response.status < 400, response.status
+            count += 1
+        conn.close()
+        done.append(count)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(done) / duration
+
+
+def bench_api(args):
+    """Requests per second against a local API instance"""
+    workdir = tempfile.mkdtemp(prefix="contentmood-api-")
+    db_path = make_synthetic_db(os.path.join(workdir, "contentmood.db"), args.rows)
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "api.py"), "--db", db_path, "--port", "0"],
+        stdout=subprocess.PIPE, text=True,
+    )
+    try:
+        port = int(server.stdout.readline().rsplit(":", 1)[1])
+        gzip_headers = {"Accept-Encoding": "gzip"}
+        conn = http.client.HTTPConnection("127.0.0.1", port)
+        conn.request("GET", "/stats/genres")
+        response = conn.getresponse()
+        response.read()
+        etag = response.getheader("ETag")
+        conn.close()
+        entry = json.dumps({
+            "title": "Benchmark Entry", "content_type": "Book", "genre": "Romance",
+            "date_consumed": "2024-10-01", "rating": 8.0, "mood_before": 5, "mood_after": 8,
+        }).encode("utf-8")
+        scenarios = {
+            "GET /content?limit=20": lambda: ("GET", "/content?limit=20", None, gzip_headers),
+            "GET /stats/genres": lambda: ("GET", "/stats/genres", None, gzip_headers),
+            "GET /stats/genres (304)": lambda: ("GET", "/stats/genres", None, {"If-None-Match": etag}),
+            "POST /content": lambda: ("POST", "/content", entry, {"Content-Type": "application/json"}),
+        }
+        print(f"API load test on {args.rows} rows, {args.clients} clients, {args.duration}s each")
+        for label, request in scenarios.items():
+            rate = _load(port, args.duration, args.clients, request)
+            print(f"  {label:<26} {rate:10.0f} req/s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+BACKEND_METHODS = ("get_all_content", "get_all_moods", "get_content_with_moods",
+                   "get_genre_stats", "get_content_type_stats")
+
+
+def _median_ms(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return sorted(samples)[len(samples) // 2] * 1000
+
+
+def bench_backends(args):
+    """Check SQLite and DuckDB return identical results and compare latency"""
+    import pandas as pd
+
+    workdir = tempfile.mkdtemp(prefix="contentmood-backends-")
+    db_path = make_synthetic_db(os.path.join(workdir, "contentmood.db"), args.rows)
+    engines = {name: ContentDatabase(db_path, backend=name, cache_bytes=0) for name in ("sqlite", "duckdb")}
+    start = time.perf_counter()
+    engines["duckdb"].backend.sync()
+    print(f"Backends on {args.rows} rows (initial DuckDB mirror: {time.perf_counter() - start:.2f}s)")
+
+    for method in BACKEND_METHODS:
+        results = {name: getattr(db, method)() for name, db in engines.items()}
+        pd.testing.assert_frame_equal(results["sqlite"], results["duckdb"], check_dtype=False)
+    print(f"  identical results for {', '.join(BACKEND_METHODS)}")
+
+    print(f"  {'method':<26} {'sqlite':>10} {'duckdb':>10}   (median of {args.repeat})")
+    for method in BACKEND_METHODS:
+        timings = [_median_ms(getattr(db, method), args.repeat) for db in engines.values()]
+        print(f"  {method:<26} {timings[0]:8.1f}ms {timings[1]:8.1f}ms")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class StreamlitSession:
+    """Minimal browser stand-in: drives a running app over its websocket
+
+    Widget changes are sent the way the frontend sends them, including the
+    fragment id when the widget lives inside a fragment, so the server does a
+    fragment-only rerun exactly as it would for a real user.
+    """
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.widgets = {}   # label -> (widget id, fragment id)
+        self.states = {}    # widget id -> string value
+
+    def rerun(self, fragment_id=""):
+        """Send the current widget states and wait for the run to finish; returns seconds"""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        msg.rerun_script.fragment_id = fragment_id
+        for widget_id, value in self.states.items():
+            state = msg.rerun_script.widget_states.widgets.add()
+            state.id = widget_id
+            state.string_value = value
+        start = time.perf_counter()
+        self.ws.send(msg.SerializeToString())
+        while True:
+            forward = ForwardMsg()
+            forward.ParseFromString(self.ws.recv())
+            kind = forward.WhichOneof("type")
+            if kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+                element = forward.delta.new_element
+                widget = getattr(element, element.WhichOneof("type"))
+                if getattr(widget, "label", None) and getattr(widget, "id", None):
+                    self.widgets[widget.label] = (widget.id, forward.delta.fragment_id)
+            elif kind == "script_finished":
+                return time.perf_counter() - start
+
+    def change(self, label, value, fragment_scoped=True):
+        widget_id, fragment_id = self.widgets[label]
+        self.states[widget_id] = value
+        return self.rerun(fragment_id if fragment_scoped else "")
+
+
+# (page, widget label, two values to alternate between)
+FRAGMENT_INTERACTIONS = [
+    ("🏠 Dashboard", "📏 Smoothing", ("7 entries", "None")),
+    ("➕ Add New Content", "Source", ("Letterboxd (diary/ratings CSV)", "Goodreads (library export CSV)")),
+]
+
+
+def bench_fragments(args):
+    """Per-interaction rerun time: whole-script reruns vs fragment reruns"""
+    workdir = tempfile.mkdtemp(prefix="contentmood-fragments-")
+    make_synthetic_db(os.path.join(workdir, "contentmood.db"), args.rows)
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", os.path.abspath(args.app), "--server.headless", "true",
+         "--server.port", str(port), "--browser.gatherUsageStats", "false"],
+        cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        env={**os.environ, "PYTHONPATH": ROOT},
+    )
+    try:
+        for _ in range(600):
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+                conn.request("GET", "/_stcore/health")
+                if conn.getresponse().status == 200:
+                    break
+            except OSError:
+                time.sleep(0.1)
+        from websockets.sync.client import connect
+        with connect(f"ws://127.0.0.1:{port}/_stcore/stream", subprotocols=["streamlit"],
+                     max_size=None) as ws:
+            session = StreamlitSession(ws)
+            session.rerun()
+            print(f"Rerun time per interaction on {args.rows} rows (median of {args.repeat})")
+            for page in PAGES:
+                session.change("Navigate", page)
+                timing = _median_ms(session.rerun, args.repeat)
+                print(f"  {page:<20} {'any widget':<14} {'full rerun':<15} {timing:8.1f} ms")
+            for page, label, values in FRAGMENT_INTERACTIONS:
+                session.change("Navigate", page)
+                if label not in session.widgets:
+                    continue
+                fragment_id = session.widgets[label][1]
+                for scoped in (False, True):
+                    if scoped and not fragment_id:
+                        continue
+                    turns = iter(values * args.repeat)
+                    timing = _median_ms(lambda: session.change(label, next(turns), fragment_scoped=scoped),
+                                        args.repeat)
+                    kind = "fragment rerun" if scoped else "full rerun"
+                    print(f"  {page:<20} {label:<14} {kind:<15} {timing:8.1f} ms")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def bench_sentiment(args):
+    """Backfill throughput of note sentiment scoring per worker count"""
+    from sentiment import update_scores
+
+    workdir = tempfile.mkdtemp(prefix="contentmood-sentiment-")
+    db_path = make_synthetic_db(os.path.join(workdir, "contentmood.db"), args.rows)
+    conn = sqlite3.connect(db_path)
+    # Make every note distinct so the hash cache cannot skip the work
+    conn.execute("UPDATE content SET notes = notes || ' #' || id")
+    conn.commit()
+    db = ContentDatabase(db_path)
+
+    print(f"Sentiment backfill of {args.rows} notes ({os.cpu_count()} cores)")
+    for workers in args.workers:
+        conn.execute("DELETE FROM content_note_scores")
+        conn.execute("DELETE FROM note_scores")
+        conn.commit()
+        start = time.perf_counter()
+        rows, scored = update_scores(db, workers=workers)
+        elapsed = time.perf_counter() - start
+        print(f"  {workers:>2} worker(s) {elapsed:8.1f}s   {rows / elapsed:10,.0f} notes/s")
+    conn.close()
+
+
+def bench_sync(args):
+    """Bytes and time to sync two copies of a database after a day of activity"""
+    from sync import sync
+
+    workdir = tempfile.mkdtemp(prefix="contentmood-sync-")
+    laptop_path = make_synthetic_db(os.path.join(workdir, "laptop.db"), args.rows)
+    phone_path = os.path.join(workdir, "phone.db")
+    shutil.copy(laptop_path, phone_path)
+    laptop, phone = ContentDatabase(laptop_path), ContentDatabase(phone_path)
+    phone.reset_device_id()
+
+    rng = random.Random(11)
+    for db in (laptop, phone):
+        for number in range(args.changes):
+            content_id = db.add_content(f"New {number}", rng.choice(CONTENT_TYPES), rng.choice(GENRES),
+                                        "Someone", 2024, "2024-10-01", rng.randrange(0, 21) / 2,
+                                        rng.choice(NOTES))
+            db.add_mood_log(content_id, 4, 7, "cozy,happy", "2024-10-01")
+        conn = sqlite3.connect(db.db_name)
+        for content_id in rng.sample(range(1, args.rows + 1), args.changes // 5):
+            conn.execute("UPDATE content SET rating = ? WHERE id = ?", (rng.randrange(0, 21) / 2, content_id))
+        conn.commit()
+        conn.close()
+
+    start = time.perf_counter()
+    result = sync(laptop, phone)
+    elapsed = time.perf_counter() - start
+    print(f"Sync of two {args.rows}-row copies ({os.path.getsize(laptop_path) / 1024 / 1024:.1f} MiB each) "
+          f"after {args.changes} new entries and {args.changes // 5} edits per side")
+    for direction, (received, applied, size) in result.items():
+        print(f"  {direction:<7} {applied:6} changes applied {size / 1024:8.1f} KiB")
+    print(f"  total {elapsed * 1000:.0f} ms")
+
+
+def bench_predictor(args):
+    """Mood predictor: initial fit, per-prediction and per-log update latency"""
+    from predictor import MODEL_NAME, load_predictor
+
+    workdir = tempfile.mkdtemp(prefix="contentmood-predictor-")
+    db = ContentDatabase(make_synthetic_db(os.path.join(workdir, "contentmood.db"), args.rows))
+
+    start = time.perf_counter()
+    model = load_predictor(db)
+    print(f"Mood predictor on {args.rows} rows")
+    print(f"  initial fit      {(time.perf_counter() - start) * 1000:10.1f} ms  ({model.updates} logs)")
+
+    rng = random.Random(5)
+    inputs = [(rng.choice(GENRES), rng.choice(CONTENT_TYPES), f"Creator {rng.randrange(500)}",
+               rng.randrange(0, 21) / 2, rng.randint(1, 10)) for _ in range(1000)]
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for features in inputs:
+            model.predict(*features)
+    print(f"  predict          {(time.perf_counter() - start) / (args.repeat * len(inputs)) * 1e6:10.1f} µs")
+
+    start = time.perf_counter()
+    for features in inputs:
+        model.update(*features, rng.randint(1, 10))
+    print(f"  update (memory)  {(time.perf_counter() - start) / len(inputs) * 1e6:10.1f} µs")
+
+    # Through add_mood_log: the stored state is updated inside the insert's transaction
+    load_predictor(db)
+    content_id = db.add_content("Benchmark", "Book", GENRES[0], "Someone", 2024, "2024-10-01", 7.0)
+    timings = []
+    for _ in range(args.logs):
+        start = time.perf_counter()
+        db.add_mood_log(content_id, 4, 7, "cozy", "2024-10-01")
+        timings.append(time.perf_counter() - start)
+    db.connect()
+    db.cursor.execute("DELETE FROM model_state WHERE name = ?", (MODEL_NAME,))
+    db.conn.commit()
+    db.close()
+    plain = []
+    for _ in range(args.logs):
+        start = time.perf_counter()
+        db.add_mood_log(content_id, 4, 7, "cozy", "2024-10-01")
+        plain.append(time.perf_counter() - start)
+    timings.sort()
+    plain.sort()
+    print(f"  add_mood_log     {timings[len(timings) // 2] * 1000:10.2f} ms median with online update, "
+          f"{plain[len(plain) // 2] * 1000:.2f} ms without")
+
+
+def bench_sketches(args):
+    """Approximate vs exact whole-history analytics: latency and observed error"""
+    from sketches import get_sketches
+
+    workdir = tempfile.mkdtemp(prefix="contentmood-sketches-")
+    db = ContentDatabase(make_synthetic_db(os.path.join(workdir, "contentmood.db"), args.rows), cache_bytes=0)
+    quantiles = [0.1, 0.25, 0.5, 0.75, 0.9]
+
+    start = time.perf_counter()
+    with db.read_session():
+        content_df = db.get_all_content()
+        mood_df = db.get_content_with_moods(with_text=True)
+    exact = {
+        "creators": content_df["creator"].nunique(),
+        "genres": content_df["genre"].nunique(),
+        "ratings": content_df["rating"].quantile(quantiles).tolist(),
+        "mood_changes": mood_df["mood_change"].quantile(quantiles).tolist(),
+        "tags": mood_df["emotional_tags"].dropna().str.lower().str.split(",").explode().str.strip().value_counts(),
+    }
+    exact_seconds = time.perf_counter() - start
+
+    sketches = get_sketches(db)
+    start = time.perf_counter()
+    sketches.sync()
+    build_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    summary = sketches.summary()
+    warm_seconds = time.perf_counter() - start
+
+    rng = random.Random(3)
+    for number in range(args.changes):
+        content_id = db.add_content(f"New {number}", rng.choice(CONTENT_TYPES), rng.choice(GENRES),
+                                    "Someone", 2024, "2024-10-01", 7.5, rng.choice(NOTES))
+        db.add_mood_log(content_id, 4, 7, "cozy,happy", "2024-10-01")
+    start = time.perf_counter()
+    sketches.summary()
+    incremental_seconds = time.perf_counter() - start
+
+    print(f"Whole-history analytics over {args.rows} entries")
+    print(f"  exact (load + pandas)        {exact_seconds * 1000:10.0f} ms")
+    print(f"  sketches, first build        {build_seconds * 1000:10.0f} ms")
+    print(f"  sketches, unchanged          {warm_seconds * 1000:10.1f} ms")
+    print(f"  sketches, +{args.changes} entries       {incremental_seconds * 1000:10.1f} ms")
+    print(f"  sketch file                  {summary['sketch_bytes'] / 1024:10.0f} KiB")
+    for name in ("creators", "genres"):
+        estimate = summary[f"distinct_{name}"]
+        print(f"  distinct {name:<9} exact {exact[name]:>9,}  approx {estimate['estimate']:>11,.0f} "
+              f"± {estimate['error']:,.0f}")
+    for name in ("ratings", "mood_changes"):
+        worst = max(abs(row["value"] - value) for row, value in zip(summary[f"{name[:-1]}_quantiles"], exact[name]))
+        print(f"  {name:<12} quantiles, largest difference {worst:.3f}")
+    overstatement = max(count - exact["tags"].get(tag, 0) for tag, count in summary["top_tags"])
+    print(f"  top tags, largest overstatement {overstatement} (bound {summary['tag_error']:,.0f})")
+
+
+def bench_habits(args):
+    """Streak and goal reads from the trigger-maintained counters vs a full scan"""
+    import pandas as pd
+
+    workdir = tempfile.mkdtemp(prefix="contentmood-habits-")
+    db = ContentDatabase(make_synthetic_db(os.path.join(workdir, "contentmood.db"), args.rows), cache_bytes=0)
+    db.add_goal("Books this year", "year", 50, "Book")
+    db.add_goal("Anything this week", "week", 3)
+    today = date(2024, 12, 31)
+
+    def counters():
+        return db.get_streaks(today), db.get_goal_progress(today)
+
+    def full_scan():
+        with db._reader() as conn:
+            days = pd.read_sql_query("SELECT DISTINCT date(date_consumed) AS day FROM content ORDER BY day", conn)
+        day_numbers = pd.to_datetime(days["day"]).map(pd.Timestamp.toordinal)
+        islands = (day_numbers.diff() != 1).cumsum()
+        return islands.value_counts().max()
+
+    print(f"Streaks and goals over {args.rows} entries")
+    print(f"  counters (get_streaks + get_goal_progress) {_median_ms(counters, args.repeat):8.2f} ms")
+    print(f"  full scan (longest streak only)           {_median_ms(full_scan, args.repeat):8.2f} ms")
+
+    # Backfilled entries land on random past days, splitting and joining runs
+    rng = random.Random(9)
+    timings = []
+    for number in range(args.inserts):
+        consumed = (date(2015, 1, 1) + timedelta(days=rng.randrange(4000))).isoformat()
+        start = time.perf_counter()
+        db.add_content(f"Backfill {number}", rng.choice(CONTENT_TYPES), rng.choice(GENRES), "Someone",
+                       2020, consumed, 7.0)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    print(f"  add_content, backfilled dates             {timings[len(timings) // 2] * 1000:8.2f} ms median")
+    print(f"  longest streak: counters {db.get_streaks(today)['longest']}, full scan {full_scan()}")
+
+
+def bench_textstore(args):
+    """File size, hot scans and per-value cost before and after compressing notes and tags"""
+    import pandas as pd
+    import textstore
+
+    workdir = tempfile.mkdtemp(prefix="contentmood-textstore-")
+    path = make_synthetic_db(os.path.join(workdir, "contentmood.db"), args.rows)
+    # Vary the notes so the dictionary has to generalize rather than memorize six strings
+    rng = random.Random(11)
+    words = " ".join(NOTES + TAGS).lower().replace(",", "").replace("!", "").split()
+    conn = sqlite3.connect(path)
+    conn.executemany("UPDATE content SET notes = ? WHERE id = ?", [
+        (f"{rng.choice(NOTES)}. {' '.join(rng.choices(words, k=rng.randrange(3, 12)))}", content_id)
+        for content_id in range(1, args.rows + 1)])
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+    db = ContentDatabase(path, cache_bytes=0)
+
+    def select_all():
+        with db._reader() as conn:
+            return pd.read_sql_query("SELECT * FROM content ORDER BY date_consumed DESC, id DESC", conn)
+
+    print(f"Notes and tags of {args.rows} entries")
+    size_before = os.path.getsize(path)
+    text_before = sum(stored for _, stored, _ in db.get_text_stats().values())
+    select_before = _median_ms(select_all, args.repeat)
+    start = time.perf_counter()
+    results = textstore.compress(db)
+    db.vacuum()
+    compress_seconds = time.perf_counter() - start
+    size_after = os.path.getsize(path)
+    text_after = sum(stored for _, stored, _ in db.get_text_stats().values())
+    for column, (codec, rows, ratio) in results.items():
+        print(f"  {column:<15} {codec:<8} {rows:>9,} values   {ratio:6.1%} of their size (held out)")
+    print(f"  compress + VACUUM                  {compress_seconds:8.1f} s")
+    print(f"  notes + tags stored                {text_before / 2**20:8.1f} MiB -> {text_after / 2**20:.1f} MiB")
+    print(f"  file size                          {size_before / 2**20:8.1f} MiB -> {size_after / 2**20:.1f} MiB")
+    print(f"  SELECT * FROM content (before)     {select_before:8.1f} ms")
+    print(f"  get_all_content (no notes)         {_median_ms(db.get_all_content, args.repeat):8.1f} ms")
+    print(f"  get_all_content(with_notes=True)   "
+          f"{_median_ms(lambda: db.get_all_content(with_notes=True), args.repeat):8.1f} ms")
+
+    samples = db.get_text_samples("content", 1000)
+    stored = [db.encode_text("notes", text) for text in samples]
+    for label, func in (("encode", lambda: [db.encode_text("notes", text) for text in samples]),
+                        ("decode", lambda: [db.decode_text(value) for value in stored])):
+        print(f"  {label} one note                     {_median_ms(func, args.repeat) / len(samples) * 1000:8.1f} µs")
+
+
+def bench_maintenance(args):
+    """Maintenance step durations and the write latency an app writer sees meanwhile"""
+    from maintenance import MaintenanceScheduler, fragmentation_report, rebuild
+
+    workdir = tempfile.mkdtemp(prefix="contentmood-maintenance-")
+    path = make_synthetic_db(os.path.join(workdir, "contentmood.db"), args.rows)
+    rebuild(path)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # Clear out the oldest fifth of the history so the file has free pages
+    conn.execute("DELETE FROM mood_logs WHERE content_id <= ?", (args.rows // 5,))
+    conn.execute("DELETE FROM content WHERE id <= ?", (args.rows // 5,))
+    conn.commit()
+    conn.close()
+    db = ContentDatabase(path, cache_bytes=0)
+    before = fragmentation_report(path)
+
+    latencies = []
+    stop = threading.Event()
+
+    def writer():
+        number = 0
+        while not stop.is_set():
+            start = time.perf_counter()
+            db.add_content(f"During maintenance {number}", "Book", "Drama", "Someone", 2020, "2024-06-01", 7.0)
+            latencies.append(time.perf_counter() - start)
+            number += 1
+            time.sleep(0.005)
+
+    def summary(values):
+        values = sorted(values)
+        return (f"p50 {values[len(values) // 2] * 1000:6.1f} ms   p99 {values[int(len(values) * 0.99)] * 1000:6.1f} ms"
+                f"   max {values[-1] * 1000:6.1f} ms   ({len(values)} writes)")
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    time.sleep(args.seconds)
+    idle = list(latencies)
+    del latencies[:]
+    # Every step forced each tick for the same time (the scheduler would
+    # normally find a step due every few minutes at most)
+    scheduler = MaintenanceScheduler(path)
+    steps = {}
+    deadline = time.perf_counter() + args.seconds
+    while time.perf_counter() < deadline:
+        for step, seconds, ok, detail in scheduler.run_once(force=True):
+            steps.setdefault(step, []).append((seconds, ok, detail))
+        time.sleep(args.tick)
+    stop.set()
+    thread.join()
+    after = fragmentation_report(path)
+
+    print(f"Maintenance of {args.rows} entries after deleting the oldest fifth (WAL, incremental auto_vacuum)")
+    for step, runs in steps.items():
+        print(f"  {step:<19} {len(runs):4} runs   longest {max(seconds for seconds, _, _ in runs) * 1000:7.1f} ms"
+              f"   {sum(not ok for _, ok, _ in runs)} skipped   first: {runs[0][2]}")
+    print(f"  file {before['page_count'] * before['page_size'] / 2**20:.1f} MiB "
+          f"({before['freelist_count']:,} free pages) -> {after['page_count'] * after['page_size'] / 2**20:.1f} MiB "
+          f"({after['freelist_count']:,} free)")
+    print(f"  add_content, idle              {summary(idle)}")
+    print(f"  add_content, during maintenance {summary(latencies)}")
+
+
+def bench_cube(args):
+    """Pivot explorer reads from the cube vs a pandas groupby over the raw rows"""
+    from cube import get_cube
+
+    workdir = tempfile.mkdtemp(prefix="contentmood-cube-")
+    db = ContentDatabase(make_synthetic_db(os.path.join(workdir, "contentmood.db"), args.rows), cache_bytes=0)
+    cube = get_cube(db)
+    start = time.perf_counter()
+    cube.sync()
+    build_seconds = time.perf_counter() - start
+    with db._reader() as conn:
+        cells = conn.execute("SELECT COUNT(*) FROM cube_cells").fetchone()[0]
+
+    def groupby(rows, columns):
+        frame = db.get_content_with_moods(with_text=True)
+        frame["month"] = frame["date_consumed"].str[:7]
+        if "tag" in (rows, columns):
+            frame["tag"] = frame["emotional_tags"].str.lower().str.split(",")
+            frame = frame.explode("tag")
+            frame["tag"] = frame["tag"].str.strip()
+        return frame.groupby([rows, columns]).agg(
+            entries=("id", "size"), avg_rating=("rating", "mean"), avg_mood_change=("mood_change", "mean"))
+
+    print(f"Pivot explorer over {args.rows} entries (cube: {cells:,} cells, built in {build_seconds:.1f}s)")
+    for rows, columns in (("genre", "content_type"), ("month", "tag"), ("creator", "genre")):
+        cube_ms = _median_ms(lambda: cube.pivot(rows, columns), args.repeat)
+        drill_ms = _median_ms(lambda: cube.drill(rows, cube.top_values(rows, 1)[0], columns), args.repeat)
+        groupby_ms = _median_ms(lambda: groupby(rows, columns), 1)
+        print(f"  {rows:>12} × {columns:<12} cube {cube_ms:7.2f} ms   drill-down {drill_ms:7.2f} ms   "
+              f"groupby {groupby_ms:9.1f} ms")
+
+    rng = random.Random(5)
+    timings = []
+    for number in range(args.inserts):
+        content_id = db.add_content(f"Cube {number}", rng.choice(CONTENT_TYPES), rng.choice(GENRES),
+                                    "Someone", 2020, "2024-06-01", 7.5)
+        db.add_mood_log(content_id, 4, 7, ",".join(rng.sample(TAGS, 2)), "2024-06-01")
+        start = time.perf_counter()
+        cube.sync()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    print(f"  fold in one new entry and mood log  {timings[len(timings) // 2] * 1000:8.2f} ms median")
+
+
+def bench_taggraph(args):
+    """Tag co-occurrence scores from the sparse graph vs a pandas self-join"""
+    import numpy as np
+    from taggraph import get_tag_graph
+
+    workdir = tempfile.mkdtemp(prefix="contentmood-taggraph-")
+    path = make_synthetic_db(os.path.join(workdir, "contentmood.db"), args.rows)
+    # Zipf-distributed tags out of a large vocabulary, a few per log
+    rng = np.random.default_rng(11)
+    conn = sqlite3.connect(path)
+    ids = [row[0] for row in conn.execute("SELECT id FROM mood_logs")]
+    counts = rng.integers(2, 6, len(ids))
+    picks = np.minimum(rng.zipf(1.3, counts.sum()), args.tags) - 1
+    tags = np.split(picks, np.cumsum(counts)[:-1])
+    conn.executemany("UPDATE mood_logs SET emotional_tags = ? WHERE id = ?",
+                     ((",".join(f"tag{tag}" for tag in row), log_id) for row, log_id in zip(tags, ids)))
+    conn.commit()
+    conn.close()
+    db = ContentDatabase(path, cache_bytes=0)
+    graph = get_tag_graph(db)
+
+    start = time.perf_counter()
+    graph.sync()
+    build_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    graph.scores()
+    score_seconds = time.perf_counter() - start
+
+    def self_join():
+        frame = db.get_all_moods()[["id", "emotional_tags"]]
+        frame["tag"] = frame["emotional_tags"].str.lower().str.split(",")
+        frame = frame.explode("tag")[["id", "tag"]].drop_duplicates()
+        pairs = frame.merge(frame, on="id")
+        return pairs[pairs["tag_x"] < pairs["tag_y"]].groupby(["tag_x", "tag_y"]).size()
+
+    print(f"Tag graph over {len(ids):,} mood logs, {len(graph.tags):,} distinct tags, "
+          f"{graph.pairs.nnz:,} tag pairs ({os.path.getsize(graph.path) / 1024 / 1024:.1f} MiB on disk)")
+    print(f"  build {build_seconds:.1f}s, scores {score_seconds * 1000:.0f} ms per data version")
+    popular = [tag for tag, _ in graph.tag_counts(50)]
+    print(f"  related tags     {_median_ms(lambda: graph.related(rng.choice(popular)), args.repeat):8.2f} ms")
+    print(f"  tag → genres     {_median_ms(lambda: graph.genres_for(rng.choice(popular)), args.repeat):8.2f} ms")
+    print(f"  top pairs        {_median_ms(lambda: graph.top_pairs(), args.repeat):8.2f} ms")
+    print(f"  network (30)     {_median_ms(lambda: graph.network(), args.repeat):8.2f} ms")
+    print(f"  pandas self-join {_median_ms(self_join, 1):8.0f} ms")
+
+    folds, rescores = [], []
+    content_ids = random.Random(3).sample(ids, args.inserts)
+    for content_id in content_ids:
+        db.add_mood_log(content_id, 4, 7, ",".join(f"tag{tag}" for tag in rng.zipf(1.3, 3)), "2024-06-01")
+        start = time.perf_counter()
+        graph.sync()
+        folds.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        graph.scores()
+        rescores.append(time.perf_counter() - start)
+    folds.sort()
+    rescores.sort()
+    print(f"  fold in one mood log {folds[len(folds) // 2] * 1000:8.2f} ms median, "
+          f"then rescore {rescores[len(rescores) // 2] * 1000:.0f} ms")
+
+
+def bench_autocomplete(args):
+    """Add-form suggestion latency over many distinct titles"""
+    from autocomplete import SUGGESTIONS, get_suggester
+
+    workdir = tempfile.mkdtemp(prefix="contentmood-autocomplete-")
+    path = make_synthetic_db(os.path.join(workdir, "contentmood.db"), args.rows)
+    # Titles of made-up words (Zipf-ish: a few words are everywhere), all distinct
+    rng = random.Random(13)
+    syllables = [onset + vowel + coda for onset in ["", "b", "c", "d", "f", "g", "h", "k", "l", "m", "n", "p", "r",
+                                                    "s", "t", "v", "w", "br", "ch", "dr", "gr", "sh", "st", "th", "tr"]
+                 for vowel in ["a", "e", "i", "o", "u", "ai", "ea", "ou"] for coda in ["", "n", "r", "s", "t", "nd", "ng"]]
+    words = list({"".join(rng.choice(syllables) for _ in range(rng.randint(1, 4))) for _ in range(40000)})
+    cumulative = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(words))))
+    titles = set()
+    while len(titles) < args.rows:
+        titles.add(" ".join(rng.choices(words, cum_weights=cumulative, k=rng.randint(1, 5))).title())
+    conn = sqlite3.connect(path)
+    conn.executemany("UPDATE content SET title = ? WHERE id = ?", zip(titles, range(1, args.rows + 1)))
+    conn.commit()
+    conn.close()
+    db = ContentDatabase(path, cache_bytes=0)
+    suggester = get_suggester(db)
+    start = time.perf_counter()
+    suggester.sync()
+    build_seconds = time.perf_counter() - start
+
+    def typo(value):
+        position = rng.randrange(len(value))
+        edit = rng.choice(("drop", "swap", "replace"))
+        if edit == "drop":
+            return value[:position] + value[position + 1:]
+        if edit == "swap" and position < len(value) - 1:
+            return value[:position] + value[position + 1] + value[position] + value[position + 2:]
+        return value[:position] + rng.choice("aeioulnrst") + value[position + 1:]
+
+    sample = rng.sample(sorted(titles), 500)
+    queries = {
+        "1-2 letters": [title[:rng.randint(1, 2)] for title in sample],
+        "prefix (3-8 letters)": [title[:rng.randint(3, 8)] for title in sample],
+        "one typo": [typo(title) for title in sample],
+        "creator prefix": [f"Creator {rng.randrange(args.rows // 10)}"[:rng.randint(9, 12)] for _ in sample],
+    }
+    print(f"Suggestions over {len(suggester.fields['title']):,} distinct titles and "
+          f"{len(suggester.fields['creator']):,} creators (indexed in {build_seconds:.1f}s)")
+    for label, texts in queries.items():
+        field = "creator" if label.startswith("creator") else "title"
+        timings, hits = [], 0
+        for text, title in zip(texts, sample):
+            start = time.perf_counter()
+            suggestions = suggester.suggest(field, text)
+            timings.append(time.perf_counter() - start)
+            hits += any(value == title for value, _ in suggestions)
+        timings.sort()
+        found = f"   original in top {SUGGESTIONS}: {hits / len(texts):.0%}" if label == "one typo" else ""
+        print(f"  {label:<22} p50 {timings[len(timings) // 2] * 1000:6.2f} ms   "
+              f"p99 {timings[int(len(timings) * 0.99)] * 1000:6.2f} ms{found}")
+
+    syncs, timings = [], []
+    for number in range(args.inserts):
+        db.add_content(f"Brand New Title {number}", "Book", "Fantasy", "Someone", 2020, "2024-06-01", 7.0)
+        start = time.perf_counter()
+        assert suggester.ready()
+        syncs.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        suggestions = suggester.suggest("title", f"brand new title {number}")
+        timings.append(time.perf_counter() - start)
+        assert suggestions and suggestions[0][0] == f"Brand New Title {number}"
+    syncs.sort()
+    timings.sort()
+    print(f"  after an insert        p50 {timings[len(timings) // 2] * 1000:6.2f} ms   "
+          f"(catching up, once per rerun: p50 {syncs[len(syncs) // 2] * 1000:.2f} ms)")
+
+    # An edit means a rebuild: it runs in the background while lookups carry on
+    conn = sqlite3.connect(path)
+    conn.execute("UPDATE content SET rating = 9 WHERE id = 1")
+    conn.commit()
+    conn.close()
+    start = time.perf_counter()
+    assert not suggester.ready()
+    check = time.perf_counter() - start
+    timings = []
+    while suggester.building():
+        lookup = time.perf_counter()
+        suggester.suggest("title", queries["one typo"][len(timings) % len(sample)])
+        timings.append(time.perf_counter() - lookup)
+        time.sleep(0.05)
+    rebuild = time.perf_counter() - start
+    assert suggester.ready()
+    timings.sort()
+    print(f"  after an edit          ready() {check * 1000:.2f} ms, rebuilt in the background in {rebuild:.1f}s; "
+          f"{len(timings)} lookups meanwhile, p50 {timings[len(timings) // 2] * 1000:.2f} ms, "
+          f"max {timings[-1] * 1000:.2f} ms")
+
+
+def bench_sessions(args):
+    """Progress checkpoint write throughput, and reads while they stream in"""
+    import pandas as pd
+    from api import WriteBatcher
+
+    workdir = tempfile.mkdtemp(prefix="contentmood-sessions-")
+    path = make_synthetic_db(os.path.join(workdir, "contentmood.db"), args.rows)
+    db = ContentDatabase(path)
+    uncached = ContentDatabase(path, cache_bytes=0)
+    rng = random.Random(17)
+    series = rng.sample(range(1, args.rows + 1), args.series)
+
+    def checkpoints(count):
+        return [{"content_id": rng.choice(series), "chapter": rng.randrange(1, 200),
+                 "minutes": rng.choice((5, 10, 20, 45)), "mood": rng.randint(1, 10)} for _ in range(count)]
+
+    def rate(label, count, write):
+        start = time.perf_counter()
+        write()
+        seconds = time.perf_counter() - start
+        print(f"  {label:<40} {count / seconds:10,.0f} events/s")
+
+    charts_before = _median_ms(uncached.get_content_with_moods, args.repeat)
+    print(f"Session checkpoints over {args.series} series ({args.rows} entries)")
+    sample = checkpoints(args.single)
+    rate("one transaction per checkpoint", len(sample), lambda: [db.add_session_events([event]) for event in sample])
+    events = checkpoints(args.events)
+    rate(f"add_session_events, batches of {args.batch}", len(events),
+         lambda: [db.add_session_events(events[start:start + args.batch]) for start in range(0, len(events), args.batch)])
+
+    # Many writers each sending one checkpoint at a time, as API clients do
+    batcher = WriteBatcher(db, write=db.add_session_events)
+    events = checkpoints(args.events // 10)
+
+    def concurrent():
+        threads = [threading.Thread(target=lambda part: [batcher.submit([event]).result() for event in part],
+                                    args=(events[number::args.clients],)) for number in range(args.clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    rate(f"WriteBatcher, {args.clients} writers of single events", len(events), concurrent)
+
+    with db._reader() as conn:
+        total = conn.execute("SELECT COUNT(*) FROM session_events").fetchone()[0]
+    print(f"Reads with {total:,} checkpoints stored")
+    print(f"  get_content_with_moods (no cache) {charts_before:8.2f} ms before, "
+          f"{_median_ms(uncached.get_content_with_moods, args.repeat):8.2f} ms after")
+    db.get_content_with_moods()
+    db.add_session_events(checkpoints(1))
+    start = time.perf_counter()
+    db.get_content_with_moods()
+    print(f"  get_content_with_moods, cached, right after a checkpoint {(time.perf_counter() - start) * 1000:8.2f} ms")
+    print(f"  get_session_rollups (all series)  {_median_ms(uncached.get_session_rollups, args.repeat):8.2f} ms")
+
+    def group_by():
+        with db._reader() as conn:
+            return pd.read_sql_query(
+                "SELECT content_id, COUNT(*), TOTAL(minutes), AVG(mood), MIN(logged_at), MAX(logged_at) "
+                "FROM session_events GROUP BY content_id", conn)
+
+    print(f"  same totals by GROUP BY            {_median_ms(group_by, args.repeat):8.2f} ms")
+    busiest = int(pd.Series([event["content_id"] for event in events]).mode()[0])
+    curve = uncached.get_session_curves([busiest])
+    print(f"  get_session_curves, one series ({len(curve):,} checkpoints) "
+          f"{_median_ms(lambda: uncached.get_session_curves([busiest]), args.repeat):8.2f} ms")
+
+
+def bench_backup(args):
+    """Online backup throughput and the longest write an app writer sees meanwhile"""
+    import backup
+
+    workdir = tempfile.mkdtemp(prefix="contentmood-backup-")
+    seed = make_synthetic_db(os.path.join(workdir, "seed.db"), args.rows)
+
+    def summary(values):
+        values = sorted(values)
+        return (f"p50 {values[len(values) // 2] * 1000:6.1f} ms   p99 {values[int(len(values) * 0.99)] * 1000:6.1f} ms"
+                f"   max {values[-1] * 1000:6.1f} ms   ({len(values)} writes)")
+
+    for journal_mode in ("delete", "wal"):
+        path = os.path.join(workdir, f"{journal_mode}.db")
+        shutil.copy(seed, path)
+        conn = sqlite3.connect(path)
+        conn.execute(f"PRAGMA journal_mode={journal_mode}")
+        conn.close()
+        db = ContentDatabase(path, cache_bytes=0)
+        latencies = []
+        stop = threading.Event()
+
+        def writer():
+            number = 0
+            while not stop.is_set():
+                start = time.perf_counter()
+                db.add_content(f"During backup {number}", "Book", "Drama", "Someone", 2020, "2024-06-01", 7.0)
+                latencies.append(time.perf_counter() - start)
+                number += 1
+                time.sleep(args.write_gap)
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        time.sleep(args.seconds)
+        idle = list(latencies)
+        del latencies[:]
+        manifests = [backup.create_backup(path, os.path.join(workdir, "backups"), keep=args.repeat, pages=args.pages)
+                     for _ in range(args.repeat)]
+        stepped = list(latencies)
+        del latencies[:]
+        # The whole file in one step, as a plain .backup would
+        target = sqlite3.connect(os.path.join(workdir, "one-step.db"))
+        source = sqlite3.connect(path)
+        source.backup(target)
+        source.close()
+        target.close()
+        # Let the write that waited on the copy finish
+        time.sleep(args.write_gap * 20)
+        stop.set()
+        thread.join()
+        one_step = list(latencies)
+
+        size = manifests[0]["bytes"] / 2**20
+        copy_seconds = sorted(manifest["copy_seconds"] for manifest in manifests)[len(manifests) // 2]
+        seconds = sorted(manifest["seconds"] for manifest in manifests)[len(manifests) // 2]
+        print(f"Backups of {args.rows} entries ({size:.0f} MiB, journal {journal_mode}), "
+              f"{args.pages} pages per step, median of {args.repeat}")
+        print(f"  copy {copy_seconds:.2f}s ({size / copy_seconds:,.0f} MiB/s), total with integrity check "
+              f"and compression {seconds:.2f}s ({size / seconds:,.0f} MiB/s)")
+        print(f"  {manifests[0]['compressed_bytes'] / 2**20:.1f} MiB compressed "
+              f"({manifests[0]['bytes'] / manifests[0]['compressed_bytes']:.1f}x), "
+              f"restarts {[manifest['restarts'] for manifest in manifests]}, "
+              f"switched to WAL {sum(manifest['switched_to_wal'] for manifest in manifests)}, "
+              f"longest step {max(manifest['longest_step_ms'] for manifest in manifests):.1f} ms")
+        print(f"  add_content, idle            {summary(idle)}")
+        print(f"  add_content, during backups  {summary(stepped)}")
+        print(f"  add_content, one-step copy   {summary(one_step)}")
+        start = time.perf_counter()
+        backup.verify_backup(manifests[-1]["path"], deep=True)
+        print(f"  verify --deep {time.perf_counter() - start:.2f}s")
+        restored = os.path.join(workdir, "restored.db")
+        start = time.perf_counter()
+        backup.restore_backup(manifests[-1]["path"], restored)
+        print(f"  restore {time.perf_counter() - start:.2f}s")
+
+
+def _private_memory():
+    """Anonymous (unshared) resident memory of this process in bytes, Linux only"""
+    with open("/proc/self/status") as file:
+        for line in file:
+            if line.startswith("RssAnon:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def _dashboard_worker(path, shared_cache_bytes, shared_cache_dir, barrier, results):
+    """One app worker process: load the Dashboard's data and report what it cost"""
+    import pandas  # noqa: F401 (loaded before the baseline, as in the app)
+
+    db = ContentDatabase(path, shared_cache_bytes=shared_cache_bytes, shared_cache_dir=shared_cache_dir)
+    baseline = _private_memory()
+    if barrier is not None:
+        barrier.wait()
+    wall, cpu = time.perf_counter(), time.process_time()
+    frames = [db.get_content_with_moods(), db.get_quick_stats(), db.get_content_summary(),
+              db.get_filter_options(), db.get_genre_stats(), db.get_content_type_stats()]
+    results.put((time.perf_counter() - wall, time.process_time() - cpu, _private_memory() - baseline,
+                 len(frames[0])))
+
+
+def bench_sharedcache(args):
+    """Dashboard loads across worker processes with and without the shared cache"""
+    import multiprocessing
+
+    workdir = tempfile.mkdtemp(prefix="contentmood-sharedcache-")
+    path = make_synthetic_db(os.path.join(workdir, "contentmood.db"), args.rows)
+    context = multiprocessing.get_context("spawn")
+    print(f"Dashboard data for {args.rows} entries in {args.workers} worker processes")
+    for label, shared_cache_bytes in (("private caches", 0), ("shared cache", args.shared_mb * 1024 * 1024)):
+        shared_cache_dir = os.path.join(workdir, f"cache-{shared_cache_bytes}")
+        results = context.Queue()
+        barrier = context.Barrier(args.workers)
+        workers = [context.Process(target=_dashboard_worker,
+                                   args=(path, shared_cache_bytes, shared_cache_dir, barrier, results))
+                   for _ in range(args.workers)]
+        for worker in workers:
+            worker.start()
+        cold = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+        # A worker started after the others have loaded, e.g. by a scale-up
+        late = context.Process(target=_dashboard_worker, args=(path, shared_cache_bytes, shared_cache_dir, None, results))
+        late.start()
+        late_result = results.get()
+        late.join()
+        print(f"  {label}")
+        print(f"    all workers at once: slowest {max(r[0] for r in cold) * 1000:7.0f} ms, "
+              f"CPU {sum(r[1] for r in cold) * 1000:7.0f} ms in total, "
+              f"private memory {sum(r[2] for r in cold) / 2**20:6.1f} MiB in total "
+              f"({max(r[2] for r in cold) / 2**20:.1f} MiB the most for one)")
+        print(f"    one more worker:     {late_result[0] * 1000:7.0f} ms, CPU {late_result[1] * 1000:7.0f} ms, "
+              f"private memory {late_result[2] / 2**20:6.1f} MiB")
+        if shared_cache_bytes:
+            size = sum(entry.stat().st_size for entry in os.scandir(shared_cache_dir) if entry.name[-5:] != ".lock")
+            print(f"    cache directory {size / 2**20:.1f} MiB")
+
+
+def bench_reports(args):
+    """Year in Review reports per minute over many user databases, per worker count"""
+    import report
+
+    workdir = tempfile.mkdtemp(prefix="contentmood-reports-")
+    users = os.path.join(workdir, "users")
+    os.makedirs(users)
+    db_names = [make_synthetic_db(os.path.join(users, f"user{number:05}.db"), args.rows, seed=number)
+                for number in range(args.users)]
+    year = 2020
+    print(f"Year in Review for {args.users} users ({args.rows // 10} entries each in {year})")
+    for workers in args.workers:
+        report.bar_chart.cache_clear()
+        start = time.perf_counter()
+        results = report.generate_reports(db_names, year, os.path.join(workdir, f"reports-{workers}"), workers)
+        elapsed = time.perf_counter() - start
+        seconds = sorted(result[3] for result in results)
+        print(f"  {workers:2} worker(s)  {len(results) / elapsed * 60:8,.0f} reports/min   "
+              f"per report p50 {seconds[len(seconds) // 2] * 1000:6.1f} ms   "
+              f"p99 {seconds[int(len(seconds) * 0.99)] * 1000:6.1f} ms")
+        if workers == 1:
+            info = report.bar_chart.cache_info()
+            print(f"             charts drawn {info.misses:,}, reused {info.hits:,}")
+    size = sum(os.path.getsize(result[1]) for result in results) / len(results)
+    print(f"  average report {size / 1024:.1f} KiB")
+
+
+
+# What each page reads before it draws anything, as in app.py
+PAGE_LOADS = {
+    "Dashboard": lambda db, today: [
+        lambda: db.get_content_summary(),
+        lambda: db.get_streaks(today),
+        lambda: db.get_goal_progress(today),
+        lambda: db.get_all_content(limit=6, with_notes=True),
+        lambda: db.get_content_with_moods(),
+        lambda: db.get_session_rollups(limit=50),
+    ],
+    "Analytics": lambda db, today: [
+        lambda: db.get_all_content(),
+        lambda: db.get_content_with_moods(),
+    ],
+    "Insights": lambda db, today: [
+        lambda: db.get_all_content(),
+        lambda: db.get_content_with_moods(with_text=True),
+        lambda: db.get_note_sentiment(),
+    ],
+}
+
+
+def bench_parallel(args):
+    """Page data-fetch latency: queries one after another vs fetch_many on pooled threads"""
+    workdir = tempfile.mkdtemp(prefix="contentmood-parallel-")
+    db_path = make_synthetic_db(os.path.join(workdir, "contentmood.db"), args.rows)
+    today = date(2025, 1, 1)
+    sequential = ContentDatabase(db_path, cache_bytes=0)
+    parallel = ContentDatabase(db_path, cache_bytes=0, parallel_reads=args.threads)
+    print(f"Page data loads on {args.rows} rows, {args.threads} threads, {os.cpu_count()} CPU(s) "
+          f"(median of {args.repeat}, cache off)")
+    print(f"  {'page':<10} {'slowest query':>14} {'sum':>10} {'sequential':>11} {'fetch_many':>11} {'speedup':>8}")
+    for page, loads in PAGE_LOADS.items():
+        calls = loads(sequential, today)
+        slowest = max(_median_ms(call, args.repeat) for call in calls)
+        total = sum(_median_ms(call, args.repeat) for call in calls)
+
+        def one_by_one():
+            with sequential.read_session():
+                return [call() for call in calls]
+
+        before = _median_ms(one_by_one, args.repeat)
+        pooled = loads(parallel, today)
+        after = _median_ms(lambda: parallel.fetch_many(pooled), args.repeat)
+        print(f"  {page:<10} {slowest:12.1f}ms {total:8.1f}ms {before:9.1f}ms {after:9.1f}ms {before / after:7.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    startup = subparsers.add_parser("startup", help=bench_startup.__doc__)
+    startup.add_argument("--rows", type=int, default=10000)
+    startup.add_argument("--repeat", type=int, default=3)
+    startup.set_defaults(func=bench_startup)
+
+    api = subparsers.add_parser("api", help=bench_api.__doc__)
+    api.add_argument("--rows", type=int, default=100000)
+    api.add_argument("--clients", type=int, default=8)
+    api.add_argument("--duration", type=float, default=5.0)
+    api.set_defaults(func=bench_api)
+
+    backends = subparsers.add_parser("backends", help=bench_backends.__doc__)
+    backends.add_argument("--rows", type=int, default=1000000)
+    backends.add_argument("--repeat", type=int, default=5)
+    backends.set_defaults(func=bench_backends)
+
+    fragments = subparsers.add_parser("fragments", help=bench_fragments.__doc__)
+    fragments.add_argument("--rows", type=int, default=100000)
+    fragments.add_argument("--repeat", type=int, default=7)
+    fragments.add_argument("--app", default=APP_PATH, help="app script to measure (e.g. an older revision)")
+    fragments.set_defaults(func=bench_fragments)
+
+    sentiment = subparsers.add_parser("sentiment", help=bench_sentiment.__doc__)
+    sentiment.add_argument("--rows", type=int, default=1000000)
+    sentiment.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    sentiment.set_defaults(func=bench_sentiment)
+
+    sync_bench = subparsers.add_parser("sync", help=bench_sync.__doc__)
+    sync_bench.add_argument("--rows", type=int, default=100000)
+    sync_bench.add_argument("--changes", type=int, default=50, help="new entries per side")
+    sync_bench.set_defaults(func=bench_sync)
+
+    predictor = subparsers.add_parser("predictor", help=bench_predictor.__doc__)
+    predictor.add_argument("--rows", type=int, default=100000)
+    predictor.add_argument("--repeat", type=int, default=100)
+    predictor.add_argument("--logs", type=int, default=200, help="mood logs written through add_mood_log")
+    predictor.set_defaults(func=bench_predictor)
+
+    sketches = subparsers.add_parser("sketches", help=bench_sketches.__doc__)
+    sketches.add_argument("--rows", type=int, default=1000000)
+    sketches.add_argument("--changes", type=int, default=100, help="entries added before the incremental sync")
+    sketches.set_defaults(func=bench_sketches)
+
+    habits = subparsers.add_parser("habits", help=bench_habits.__doc__)
+    habits.add_argument("--rows", type=int, default=1000000)
+    habits.add_argument("--repeat", type=int, default=5)
+    habits.add_argument("--inserts", type=int, default=200)
+    habits.set_defaults(func=bench_habits)
+
+    textstore_bench = subparsers.add_parser("textstore", help=bench_textstore.__doc__)
+    textstore_bench.add_argument("--rows", type=int, default=1000000)
+    textstore_bench.add_argument("--repeat", type=int, default=3)
+    textstore_bench.set_defaults(func=bench_textstore)
+
+    maintenance = subparsers.add_parser("maintenance", help=bench_maintenance.__doc__)
+    maintenance.add_argument("--rows", type=int, default=200000)
+    maintenance.add_argument("--seconds", type=float, default=3.0)
+    maintenance.add_argument("--tick", type=float, default=0.25, help="seconds between forced runs")
+    maintenance.set_defaults(func=bench_maintenance)
+
+    cube = subparsers.add_parser("cube", help=bench_cube.__doc__)
+    cube.add_argument("--rows", type=int, default=100000)
+    cube.add_argument("--repeat", type=int, default=5)
+    cube.add_argument("--inserts", type=int, default=50)
+    cube.set_defaults(func=bench_cube)
+
+    taggraph = subparsers.add_parser("taggraph", help=bench_taggraph.__doc__)
+    taggraph.add_argument("--rows", type=int, default=1000000)
+    taggraph.add_argument("--tags", type=int, default=30000, help="distinct tags to draw from")
+    taggraph.add_argument("--repeat", type=int, default=20)
+    taggraph.add_argument("--inserts", type=int, default=20)
+    taggraph.set_defaults(func=bench_taggraph)
+
+    autocomplete = subparsers.add_parser("autocomplete", help=bench_autocomplete.__doc__)
+    autocomplete.add_argument("--rows", type=int, default=1000000)
+    autocomplete.add_argument("--inserts", type=int, default=20)
+    autocomplete.set_defaults(func=bench_autocomplete)
+
+    sessions = subparsers.add_parser("sessions", help=bench_sessions.__doc__)
+    sessions.add_argument("--rows", type=int, default=100000)
+    sessions.add_argument("--series", type=int, default=200)
+    sessions.add_argument("--events", type=int, default=1000000)
+    sessions.add_argument("--batch", type=int, default=500)
+    sessions.add_argument("--single", type=int, default=1000, help="checkpoints written one transaction each")
+    sessions.add_argument("--clients", type=int, default=16)
+    sessions.add_argument("--repeat", type=int, default=5)
+    sessions.set_defaults(func=bench_sessions)
+
+    backup_bench = subparsers.add_parser("backup", help=bench_backup.__doc__)
+    backup_bench.add_argument("--rows", type=int, default=200000)
+    backup_bench.add_argument("--pages", type=int, default=1024, help="pages copied per step")
+    backup_bench.add_argument("--repeat", type=int, default=3)
+    backup_bench.add_argument("--seconds", type=float, default=2.0, help="idle writes measured first")
+    backup_bench.add_argument("--write-gap", type=float, default=0.005, help="seconds between writes")
+    backup_bench.set_defaults(func=bench_backup)
+
+    sharedcache = subparsers.add_parser("sharedcache", help=bench_sharedcache.__doc__)
+    sharedcache.add_argument("--rows", type=int, default=1000000)
+    sharedcache.add_argument("--workers", type=int, default=4)
+    sharedcache.add_argument("--shared-mb", type=int, default=1024)
+    sharedcache.set_defaults(func=bench_sharedcache)
+
+    reports = subparsers.add_parser("reports", help=bench_reports.__doc__)
+    reports.add_argument("--users", type=int, default=500)
+    reports.add_argument("--rows", type=int, default=2000, help="entries per user, over ten years")
+    reports.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    reports.set_defaults(func=bench_reports)
+
+    parallel = subparsers.add_parser("parallel", help=bench_parallel.__doc__)
+    parallel.add_argument("--rows", type=int, default=1000000)
+    parallel.add_argument("--threads", type=int, default=4)
+    parallel.add_argument("--repeat", type=int, default=5)
+    parallel.set_defaults(func=bench_parallel)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
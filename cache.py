@@ -0,0 +1,363 @@
+"""Caches for ContentDatabase query results
+
+QueryCache is a bounded in-process LRU. SharedCache is a second tier on disk
+that every worker process on a host reads: frames are stored as Arrow IPC
+files and memory-mapped back, so the page cache holds one copy of each result
+however many workers use it.
+"""
+import hashlib
+import mmap
+import os
+import pickle
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from metrics import CACHE_REQUESTS
+
+MISSING = object()
+
+
+def _size_of(value):
+    """Approximate memory footprint of a cached result in bytes"""
+    if hasattr(value, "memory_usage"):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sys.getsizeof(item) for item in value.values())
+    return sys.getsizeof(value)
+
+
+def _copy_on_write_enabled(pd):
+    if int(pd.__version__.split(".")[0]) >= 3:
+        return True
+    return bool(getattr(pd.options.mode, "copy_on_write", False))
+
+
+def protect(value):
+    """Hand out a cached result without letting the caller modify the cached copy
+
+    With pandas copy-on-write a shallow copy is enough: the first write to a
+    column copies it. Older pandas gets a deep copy. Dicts and lists are copied recursively; other
+    results are treated as immutable.
+    """
+    if hasattr(value, "copy") and hasattr(value, "columns"):
+        import pandas as pd
+        return value.copy(deep=not _copy_on_write_enabled(pd))
+    if isinstance(value, dict):
+        return {key: protect(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [protect(item) for item in value]
+    return value
+
+
+class QueryCache:
+    """LRU cache of query results with a memory budget
+
+    Keys include the data version, so results can never outlive the data
+    they were computed from; writers also call clear() to free the memory
+    held by stale versions right away.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, name="query"):
+        self.max_bytes = max_bytes
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Cached value for key (protected from mutation), or MISSING"""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        CACHE_REQUESTS.inc(cache=self.name, result="miss" if item is None else "hit")
+        return MISSING if item is None else protect(item[0])
+
+    def put(self, key, value):
+        size = _size_of(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def _map_frame(mapping):
+    """DataFrame over an Arrow IPC file in mapping, without copying its columns
+
+    Arrow hands out numeric columns as read-only arrays, which pandas can't
+    write to even on a copy-on-write copy once the original is gone. They are
+    viewed again through the private mapping, which is writable without
+    touching the file. String columns stay Arrow-backed and are immutable.
+    """
+    import numpy as np
+    import pandas as pd
+    import pyarrow as pa
+
+    buffer = pa.py_buffer(mapping)
+    frame = pa.ipc.open_file(buffer).read_all().to_pandas(split_blocks=True)
+    columns = {}
+    for position in range(frame.shape[1]):
+        column = frame.iloc[:, position]
+        values = column.array
+        if isinstance(column.dtype, np.dtype) and column.dtype.kind in "biufcmM":
+            values = column.to_numpy(copy=False)
+            offset = values.__array_interface__["data"][0] - buffer.address
+            if values.ndim == 1 and 0 <= offset and offset + values.nbytes <= buffer.size:
+                values = np.frombuffer(mapping, dtype=values.dtype, count=len(values), offset=offset)
+        columns[position] = values
+    mapped = pd.DataFrame(columns, index=frame.index, copy=False)
+    mapped.columns = frame.columns
+    return mapped
+
+
+# Starts every Arrow IPC file; anything else in a SharedCache is a pickle
+ARROW_MAGIC = b"ARROW1"
+# How long a worker waits for another worker computing the same result
+LOCK_WAIT_SECONDS = 30.0
+LOCK_POLL_SECONDS = 0.01
+
+
+class SharedCache:
+    """Query results shared between processes through files in directory
+
+    Keys must have a stable repr (tuples of strings and numbers) and include
+    the data version, as QueryCache keys do. DataFrames are written as Arrow
+    IPC files and memory-mapped on read: their columns point straight into
+    the page cache, so every process shares the memory, and a process that
+    writes to a frame gets private copies of just the pages it touched. Other
+    results are pickled. Files are replaced atomically and the least
+    recently used go once the directory passes max_bytes.
+
+    compute_lock() lets one process compute a missing result while the others
+    wait for its file instead of running the same query (POSIX only;
+    elsewhere each process computes its own).
+    """
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, name="shared"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(repr(key).encode()).hexdigest())
+
+    def get(self, key):
+        """Cached value for key, or MISSING"""
+        path = self._path(key)
+        try:
+            value = self._load(path)
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+            # Not there, or evicted by another process mid-read
+            value = MISSING
+        else:
+            try:
+                # Mark it recently used for eviction
+                os.utime(path)
+            except OSError:
+                pass
+        with self._lock:
+            if value is MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+        CACHE_REQUESTS.inc(cache=self.name, result="miss" if value is MISSING else "hit")
+        return value
+
+    def _load(self, path):
+        with open(path, "rb") as file:
+            if file.read(len(ARROW_MAGIC)) != ARROW_MAGIC:
+                file.seek(0)
+                return pickle.load(file)
+            # Private mapping: pages are shared until a process writes to one.
+            # It stays valid after the file is replaced or evicted
+            mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+        return _map_frame(mapping)
+
+    def put(self, key, value):
+        """Store value; returns the shared copy to keep in place of value
+
+        For a DataFrame that is the memory-mapped file, so the process that
+        computed it holds no private copy either; otherwise value itself.
+        """
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            arrow = self._write_arrow(tmp_path, value)
+            if not arrow:
+                with open(tmp_path, "wb") as file:
+                    pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+            if os.path.getsize(tmp_path) > self.max_bytes:
+                os.remove(tmp_path)
+                return value
+            os.replace(tmp_path, path)
+        except (OSError, pickle.PicklingError, TypeError, AttributeError):
+            # Unpicklable or the disk is full: this result just isn't shared
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return value
+        with self._lock:
+            self.writes += 1
+        self._evict()
+        if arrow:
+            try:
+                return self._load(path)
+            except (OSError, ValueError):
+                pass
+        return value
+
+    def _write_arrow(self, path, value):
+        """Write a DataFrame as an Arrow IPC file; False when value isn't one Arrow can hold"""
+        if not (hasattr(value, "columns") and hasattr(value, "memory_usage")):
+            return False
+        try:
+            import pyarrow as pa
+        except ImportError:
+            return False
+        try:
+            table = pa.Table.from_pandas(value)
+        except (pa.ArrowException, TypeError, ValueError):
+            # Mixed-type object columns and the like
+            return False
+        with pa.OSFile(path, "wb") as file:
+            with pa.ipc.new_file(file, table.schema) as writer:
+                writer.write_table(table)
+        return True
+
+    def _evict(self):
+        """Delete least recently used files until the directory fits max_bytes"""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith((".tmp", ".lock")):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            if os.path.exists(f"{path}.lock"):
+                os.remove(f"{path}.lock")
+            total -= size
+            with self._lock:
+                self.evictions += 1
+            if total <= self.max_bytes:
+                break
+
+    @contextmanager
+    def compute_lock(self, key):
+        """Held by one process at a time per key, for at most LOCK_WAIT_SECONDS of waiting
+
+        The lock file goes again when the holder stored nothing (the result was
+        over budget, or its version moved on): processes still waiting for it
+        compute for themselves either way.
+        """
+        if fcntl is None:
+            yield
+            return
+        path = self._path(key)
+        file = open(f"{path}.lock", "a+b")
+        locked = False
+        try:
+            deadline = time.monotonic() + LOCK_WAIT_SECONDS
+            while not locked:
+                try:
+                    fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    locked = True
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        # The holder is stuck or gone; compute without it
+                        break
+                    time.sleep(LOCK_POLL_SECONDS)
+            yield
+        finally:
+            if locked and not os.path.exists(path):
+                try:
+                    os.remove(f"{path}.lock")
+                except OSError:
+                    pass
+            # Closing releases the lock
+            file.close()
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def stats(self):
+        entries = 0
+        size = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith((".tmp", ".lock")):
+                entries += 1
+                try:
+                    size += entry.stat().st_size
+                except OSError:
+                    pass
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "bytes": size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,314 @@
+"""Precomputed rollups behind the Analytics pivot explorer
+
+    python cube.py --db contentmood.db build   # bring the cube up to date now
+
+Every pair of the dimensions genre, content_type, creator, month and tag, and
+each dimension alone, is kept aggregated in the cube_cells table: entries,
+rating sum and count, mood-change sum and count per cell. A pivot of any two
+dimensions, or one value drilled into across another dimension, is then an
+indexed read of one cuboid instead of a groupby over every row.
+
+Entries and ratings come from content; mood changes and tags from mood_logs,
+placed by their entry's genre, type, creator and month. Under tag, "entries"
+counts tagged mood logs. The cube is maintained like the sketches and the
+DuckDB mirror: rows past the last folded-in ids are aggregated and added
+cell by cell, and an in-place update or delete (the *_rewrites counters)
+rebuilds it. The app folds small deltas in while it renders; the first build
+and rebuilds run in a background thread (or with `cube.py build`), and a lock
+file next to the database keeps two processes from building at once.
+"""
+import argparse
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from itertools import combinations
+
+from incremental import PerDatabase, read_meta, rewrite_counts, rewritten
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+DIMENSIONS = ("genre", "content_type", "creator", "month", "tag")
+DIMENSION_LABELS = {"genre": "🎭 Genre", "content_type": "📚 Type", "creator": "✍️ Creator",
+                    "month": "📅 Month", "tag": "🏷️ Tag"}
+MEASURES = ("entries", "avg_rating", "avg_mood_change")
+CUBE_CHUNK_ROWS = 200000
+# Deltas up to this many facts are summed in plain Python: pandas' per-groupby
+# overhead would dominate folding in the entry just added
+SMALL_DELTA_ROWS = 2000
+# Catch-ups up to this many new rows are folded in while the page waits;
+# bigger ones, and rebuilds, run in the background
+INLINE_SYNC_ROWS = 20000
+# Stands in for a missing genre, creator or date in cell keys
+MISSING = ""
+
+_ENTRY_DIMENSIONS = DIMENSIONS[:4]
+# Cuboids fed by content rows and mood changes, and by tagged mood logs
+_ENTRY_CUBOIDS = [group for size in (1, 2) for group in combinations(_ENTRY_DIMENSIONS, size)]
+_TAG_CUBOIDS = [("tag",)] + [(dimension, "tag") for dimension in _ENTRY_DIMENSIONS]
+_SUMS = ["entries", "rating_sum", "rated", "mood_change_sum", "mood_changes"]
+
+
+def cuboid_name(*dimensions):
+    """Cuboid holding these dimensions, and whether they are stored in reverse order"""
+    ordered = sorted(dimensions, key=DIMENSIONS.index)
+    return ",".join(ordered), list(dimensions) != ordered
+
+
+def _cells(facts, dimensions, cuboids):
+    """Cube rows (cuboid, a, b, sums...) aggregating fact tuples (values of
+    dimensions, then the sums) into each cuboid"""
+    if len(facts) > SMALL_DELTA_ROWS:
+        return _frame_cells(facts, dimensions, cuboids)
+    width = len(dimensions)
+    positions = [[dimensions.index(name) for name in group] for group in cuboids]
+    names = [cuboid_name(*group)[0] for group in cuboids]
+    totals = {}
+    for fact in facts:
+        sums = fact[width:]
+        for name, position in zip(names, positions):
+            key = (name, fact[position[0]], fact[position[1]] if len(position) == 2 else MISSING)
+            cell = totals.setdefault(key, [0, 0.0, 0, 0.0, 0])
+            for index, value in enumerate(sums):
+                cell[index] += value
+    return [key + tuple(sums) for key, sums in totals.items() if sums[0] or sums[4]]
+
+
+def _frame_cells(facts, dimensions, cuboids):
+    import pandas as pd
+    frame = pd.DataFrame(facts, columns=[*dimensions, *_SUMS])
+    cells = []
+    for group in cuboids:
+        sums = frame.groupby(list(group), sort=False)[_SUMS].sum()
+        sums = sums[(sums["entries"] != 0) | (sums["mood_changes"] != 0)]
+        keys = sums.index.to_frame(index=False)
+        second = keys[group[1]] if len(group) == 2 else [MISSING] * len(keys)
+        cells.extend(zip([cuboid_name(*group)[0]] * len(keys), keys[group[0]], second,
+                         *(sums[column].tolist() for column in _SUMS)))
+    return cells
+
+
+class PivotCube:
+    """The cube for one database, caught up on demand"""
+
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+        self._stored = None
+        self._builder = None
+        self._builder_lock = threading.Lock()
+
+    def _entry_columns(self, alias):
+        return (f"COALESCE({alias}.genre, ''), COALESCE({alias}.content_type, ''), "
+                f"COALESCE({alias}.creator, ''), COALESCE(strftime('%Y-%m', {alias}.date_consumed), '')")
+
+    @contextmanager
+    def _build_lock(self):
+        """Held by one process at a time while it folds rows into this file's cube
+
+        A process that waits for it finds the cube already caught up, instead of
+        repeating the work and having its writes refused. POSIX only.
+        """
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.db.db_name}.cube.lock", "a+b") as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            yield
+
+    def _pending_rows(self):
+        """How many rows a sync would fold in: 0 when current, None for a rebuild"""
+        source = sqlite3.connect(self.db.db_name)
+        try:
+            meta = read_meta(source)
+            state = dict(source.execute("SELECT key, value FROM cube_state").fetchall())
+            if state.get("data_version") == meta.get("data_version"):
+                return 0
+            if rewritten(state, meta, ("content", "mood_logs")):
+                return None
+            return sum(max(0, source.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+                           - state.get(f"{table}_through", 0))
+                       for table in ("content", "mood_logs"))
+        finally:
+            source.close()
+
+    def building(self):
+        """True while a background build is running in this process"""
+        return self._builder is not None and self._builder.is_alive()
+
+    def ready(self):
+        """Catch the cube up if that is quick and return True; otherwise start
+        a background build (unless one is running) and return False"""
+        if self.building():
+            return False
+        pending = self._pending_rows()
+        if pending is not None and pending <= INLINE_SYNC_ROWS:
+            if pending:
+                self._sync()
+            return True
+        with self._builder_lock:
+            if not self.building():
+                self._builder = threading.Thread(target=self._sync, name="cube-build", daemon=True)
+                self._builder.start()
+        return False
+
+    def sync(self):
+        """Fold in rows written since the last sync; True if the cube changed"""
+        with self._lock, self._build_lock():
+            # Always the live file: the cube's watermarks are written there
+            source = sqlite3.connect(self.db.db_name)
+            try:
+                meta = read_meta(source)
+                state = self._stored = dict(source.execute("SELECT key, value FROM cube_state").fetchall())
+                if state.get("data_version") == meta.get("data_version"):
+                    return False
+                reset = rewritten(state, meta, ("content", "mood_logs"))
+                state = dict(state, **rewrite_counts(meta, ("content", "mood_logs")))
+                if reset:
+                    state.update(content_through=0, mood_logs_through=0)
+                pending = []
+                rows = source.execute(
+                    f"SELECT c.id, {self._entry_columns('c')}, c.rating FROM content c "
+                    "WHERE c.id > ? ORDER BY c.id", (state.get("content_through", 0),))
+                while chunk := rows.fetchmany(CUBE_CHUNK_ROWS):
+                    facts = [(*row[1:5], 1, row[5] or 0.0, int(row[5] is not None), 0.0, 0) for row in chunk]
+                    pending += _cells(facts, _ENTRY_DIMENSIONS, _ENTRY_CUBOIDS)
+                    state = dict(state, content_through=chunk[-1][0])
+                    if len(pending) >= CUBE_CHUNK_ROWS:
+                        reset = self._apply(pending, state, reset)
+                rows = source.execute(
+                    f"SELECT m.id, {self._entry_columns('c')}, c.rating, "
+                    "m.mood_after - m.mood_before, m.emotional_tags "
+                    "FROM mood_logs m JOIN content c ON c.id = m.content_id "
+                    "WHERE m.id > ? ORDER BY m.id", (state.get("mood_logs_through", 0),))
+                while chunk := rows.fetchmany(CUBE_CHUNK_ROWS):
+                    changes, tagged = [], []
+                    for row in chunk:
+                        entry, rating, change = row[1:5], row[5], row[6]
+                        sums = (rating or 0.0, int(rating is not None), change or 0.0, int(change is not None))
+                        changes.append((*entry, 0, 0.0, 0, *sums[2:]))
+                        tags = {tag.strip() for tag in (self.db.decode_text(row[7]) or "").lower().split(",")}
+                        tagged += [(*entry, tag, 1, *sums) for tag in tags if tag]
+                    pending += _cells(changes, _ENTRY_DIMENSIONS, _ENTRY_CUBOIDS)
+                    pending += _cells(tagged, DIMENSIONS, _TAG_CUBOIDS)
+                    state = dict(state, mood_logs_through=chunk[-1][0])
+                    if len(pending) >= CUBE_CHUNK_ROWS:
+                        reset = self._apply(pending, state, reset)
+                self._apply(pending, dict(state, data_version=meta.get("data_version")), reset)
+            finally:
+                source.close()
+        return True
+
+    def _apply(self, cells, state, reset):
+        """Write cells (emptying the list) and move the watermarks from the
+        last stored state to state; returns the reset flag for the next write"""
+        if not self.db.apply_cube_delta(cells, self._stored, state, reset):
+            # Another process folded these rows in first
+            raise _Superseded()
+        cells.clear()
+        self._stored = state
+        return False
+
+    def _read(self, query, params):
+        # The live file, like sync(): a snapshot could predate the last fold
+        conn = sqlite3.connect(self.db.db_name)
+        try:
+            return conn.execute(query, params).fetchall()
+        finally:
+            conn.close()
+
+    def top_values(self, dimension, limit=20):
+        """Values of dimension with the most entries (months: the most recent)"""
+        self._sync()
+        return self._top_values(dimension, limit)
+
+    def _top_values(self, dimension, limit):
+        order = "a DESC" if dimension == "month" else "entries DESC, a"
+        values = [row[0] for row in self._read(
+            f"SELECT a FROM cube_cells WHERE cuboid = ? AND a != ? ORDER BY {order} LIMIT ?",
+            (dimension, MISSING, limit))]
+        return sorted(values) if dimension == "month" else values
+
+    def pivot(self, rows, columns, row_values=None, column_values=None, limit=20):
+        """Cells of rows × columns as a DataFrame (row, column, entries, avg_rating,
+        avg_mood_change); by default over the top limit values of each dimension"""
+        import pandas as pd
+        if rows == columns or rows not in DIMENSIONS or columns not in DIMENSIONS:
+            raise ValueError(f"Pick two different dimensions out of {', '.join(DIMENSIONS)}")
+        self._sync()
+        row_values = list(row_values) if row_values is not None else self._top_values(rows, limit)
+        column_values = list(column_values) if column_values is not None else self._top_values(columns, limit)
+        cuboid, reversed_ = cuboid_name(rows, columns)
+        first, second = (column_values, row_values) if reversed_ else (row_values, column_values)
+        cells = self._read(f'''
+            SELECT a, b, entries,
+                   CASE WHEN rated THEN rating_sum / rated END,
+                   CASE WHEN mood_changes THEN mood_change_sum / mood_changes END
+            FROM cube_cells
+            WHERE cuboid = ? AND a IN ({', '.join('?' * len(first))}) AND b IN ({', '.join('?' * len(second))})
+        ''', (cuboid, *first, *second))
+        frame = pd.DataFrame(cells, columns=["a", "b", *MEASURES])
+        frame.insert(0, "row", frame["b"] if reversed_ else frame["a"])
+        frame.insert(1, "column", frame["a"] if reversed_ else frame["b"])
+        return frame.drop(columns=["a", "b"])
+
+    def drill(self, dimension, value, by, limit=20):
+        """One value of dimension broken down by another dimension, most entries first"""
+        import pandas as pd
+        if dimension == by:
+            raise ValueError("Drill into a different dimension")
+        self._sync()
+        cuboid, reversed_ = cuboid_name(dimension, by)
+        fixed, other = ("b", "a") if reversed_ else ("a", "b")
+        cells = self._read(f'''
+            SELECT {other}, entries,
+                   CASE WHEN rated THEN rating_sum / rated END,
+                   CASE WHEN mood_changes THEN mood_change_sum / mood_changes END
+            FROM cube_cells
+            WHERE cuboid = ? AND {fixed} = ?
+            ORDER BY entries DESC
+            LIMIT ?
+        ''', (cuboid, value, limit))
+        return pd.DataFrame(cells, columns=[by, *MEASURES])
+
+    def _sync(self):
+        try:
+            self.sync()
+        except _Superseded:
+            pass
+
+
+class _Superseded(Exception):
+    """The cube's watermarks moved under a sync (another process synced)"""
+
+
+_instances = PerDatabase(PivotCube)
+
+
+def get_cube(db):
+    """The shared PivotCube for db's file"""
+    return _instances.get(db)
+
+
+def main():
+    from database import ContentDatabase
+
+    parser = argparse.ArgumentParser(description="Maintain the pivot cube")
+    parser.add_argument("--db", default="contentmood.db")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("build", help="fold in everything written since the last sync")
+    args = parser.parse_args()
+
+    db = ContentDatabase(args.db, cache_bytes=0)
+    started = time.perf_counter()
+    get_cube(db)._sync()
+    with db._reader() as conn:
+        cells = conn.execute("SELECT COUNT(*) FROM cube_cells").fetchone()[0]
+    print(f"🧊 Cube up to date in {time.perf_counter() - started:.1f}s ({cells:,} cells)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,335 @@
+import hashlib
+import os
+import queue
 import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
-import pandas as pd
+from backends import get_backend
+from cache import MISSING, QueryCache, SharedCache, protect
+from filters import where_clause
+from maintenance import get_scheduler
+from metrics import DB_FILE_BYTES, DB_ROWS, REGISTRY, WRITE_LOCK_WAIT_SECONDS, track_query
+from textstore import TEXT_COLUMNS, TextCodec
+
+
+def _collect_database_metrics(db_name):
+    """Refresh file size and row count gauges for one database file"""
+    for suffix in ("", "-wal"):
+        path = db_name + suffix
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        DB_FILE_BYTES.set(size, database=db_name, file=suffix.lstrip("-") or "main")
+    if not os.path.exists(db_name):
+        return
+    conn = sqlite3.connect(f"file:{db_name}?mode=ro", uri=True)
+    try:
+        for table in ("content", "mood_logs"):
+            # SQLite counts through the smallest index: about 6 ms per million rows
+            try:
+                count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            except sqlite3.OperationalError:
+                continue
+            DB_ROWS.set(count, database=db_name, table=table)
+    finally:
+        conn.close()
+
+
+# Columns accepted by add_entries for each new content row and its mood log
+CONTENT_FIELDS = ("title", "content_type", "genre", "creator", "release_year",
+                  "date_consumed", "rating", "notes")
+MOOD_FIELDS = ("mood_before", "mood_after", "emotional_tags", "log_date")
+# Columns a synced change may carry for each table (ids are mapped locally)
+SYNC_FIELDS = {"content": CONTENT_FIELDS, "mood_logs": MOOD_FIELDS}
+# Keys accepted by add_session_events for each progress checkpoint
+SESSION_FIELDS = ("content_id", "logged_at", "chapter", "episode", "minutes", "mood")
+# Counters session reads are cached on: checkpoints, plus content edits and deletes
+SESSION_COUNTERS = ("data_version", "sessions_version")
+# Every counter a write bumps; a snapshot is rebuilt when any of them moved
+WRITE_COUNTERS = ("data_version", "sessions_version", "goals_version")
+
+# period_counts key for a day expression, per goal period. Weeks are keyed by
+# their Monday, so the week containing January 1st stays one week
+PERIOD_KEYS = {
+    "week": "'W' || date({day}, '-6 days', 'weekday 1')",
+    "month": "strftime('M%Y-%m', {day})",
+    "year": "strftime('Y%Y', {day})",
+}
+# Days in an activity run after its first; indexed so the longest streak is one lookup
+RUN_LENGTH = "CAST(julianday(end_day) - julianday(start_day) AS INTEGER)"
+
+# Columns listed by the hot read queries: everything but the compressed text
+# (see textstore.py), which is fetched only by views that display it
+CONTENT_COLUMNS = ("id", "title", "content_type", "genre", "creator", "release_year",
+                   "date_consumed", "rating", "created_at")
+MOOD_COLUMNS = ("id", "content_id", "mood_before", "mood_after", "log_date", "created_at")
+# _read_frame text spec putting notes back after rating, where the table has it
+NOTES_TEXT = (("notes", "content", "id", "rating"),)
+# ... and emotional tags after mood_after, in frames joined with mood logs
+TAGS_TEXT = (("emotional_tags", "mood_logs", "mood_log_id", "mood_after"),)
+# Above this many ids get_texts reads the whole column instead of looking ids up
+TEXT_SCAN_IDS = 20000
+
+# While text_recode has a row, rewriting a value in a new encoding is not a
+# change: update triggers (version, rewrites, change log, rescoring) skip it
+RECODE_GUARD = "NOT EXISTS (SELECT 1 FROM text_recode)"
+GUARDED_TRIGGERS = ("content_notes_rescore", "content_update_version", "mood_logs_update_version",
+                    "content_update_rewrites", "mood_logs_update_rewrites",
+                    "content_update_sync", "mood_logs_update_sync")
+
+# Databases whose schema has been brought up to date in this process
+_schema_ready = set()
+_schema_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """Small pool of reusable SQLite connections shared between threads"""
+    
+    def __init__(self, db_name, size=4):
+        self.db_name = db_name
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+    
+    def _new_connection(self):
+        conn = sqlite3.connect(self.db_name, check_same_thread=False)
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+    
+    @contextmanager
+    def connection(self):
+        """Borrow a connection, creating one while the pool is below its size"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            conn = self._new_connection() if can_create else self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+    
+    def close(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class ParallelReader:
+    """Threads that run a page's independent read queries side by side
+    
+    Each thread borrows its own connection from a pool of the same size;
+    SQLite releases the GIL while it steps through a query, so the queries
+    really do run at once.
+    """
+    
+    def __init__(self, db_name, workers=4):
+        self.workers = workers
+        self.pool = ConnectionPool(db_name, workers)
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="contentmood-read")
+    
+    def submit(self, call):
+        return self._executor.submit(call)
+
+
+class SnapshotManager:
+    """Periodically refreshed read-only copy of a database for long analytic reads
+    
+    The copy is taken with the SQLite online backup API into a temporary file
+    and swapped in with an atomic rename, so readers that already opened the
+    previous snapshot keep a consistent point-in-time view and the primary's
+    writers never wait on an aggregation.
+    """
+    
+    def __init__(self, db_name, max_age=30.0):
+        self.db_name = db_name
+        self.path = f"{db_name}.snapshot"
+        self.max_age = max_age
+        self._refresh_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        # WAL lets the backup's read transaction run alongside writers
+        conn = sqlite3.connect(db_name)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.close()
+    
+    def start(self):
+        """Refresh in a daemon thread every max_age seconds (or when woken)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="snapshot-refresh", daemon=True)
+            self._thread.start()
+        return self
+    
+    def _run(self):
+        while True:
+            self._wake.wait(self.max_age)
+            self._wake.clear()
+            try:
+                self.refresh()
+            except sqlite3.Error:
+                # Try again on the next tick, e.g. when the disk was briefly full
+                pass
+    
+    def request_refresh(self):
+        """Ask the refresh thread to take a new snapshot soon"""
+        self._wake.set()
+    
+    @staticmethod
+    def _version(conn):
+        try:
+            return conn.execute("SELECT key, value FROM db_meta WHERE key IN (?, ?, ?) ORDER BY key",
+                                WRITE_COUNTERS).fetchall()
+        except sqlite3.Error:
+            return None
+    
+    def refresh(self, force=False):
+        """Copy the primary into a new snapshot unless nothing changed"""
+        with self._refresh_lock:
+            source = sqlite3.connect(self.db_name)
+            try:
+                if not force and os.path.exists(self.path):
+                    current = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+                    try:
+                        unchanged = self._version(current) == self._version(source)
+                    finally:
+                        current.close()
+                    if unchanged:
+                        os.utime(self.path)
+                        return False
+                tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                target = sqlite3.connect(tmp_path)
+                try:
+                    source.backup(target)
+                    target.execute("PRAGMA journal_mode=DELETE")
+                finally:
+                    target.close()
+                os.replace(tmp_path, self.path)
+                return True
+            finally:
+                source.close()
+    
+    def connect(self):
+        """Open the current snapshot read-only, creating it on first use"""
+        if not os.path.exists(self.path):
+            self.refresh(force=True)
+        # immutable=1 is safe: snapshots are replaced by rename, never edited
+        return sqlite3.connect(f"file:{self.path}?mode=ro&immutable=1", uri=True, check_same_thread=False)
+
+
+# Snapshot managers shared by every ContentDatabase in this process
+_snapshots = {}
+
+# Query-result caches shared by every ContentDatabase on the same file
+_caches = {}
+
+# Cross-process result caches per database file
+_shared_caches = {}
+
+# Text codecs (loaded compression dictionaries) per database file
+_codecs = {}
+
+# Thread pools for fetch_many() per database file
+_parallel_readers = {}
+
 
 class ContentDatabase:
-    def __init__(self, db_name="contentmood.db"):
+    def __init__(self, db_name="contentmood.db", pool_size=0, read_mode="primary", snapshot_max_age=30.0,
+                 backend="sqlite", cache_bytes=64 * 1024 * 1024, maintenance_interval=0, backup_interval=0,
+                 shared_cache_bytes=0, shared_cache_dir=None, parallel_reads=0):
+        """read_mode is "primary" (read the live database) or "snapshot"
+        (read a copy refreshed every snapshot_max_age seconds); backend picks
+        the engine for read queries ("sqlite" or "duckdb", see backends.py);
+        cache_bytes is the memory budget for cached query results (0 disables);
+        shared_cache_bytes > 0 adds a cache shared by every process on the
+        host, in shared_cache_dir (default: db_name + ".cache", see cache.py);
+        maintenance_interval > 0 checks every that many seconds whether the
+        file needs ANALYZE, a checkpoint or a vacuum (see maintenance.py), and
+        with backup_interval > 0 also takes an online backup that often (see backup.py);
+        parallel_reads > 0 lets fetch_many() run that many queries at once"""
         self.db_name = db_name
         self.conn = None
         self.cursor = None
+        self.pool = ConnectionPool(db_name, pool_size) if pool_size else None
+        self._session = threading.local()
+        REGISTRY.add_collector(("database", db_name), lambda: _collect_database_metrics(db_name))
+        self._ensure_schema()
+        self.snapshot = None
+        if read_mode == "snapshot":
+            key = os.path.abspath(db_name)
+            with _schema_lock:
+                if key not in _snapshots:
+                    _snapshots[key] = SnapshotManager(db_name, snapshot_max_age).start()
+                self.snapshot = _snapshots[key]
+        elif read_mode != "primary":
+            raise ValueError(f"Unknown read_mode: {read_mode}")
+        self.backend = get_backend(self, backend)
+        self.cache = None
+        if cache_bytes:
+            key = os.path.abspath(db_name)
+            with _schema_lock:
+                if key not in _caches:
+                    _caches[key] = QueryCache(cache_bytes)
+                self.cache = _caches[key]
+        self.shared_cache = None
+        if shared_cache_bytes:
+            key = os.path.abspath(db_name)
+            with _schema_lock:
+                if key not in _shared_caches:
+                    _shared_caches[key] = SharedCache(shared_cache_dir or f"{db_name}.cache", shared_cache_bytes)
+                self.shared_cache = _shared_caches[key]
+        self.maintenance = (get_scheduler(db_name, maintenance_interval, backup_interval)
+                            if maintenance_interval else None)
+        self.parallel = None
+        if parallel_reads:
+            key = os.path.abspath(db_name)
+            with _schema_lock:
+                if key not in _parallel_readers:
+                    _parallel_readers[key] = ParallelReader(db_name, parallel_reads)
+                self.parallel = _parallel_readers[key]
+            # Sequential reads share the pooled connections too
+            if self.pool is None:
+                self.pool = self.parallel.pool
+    
+    def _ensure_schema(self):
+        """Create missing tables and triggers once per process"""
+        key = os.path.abspath(self.db_name)
+        with _schema_lock:
+            if key not in _schema_ready:
+                self.create_tables()
+                _schema_ready.add(key)
         
+    def _text_codec(self):
+        """The shared TextCodec for this file, loaded on first use"""
+        key = os.path.abspath(self.db_name)
+        with _schema_lock:
+            if key not in _codecs:
+                _codecs[key] = TextCodec(self._load_text_dictionaries)
+            return _codecs[key]
+    
+    def _load_text_dictionaries(self):
+        conn = sqlite3.connect(self.db_name)
+        try:
+            return conn.execute("SELECT id, field, codec, data FROM text_dictionaries ORDER BY id").fetchall()
+        finally:
+            conn.close()
+    
+    def encode_text(self, field, text):
+        """Stored form of a notes or emotional_tags value"""
+        return self._text_codec().encode(field, text)
+    
+    def decode_text(self, value):
+        """Text of a stored notes or emotional_tags value"""
+        return self._text_codec().decode(value)
+    
     def connect(self):
         """Establish database connection"""
         self.conn = sqlite3.connect(self.db_name)
@@ -18,9 +340,18 @@ class ContentDatabase:
         if self.conn:
             self.conn.close()
     
+    def _begin_write(self, method):
+        """Take the write lock up front so the wait can be measured"""
+        start = time.perf_counter()
+        self.cursor.execute("BEGIN IMMEDIATE")
+        WRITE_LOCK_WAIT_SECONDS.observe(time.perf_counter() - start, method=method)
+    
     def create_tables(self):
         """Create all necessary tables"""
         self.connect()
+        # Only takes effect on a new, empty file: lets maintenance.py return
+        # freed pages a few at a time instead of needing a full VACUUM
+        self.cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
         
         # Content table
         self.cursor.execute('''
@@ -52,52 +383,1361 @@ class ContentDatabase:
             )
         ''')
         
+        # Progress of file imports, committed together with each imported batch
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS import_checkpoints (
+                import_key TEXT PRIMARY KEY,
+                position INTEGER NOT NULL,
+                updated_at TIMESTAMP
+            )
+        ''')
+        
+        # What the background maintenance (see maintenance.py) did and how long it took
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS maintenance_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ran_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                step TEXT NOT NULL,
+                seconds REAL NOT NULL,
+                ok INTEGER NOT NULL,
+                detail TEXT,
+                data_version INTEGER
+            )
+        ''')
+        
+        # Rollups behind the pivot explorer (see cube.py): one row per cell of
+        # each cuboid, plus the watermarks of what has been folded in
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS cube_cells (
+                cuboid TEXT NOT NULL,
+                a TEXT NOT NULL,
+                b TEXT NOT NULL,
+                entries INTEGER NOT NULL,
+                rating_sum REAL NOT NULL,
+                rated INTEGER NOT NULL,
+                mood_change_sum REAL NOT NULL,
+                mood_changes INTEGER NOT NULL,
+                PRIMARY KEY (cuboid, a, b)
+            ) WITHOUT ROWID
+        ''')
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_cube_cells_b ON cube_cells(cuboid, b)")
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS cube_state (
+                key TEXT PRIMARY KEY,
+                value INTEGER
+            )
+        ''')
+        
+        # Compression dictionaries for notes and tags (see textstore.py), and
+        # the marker that tells update triggers a rewrite is only re-encoding
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS text_dictionaries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                field TEXT NOT NULL,
+                codec INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        self.cursor.execute("CREATE TABLE IF NOT EXISTS text_recode (active INTEGER)")
+        # Update triggers from before the guard existed are recreated below
+        for (name,) in self.cursor.execute(f'''
+            SELECT name FROM sqlite_master
+            WHERE type = 'trigger' AND name IN ({', '.join('?' * len(GUARDED_TRIGGERS))})
+              AND sql NOT LIKE '%text_recode%'
+        ''', GUARDED_TRIGGERS).fetchall():
+            self.cursor.execute(f"DROP TRIGGER {name}")
+        
+        # Note sentiment scores, keyed by a hash of the note text so identical
+        # notes are scored once, plus which hash each content row was scored at
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS note_scores (
+                notes_hash TEXT PRIMARY KEY,
+                sentiment REAL NOT NULL,
+                joy REAL NOT NULL,
+                sadness REAL NOT NULL,
+                anger REAL NOT NULL,
+                fear REAL NOT NULL,
+                calm REAL NOT NULL,
+                matched_words INTEGER NOT NULL
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS content_note_scores (
+                content_id INTEGER PRIMARY KEY,
+                notes_hash TEXT NOT NULL
+            )
+        ''')
+        # Edited or deleted notes lose their mapping and are picked up as pending
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS content_notes_rescore
+            AFTER UPDATE OF notes ON content
+            WHEN OLD.notes IS NOT NEW.notes AND NOT EXISTS (SELECT 1 FROM text_recode)
+            BEGIN
+                DELETE FROM content_note_scores WHERE content_id = NEW.id;
+            END
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS content_notes_forget
+            AFTER DELETE ON content
+            BEGIN
+                DELETE FROM content_note_scores WHERE content_id = OLD.id;
+            END
+        ''')
+        
+        # Fitted state of the online models in predictor.py, and the last
+        # mood log id each one has learned from
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS model_state (
+                name TEXT PRIMARY KEY,
+                weights BLOB NOT NULL,
+                covariance BLOB NOT NULL,
+                updates INTEGER NOT NULL,
+                trained_through INTEGER NOT NULL
+            )
+        ''')
+        
+        # Indexes for the newest-first listing and the content/mood join
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_content_date_consumed ON content(date_consumed)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_mood_logs_content_id ON mood_logs(content_id)")
+        
+        # Indexes behind the sidebar filters
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_content_type_date ON content(content_type, date_consumed)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_content_genre_date ON content(genre, date_consumed)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_content_rating ON content(rating)")
+        
+        # Data version, bumped by triggers on every change so readers such as
+        # the HTTP API can tell whether anything moved since their last look
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS db_meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+        ''')
+        self.cursor.execute("INSERT OR IGNORE INTO db_meta (key, value) VALUES ('data_version', 0)")
+        for table in ("content", "mood_logs"):
+            for event in ("INSERT", "UPDATE", "DELETE"):
+                guard = f"WHEN {RECODE_GUARD}" if event == "UPDATE" else ""
+                self.cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_version
+                    AFTER {event} ON {table} {guard}
+                    BEGIN
+                        UPDATE db_meta SET value = value + 1 WHERE key = 'data_version';
+                    END
+                ''')
+            # Separate counter for in-place changes, so mirrors know when
+            # copying the newly appended ids is not enough
+            self.cursor.execute("INSERT OR IGNORE INTO db_meta (key, value) VALUES (?, 0)", (f"{table}_rewrites",))
+            for event in ("UPDATE", "DELETE"):
+                guard = f"WHEN {RECODE_GUARD}" if event == "UPDATE" else ""
+                self.cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_rewrites
+                    AFTER {event} ON {table} {guard}
+                    BEGIN
+                        UPDATE db_meta SET value = value + 1 WHERE key = '{table}_rewrites';
+                    END
+                ''')
+        
+        self._create_sync_tables()
+        self._create_activity_tables()
+        self._create_session_tables()
+        
         self.conn.commit()
         self.close()
     
+    def _create_sync_tables(self):
+        """Change log and row identities used by sync.py to merge databases
+        
+        Every insert, update and delete on content and mood_logs appends to
+        change_log. sync_rows gives each row a global identity (the device
+        that created it plus its id there) and the version of its last change
+        (timestamp, device), which decides conflicts: the later version wins.
+        While apply_changes() runs, sync_apply holds the identity and version
+        of the incoming change so the triggers record it instead of a local one.
+        """
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sync_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        ''')
+        self.cursor.execute("INSERT OR IGNORE INTO sync_meta (key, value) VALUES ('device_id', ?)",
+                            (uuid.uuid4().hex,))
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS change_log (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                table_name TEXT NOT NULL,
+                local_id INTEGER NOT NULL,
+                op TEXT NOT NULL,
+                origin TEXT NOT NULL
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sync_rows (
+                table_name TEXT NOT NULL,
+                origin TEXT NOT NULL,
+                origin_id INTEGER NOT NULL,
+                local_id INTEGER,
+                version_at TEXT NOT NULL,
+                version_origin TEXT NOT NULL,
+                deleted INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (table_name, origin, origin_id),
+                UNIQUE (table_name, local_id)
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sync_apply (
+                row_origin TEXT NOT NULL,
+                row_origin_id INTEGER NOT NULL,
+                version_at TEXT NOT NULL,
+                version_origin TEXT NOT NULL
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sync_peers (
+                peer_id TEXT PRIMARY KEY,
+                last_seq INTEGER NOT NULL
+            )
+        ''')
+        
+        device = "(SELECT value FROM sync_meta WHERE key = 'device_id')"
+        origin = f"COALESCE((SELECT version_origin FROM sync_apply), {device})"
+        now = "COALESCE((SELECT version_at FROM sync_apply), strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))"
+        for table in ("content", "mood_logs"):
+            # Once the insert trigger exists it gives every new row its identity:
+            # only a file that predates it can have rows to adopt, and scanning
+            # for them on every start holds up other workers opening the file
+            trigger = self.cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = ?",
+                                          (f"{table}_insert_sync",)).fetchone()
+            if trigger is None:
+                self._adopt_existing_rows(table)
+            self.cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_insert_sync
+                AFTER INSERT ON {table}
+                BEGIN
+                    INSERT INTO change_log (table_name, local_id, op, origin)
+                    VALUES ('{table}', NEW.id, 'I', {origin});
+                    INSERT OR REPLACE INTO sync_rows
+                        (table_name, origin, origin_id, local_id, version_at, version_origin, deleted)
+                    VALUES ('{table}', COALESCE((SELECT row_origin FROM sync_apply), {device}),
+                            COALESCE((SELECT row_origin_id FROM sync_apply), NEW.id),
+                            NEW.id, {now}, {origin}, 0);
+                END
+            ''')
+            for event, op, deleted in (("UPDATE", "U", 0), ("DELETE", "D", 1)):
+                row = "NEW" if event == "UPDATE" else "OLD"
+                guard = f"WHEN {RECODE_GUARD}" if event == "UPDATE" else ""
+                self.cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_sync
+                    AFTER {event} ON {table} {guard}
+                    BEGIN
+                        INSERT INTO change_log (table_name, local_id, op, origin)
+                        VALUES ('{table}', {row}.id, '{op}', {origin});
+                        UPDATE sync_rows SET version_at = {now}, version_origin = {origin}, deleted = {deleted}
+                        WHERE table_name = '{table}' AND local_id = {row}.id;
+                    END
+                ''')
+    
+    def _create_activity_tables(self):
+        """Counters behind streaks and goals, kept current by triggers on content
+        
+        daily_activity counts entries per day, activity_runs holds each streak
+        as a (start_day, end_day) run of consecutive active days, and
+        period_counts counts entries per week, month and year by content type.
+        Every insert, delete or re-dated entry adjusts them in place, in any
+        date order, so the Dashboard reads streaks and goal progress with a
+        few index lookups instead of scanning content.
+        """
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS daily_activity (
+                day TEXT PRIMARY KEY,
+                entries INTEGER NOT NULL
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS activity_runs (
+                start_day TEXT PRIMARY KEY,
+                end_day TEXT NOT NULL
+            )
+        ''')
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_activity_runs_end ON activity_runs(end_day)")
+        self.cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_activity_runs_length ON activity_runs({RUN_LENGTH}, start_day)")
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS period_counts (
+                period TEXT NOT NULL,
+                content_type TEXT NOT NULL,
+                entries INTEGER NOT NULL,
+                PRIMARY KEY (period, content_type)
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS goals (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                period TEXT NOT NULL CHECK (period IN ('week', 'month', 'year')),
+                content_type TEXT,
+                target INTEGER NOT NULL CHECK (target > 0),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        self.cursor.execute("INSERT OR IGNORE INTO db_meta (key, value) VALUES ('goals_version', 0)")
+        
+        insert_trigger = self.cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'content_insert_activity'").fetchone()
+        if insert_trigger is not None and "'weekday 1'" in insert_trigger[0]:
+            return
+        if insert_trigger is None:
+            # First run on this file: build the counters from existing content
+            # in bulk, then let the triggers below take over
+            self.cursor.execute("DELETE FROM daily_activity")
+            self.cursor.execute("DELETE FROM activity_runs")
+            self.cursor.execute('''
+                INSERT INTO daily_activity (day, entries)
+                SELECT date(date_consumed), COUNT(*) FROM content
+                WHERE date(date_consumed) IS NOT NULL
+                GROUP BY date(date_consumed)
+            ''')
+            self.cursor.execute('''
+                INSERT INTO activity_runs (start_day, end_day)
+                SELECT MIN(day), MAX(day) FROM (
+                    SELECT day, julianday(day) - ROW_NUMBER() OVER (ORDER BY day) AS island FROM daily_activity
+                )
+                GROUP BY island
+            ''')
+        else:
+            # Period keys from an older layout: recount the periods under the
+            # current keys; days and runs are unaffected
+            for trigger in ("content_insert_activity", "content_delete_activity", "content_redate_activity"):
+                self.cursor.execute(f"DROP TRIGGER {trigger}")
+        self.cursor.execute("DELETE FROM period_counts")
+        for period in PERIOD_KEYS.values():
+            self.cursor.execute(f'''
+                INSERT INTO period_counts (period, content_type, entries)
+                SELECT {period.format(day="date(date_consumed)")}, COALESCE(content_type, ''), COUNT(*)
+                FROM content
+                WHERE date(date_consumed) IS NOT NULL
+                GROUP BY 1, 2
+            ''')
+        
+        def count_entry(row, step):
+            """Trigger statements adding step (1 or -1) to the counters for row"""
+            day = f"date({row}.date_consumed)"
+            statements = [f'''
+                INSERT INTO daily_activity (day, entries) SELECT {day}, {step} WHERE {day} IS NOT NULL
+                ON CONFLICT(day) DO UPDATE SET entries = entries + {step};
+            ''']
+            for period in PERIOD_KEYS.values():
+                key, content_type = period.format(day=day), f"COALESCE({row}.content_type, '')"
+                statements.append(f'''
+                    INSERT INTO period_counts (period, content_type, entries)
+                    SELECT {key}, {content_type}, {step} WHERE {day} IS NOT NULL
+                    ON CONFLICT(period, content_type) DO UPDATE SET entries = entries + {step};
+                ''')
+                if step < 0:
+                    statements.append(f"DELETE FROM period_counts WHERE period = {key} "
+                                      f"AND content_type = {content_type} AND entries <= 0;")
+            if step < 0:
+                statements.append(f"DELETE FROM daily_activity WHERE day = {day} AND entries <= 0;")
+            return "".join(statements)
+        
+        # A day becoming active joins the runs ending the day before and
+        # starting the day after; a day going quiet splits its run in two
+        containing_run = ("(SELECT start_day FROM activity_runs WHERE start_day <= OLD.day "
+                          "ORDER BY start_day DESC LIMIT 1)")
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS daily_activity_start
+            AFTER INSERT ON daily_activity
+            BEGIN
+                UPDATE activity_runs
+                SET end_day = COALESCE((SELECT r.end_day FROM activity_runs r
+                                        WHERE r.start_day = date(NEW.day, '+1 day')), NEW.day)
+                WHERE end_day = date(NEW.day, '-1 day');
+                DELETE FROM activity_runs
+                WHERE start_day = date(NEW.day, '+1 day')
+                  AND EXISTS (SELECT 1 FROM activity_runs l
+                              WHERE l.end_day = activity_runs.end_day AND l.start_day < NEW.day);
+                UPDATE activity_runs SET start_day = NEW.day WHERE start_day = date(NEW.day, '+1 day');
+                INSERT INTO activity_runs (start_day, end_day)
+                SELECT NEW.day, NEW.day
+                WHERE COALESCE((SELECT end_day FROM activity_runs WHERE start_day <= NEW.day
+                                ORDER BY start_day DESC LIMIT 1), '') < NEW.day;
+            END
+        ''')
+        self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS daily_activity_end
+            AFTER DELETE ON daily_activity
+            BEGIN
+                INSERT INTO activity_runs (start_day, end_day)
+                SELECT date(OLD.day, '+1 day'), end_day FROM activity_runs
+                WHERE start_day = {containing_run} AND end_day > OLD.day;
+                UPDATE activity_runs SET end_day = date(OLD.day, '-1 day')
+                WHERE start_day = {containing_run} AND start_day < OLD.day;
+                DELETE FROM activity_runs WHERE start_day = OLD.day;
+            END
+        ''')
+        self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS content_delete_activity
+            AFTER DELETE ON content
+            BEGIN
+                {count_entry("OLD", -1)}
+            END
+        ''')
+        self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS content_redate_activity
+            AFTER UPDATE OF date_consumed, content_type ON content
+            WHEN OLD.date_consumed IS NOT NEW.date_consumed OR OLD.content_type IS NOT NEW.content_type
+            BEGIN
+                {count_entry("OLD", -1)}
+                {count_entry("NEW", 1)}
+            END
+        ''')
+        # Created last: its presence marks the backfill above as done
+        self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS content_insert_activity
+            AFTER INSERT ON content
+            BEGIN
+                {count_entry("NEW", 1)}
+            END
+        ''')
+    
+    def _create_session_tables(self):
+        """Progress checkpoints logged while consuming a series, and their per-item rollups
+        
+        session_events only grows, and only at its end: rows arrive in
+        batches from add_session_events, and its one (covering) index keeps
+        an item's checkpoints together for the mood curves. session_rollups holds each
+        item's running totals, upserted once per item per batch in the same
+        transaction, so listings never aggregate the events. Checkpoints bump
+        sessions_version instead of data_version, so logging one leaves every
+        cached chart query valid (deleting content moves data_version, which
+        session reads check too).
+        """
+        # No AUTOINCREMENT: it would cost a sqlite_sequence update per row
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS session_events (
+                id INTEGER PRIMARY KEY,
+                content_id INTEGER NOT NULL,
+                logged_at TIMESTAMP NOT NULL,
+                chapter INTEGER,
+                episode INTEGER,
+                minutes REAL,
+                mood INTEGER NOT NULL,
+                FOREIGN KEY (content_id) REFERENCES content(id)
+            )
+        ''')
+        # Covering, so a curve is one contiguous range of the index rather
+        # than a page read per checkpoint scattered through the table
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_session_events_content
+            ON session_events(content_id, logged_at, chapter, episode, minutes, mood)
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS session_rollups (
+                content_id INTEGER PRIMARY KEY,
+                events INTEGER NOT NULL,
+                minutes REAL NOT NULL,
+                mood_sum INTEGER NOT NULL,
+                min_mood INTEGER NOT NULL,
+                max_mood INTEGER NOT NULL,
+                first_at TIMESTAMP NOT NULL,
+                first_mood INTEGER NOT NULL,
+                last_at TIMESTAMP NOT NULL,
+                last_mood INTEGER NOT NULL,
+                last_chapter INTEGER,
+                last_episode INTEGER
+            )
+        ''')
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_session_rollups_last ON session_rollups(last_at)")
+        self.cursor.execute("INSERT OR IGNORE INTO db_meta (key, value) VALUES ('sessions_version', 0)")
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS content_delete_sessions
+            AFTER DELETE ON content
+            BEGIN
+                DELETE FROM session_events WHERE content_id = OLD.id;
+                DELETE FROM session_rollups WHERE content_id = OLD.id;
+            END
+        ''')
+    
+    def _adopt_existing_rows(self, table):
+        """Give rows written before change capture existed a sync identity
+        
+        The identity is derived from the row's contents, so copies of one
+        database file that were never synced still agree on the rows they
+        share instead of exchanging them as duplicates.
+        """
+        rows = self.cursor.execute(f'''
+            SELECT t.id, t.created_at, t.* FROM {table} t
+            WHERE NOT EXISTS (SELECT 1 FROM sync_rows s WHERE s.table_name = '{table}' AND s.local_id = t.id)
+            ORDER BY t.id
+        ''').fetchall()
+        if not rows:
+            return
+        adopted = []
+        for row in rows:
+            digest = hashlib.sha1(repr(row[2:]).encode("utf-8")).hexdigest()[:16]
+            created_at = row[1] or "1970-01-01 00:00:00"
+            adopted.append((table, f"legacy-{digest}", row[0], row[0],
+                            created_at.replace(" ", "T") + ".000Z", f"legacy-{digest}"))
+        self.cursor.executemany('''
+            INSERT INTO sync_rows (table_name, origin, origin_id, local_id, version_at, version_origin)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', adopted)
+        self.cursor.executemany(
+            "INSERT INTO change_log (table_name, local_id, op, origin) VALUES (?, ?, 'I', ?)",
+            [(table, row[3], row[5]) for row in adopted])
+    
+    def _written(self):
+        """Bookkeeping after a committed write"""
+        if self.snapshot is not None:
+            # Let the writer's own session see its change without waiting a full period
+            self.snapshot.request_refresh()
+        if self.cache is not None:
+            # Old entries can no longer be hit (the version moved on); free them now
+            self.cache.clear()
+    
+    def get_data_version(self):
+        """Counter that changes whenever content, mood_logs or note scores change"""
+        with self._reader() as conn:
+            row = conn.execute("SELECT value FROM db_meta WHERE key = 'data_version'").fetchone()
+        return row[0] if row else 0
+    
+    def get_sessions_version(self):
+        """Counter that changes whenever progress checkpoints are logged"""
+        return self._versions(("sessions_version",))[0]
+    
+    @track_query
     def add_content(self, title, content_type, genre, creator, release_year, 
                    date_consumed, rating, notes=""):
         """Add new content entry"""
         self.connect()
+        self._begin_write("add_content")
         self.cursor.execute('''
             INSERT INTO content (title, content_type, genre, creator, release_year, 
                                date_consumed, rating, notes)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (title, content_type, genre, creator, release_year, date_consumed, rating, notes))
+        ''', (title, content_type, genre, creator, release_year, date_consumed, rating,
+              self.encode_text("notes", notes)))
         self.conn.commit()
         content_id = self.cursor.lastrowid
         self.close()
+        self._written()
         return content_id
     
+    @track_query
     def add_mood_log(self, content_id, mood_before, mood_after, emotional_tags, log_date):
         """Add mood log for content"""
         self.connect()
+        self._begin_write("add_mood_log")
         self.cursor.execute('''
             INSERT INTO mood_logs (content_id, mood_before, mood_after, emotional_tags, log_date)
             VALUES (?, ?, ?, ?, ?)
-        ''', (content_id, mood_before, mood_after, emotional_tags, log_date))
+        ''', (content_id, mood_before, mood_after, self.encode_text("emotional_tags", emotional_tags), log_date))
+        self._learn_mood_log(self.cursor.lastrowid, content_id, mood_before, mood_after)
         self.conn.commit()
         self.close()
+        self._written()
     
-    def get_all_content(self):
-        """Retrieve all content entries"""
+    def _learn_mood_log(self, log_id, content_id, mood_before, mood_after):
+        """Fold a just-inserted mood log into the stored predictor, in the same transaction
+        
+        Only when the model is current up to this log; otherwise the gap
+        (imports, synced rows) is filled in bulk by the next load_predictor.
+        """
+        if mood_before is None or mood_after is None:
+            return
+        from predictor import MODEL_NAME, MoodPredictor
+        state = self.cursor.execute(
+            "SELECT weights, covariance, updates, trained_through FROM model_state WHERE name = ?",
+            (MODEL_NAME,)).fetchone()
+        if state is None:
+            return
+        row = self.cursor.execute('''
+            SELECT c.genre, c.content_type, c.creator, c.rating,
+                   EXISTS (SELECT 1 FROM mood_logs m JOIN content mc ON mc.id = m.content_id
+                           WHERE m.id > ? AND m.id < ?
+                             AND m.mood_before IS NOT NULL AND m.mood_after IS NOT NULL)
+            FROM content c WHERE c.id = ?
+        ''', (state[3], log_id, content_id)).fetchone()
+        if row is None or row[4]:
+            return
+        model = MoodPredictor.from_state(state)
+        model.update(row[0], row[1], row[2], row[3], mood_before, mood_after, log_id=log_id)
+        self.cursor.execute(
+            "UPDATE model_state SET weights = ?, covariance = ?, updates = ?, trained_through = ? WHERE name = ?",
+            model.to_state() + (MODEL_NAME,))
+    
+    @track_query
+    def add_entries(self, entries, checkpoint=None):
+        """Add many content entries (with optional mood logs) in one transaction
+        
+        Each entry is a dict keyed by CONTENT_FIELDS and, optionally, MOOD_FIELDS.
+        A mood log is written when any mood field is present. checkpoint is an
+        optional (import_key, position) pair recorded in the same transaction so
+        an interrupted import can resume exactly where it stopped. Returns the
+        new ids.
+        """
+        entries = list(entries)
         self.connect()
-        df = pd.read_sql_query("SELECT * FROM content ORDER BY date_consumed DESC", self.conn)
+        try:
+            self._begin_write("add_entries")
+            # We hold the write lock, so ids can be assigned up front and both
+            # tables filled with executemany instead of a round trip per row
+            next_id = self.cursor.execute('''
+                SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'content'), 0),
+                           COALESCE((SELECT MAX(id) FROM content), 0)) + 1
+            ''').fetchone()[0]
+            content_ids = list(range(next_id, next_id + len(entries)))
+            self.cursor.executemany('''
+                INSERT INTO content (id, title, content_type, genre, creator, release_year,
+                                     date_consumed, rating, notes)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [[content_id] + [self.encode_text(field, entry.get(field)) if field == "notes" else entry.get(field)
+                                for field in CONTENT_FIELDS]
+                  for content_id, entry in zip(content_ids, entries)])
+            self.cursor.executemany('''
+                INSERT INTO mood_logs (content_id, mood_before, mood_after, emotional_tags, log_date)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(content_id, entry.get("mood_before"), entry.get("mood_after"),
+                   self.encode_text("emotional_tags", entry.get("emotional_tags")),
+                   entry.get("log_date") or entry["date_consumed"])
+                  for content_id, entry in zip(content_ids, entries)
+                  if any(entry.get(field) is not None for field in MOOD_FIELDS)])
+            if checkpoint is not None:
+                self.cursor.execute('''
+                    INSERT INTO import_checkpoints (import_key, position, updated_at)
+                    VALUES (?, ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT(import_key) DO UPDATE SET
+                        position = excluded.position, updated_at = excluded.updated_at
+                ''', checkpoint)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            self.close()
+        self._written()
+        return content_ids
+    
+    def get_import_checkpoint(self, import_key):
+        """Number of source records already imported for import_key"""
+        self.connect()
+        row = self.cursor.execute(
+            "SELECT position FROM import_checkpoints WHERE import_key = ?", (import_key,)
+        ).fetchone()
         self.close()
-        return df
+        return row[0] if row else 0
     
-    def get_all_moods(self):
-        """Retrieve all mood logs"""
+    @track_query
+    def add_session_events(self, events):
+        """Log progress checkpoints in one transaction; returns their new ids
+        
+        Each event is a dict with content_id and mood (1-10), and optionally
+        logged_at (default now), chapter, episode and minutes (time spent since
+        the previous checkpoint). Checkpoints may arrive out of order: the
+        rollups' first and last values follow logged_at. Raises ValueError,
+        writing nothing, when a content_id is not in content.
+        """
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        rows = [(event["content_id"], str(event.get("logged_at") or now), event.get("chapter"),
+                 event.get("episode"), event.get("minutes"), int(event["mood"])) for event in events]
+        if not rows:
+            return []
+        # One rollup row per item for the whole batch
+        totals = {}
+        for content_id, logged_at, chapter, episode, minutes, mood in rows:
+            total = totals.get(content_id)
+            if total is None:
+                totals[content_id] = [1, minutes or 0.0, mood, mood, mood, logged_at, mood,
+                                      logged_at, mood, chapter, episode]
+                continue
+            total[0] += 1
+            total[1] += minutes or 0.0
+            total[2] += mood
+            total[3] = min(total[3], mood)
+            total[4] = max(total[4], mood)
+            if logged_at < total[5]:
+                total[5:7] = [logged_at, mood]
+            if logged_at >= total[7]:
+                total[7:] = [logged_at, mood, chapter, episode]
         self.connect()
-        df = pd.read_sql_query("SELECT * FROM mood_logs ORDER BY log_date DESC", self.conn)
+        try:
+            self._begin_write("add_session_events")
+            wanted = list(totals)
+            known = {row[0] for start in range(0, len(wanted), 500) for row in self.cursor.execute(
+                f"SELECT id FROM content WHERE id IN ({', '.join('?' * len(wanted[start:start + 500]))})",
+                wanted[start:start + 500])}
+            unknown = [content_id for content_id in wanted if content_id not in known]
+            if unknown:
+                raise ValueError(f"unknown content_id: {', '.join(map(str, sorted(unknown)))}")
+            # As in add_entries: with the write lock held, ids can be assigned up front
+            next_id = self.cursor.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM session_events").fetchone()[0]
+            event_ids = list(range(next_id, next_id + len(rows)))
+            self.cursor.executemany('''
+                INSERT INTO session_events (id, content_id, logged_at, chapter, episode, minutes, mood)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', [(event_id, *row) for event_id, row in zip(event_ids, rows)])
+            # SET expressions all see the row as it was before this update
+            self.cursor.executemany('''
+                INSERT INTO session_rollups (content_id, events, minutes, mood_sum, min_mood, max_mood,
+                                             first_at, first_mood, last_at, last_mood, last_chapter, last_episode)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(content_id) DO UPDATE SET
+                    events = events + excluded.events,
+                    minutes = minutes + excluded.minutes,
+                    mood_sum = mood_sum + excluded.mood_sum,
+                    min_mood = MIN(min_mood, excluded.min_mood),
+                    max_mood = MAX(max_mood, excluded.max_mood),
+                    first_at = MIN(first_at, excluded.first_at),
+                    first_mood = CASE WHEN excluded.first_at < first_at THEN excluded.first_mood ELSE first_mood END,
+                    last_at = MAX(last_at, excluded.last_at),
+                    last_mood = CASE WHEN excluded.last_at >= last_at THEN excluded.last_mood ELSE last_mood END,
+                    last_chapter = CASE WHEN excluded.last_at >= last_at THEN excluded.last_chapter ELSE last_chapter END,
+                    last_episode = CASE WHEN excluded.last_at >= last_at THEN excluded.last_episode ELSE last_episode END
+            ''', [(content_id, *total) for content_id, total in totals.items()])
+            self.cursor.execute("UPDATE db_meta SET value = value + 1 WHERE key = 'sessions_version'")
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            self.close()
+        # Not _written(): results cached on data_version are still current
+        if self.snapshot is not None:
+            self.snapshot.request_refresh()
+        return event_ids
+    
+    def get_unscored_notes(self, after_id=0, limit=10000):
+        """(content_id, notes) for non-empty notes without a current score, by id"""
+        self.connect()
+        rows = self.cursor.execute('''
+            SELECT c.id, c.notes
+            FROM content c
+            LEFT JOIN content_note_scores s ON s.content_id = c.id
+            WHERE c.id > ? AND s.content_id IS NULL AND c.notes IS NOT NULL AND c.notes != ''
+            ORDER BY c.id
+            LIMIT ?
+        ''', (after_id, limit)).fetchall()
         self.close()
-        return df
+        return [(content_id, self.decode_text(notes)) for content_id, notes in rows]
     
-    def get_content_with_moods(self):
-        """Get content joined with mood data"""
+    def get_scored_hashes(self, hashes):
+        """Subset of hashes that already have note scores"""
         self.connect()
-        query = '''
-            SELECT 
+        known = set()
+        hashes = list(hashes)
+        for start in range(0, len(hashes), 500):
+            chunk = hashes[start:start + 500]
+            known.update(row[0] for row in self.cursor.execute(
+                f"SELECT notes_hash FROM note_scores WHERE notes_hash IN ({', '.join('?' * len(chunk))})",
+                chunk))
+        self.close()
+        return known
+    
+    @track_query
+    def save_note_scores(self, scores, assignments):
+        """Store new note scores (notes_hash, sentiment, joy, sadness, anger, fear,
+        calm, matched_words) and the (content_id, notes_hash) they apply to"""
+        self.connect()
+        self._begin_write("save_note_scores")
+        try:
+            self.cursor.executemany(
+                "INSERT OR IGNORE INTO note_scores VALUES (?, ?, ?, ?, ?, ?, ?, ?)", scores)
+            self.cursor.executemany(
+                "INSERT OR REPLACE INTO content_note_scores (content_id, notes_hash) VALUES (?, ?)",
+                assignments)
+            # One bump per batch rather than a trigger per row
+            self.cursor.execute("UPDATE db_meta SET value = value + 1 WHERE key = 'data_version'")
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            self.close()
+        self._written()
+    
+    def get_model_state(self, name):
+        """(weights, covariance, updates, trained_through) stored for a model, or None"""
+        self.connect()
+        row = self.cursor.execute(
+            "SELECT weights, covariance, updates, trained_through FROM model_state WHERE name = ?",
+            (name,)).fetchone()
+        self.close()
+        return row
+    
+    @track_query
+    def save_model_state(self, name, state):
+        """Store a model's (weights, covariance, updates, trained_through)"""
+        self.connect()
+        self._begin_write("save_model_state")
+        self.cursor.execute('''
+            INSERT INTO model_state (name, weights, covariance, updates, trained_through)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET
+                weights = excluded.weights, covariance = excluded.covariance,
+                updates = excluded.updates, trained_through = excluded.trained_through
+        ''', (name,) + tuple(state))
+        self.conn.commit()
+        self.close()
+    
+    def get_training_rows(self, after_id=0, limit=50000):
+        """(log_id, genre, content_type, creator, rating, mood_before, mood_after)
+        for complete mood logs after after_id, by id"""
+        self.connect()
+        rows = self.cursor.execute('''
+            SELECT m.id, c.genre, c.content_type, c.creator, c.rating, m.mood_before, m.mood_after
+            FROM mood_logs m
+            JOIN content c ON c.id = m.content_id
+            WHERE m.id > ? AND m.mood_before IS NOT NULL AND m.mood_after IS NOT NULL
+            ORDER BY m.id
+            LIMIT ?
+        ''', (after_id, limit)).fetchall()
+        self.close()
+        return rows
+    
+    def get_text_samples(self, table, limit):
+        """Up to limit random non-empty notes (content) or emotional_tags (mood_logs)"""
+        column = TEXT_COLUMNS[table]
+        self.connect()
+        rows = self.cursor.execute(f'''
+            SELECT {column} FROM {table}
+            WHERE {column} IS NOT NULL AND {column} != ''
+            ORDER BY random()
+            LIMIT ?
+        ''', (limit,)).fetchall()
+        self.close()
+        return [self.decode_text(value) for (value,) in rows]
+    
+    @track_query
+    def save_text_dictionary(self, field, codec, data):
+        """Store a compression dictionary; new field values are encoded with it"""
+        self.connect()
+        self._begin_write("save_text_dictionary")
+        self.cursor.execute(
+            "INSERT INTO text_dictionaries (field, codec, data) VALUES (?, ?, ?)", (field, codec, data))
+        self.conn.commit()
+        dictionary_id = self.cursor.lastrowid
+        self.close()
+        self._text_codec().reload()
+        return dictionary_id
+    
+    @track_query
+    def recompress_texts(self, table, after_id=0, limit=5000):
+        """Encode uncompressed text of up to limit rows after after_id, by id
+        
+        Returns (last id scanned, values rewritten); the id is None once no
+        rows are left. Re-encoding leaves data_version, the change log and
+        note scores untouched. Values are encoded before the write lock is
+        taken, so a row edited in between keeps its edit and is left for the
+        next pass.
+        """
+        column = TEXT_COLUMNS[table]
+        self.connect()
+        rows = self.cursor.execute(f'''
+            SELECT id, {column} FROM {table} WHERE id > ? ORDER BY id LIMIT ?
+        ''', (after_id, limit)).fetchall()
+        if not rows:
+            self.close()
+            return None, 0
+        updates = []
+        for row_id, value in rows:
+            if isinstance(value, str) and value:
+                encoded = self.encode_text(column, value)
+                if encoded is not value:
+                    updates.append((encoded, row_id, value))
+        rewritten = 0
+        if updates:
+            self._begin_write("recompress_texts")
+            try:
+                self.cursor.execute("INSERT INTO text_recode (active) VALUES (1)")
+                self.cursor.executemany(f"UPDATE {table} SET {column} = ? WHERE id = ? AND {column} = ?", updates)
+                rewritten = self.cursor.rowcount
+                self.cursor.execute("DELETE FROM text_recode")
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+        self.close()
+        return rows[-1][0], rewritten
+    
+    def get_text_stats(self):
+        """{column: (values, stored bytes, text bytes)} for each compressed column"""
+        stats = {}
+        codec = self._text_codec()
+        with self._reader() as conn:
+            for table, column in TEXT_COLUMNS.items():
+                values = stored = raw = 0
+                for (value,) in conn.execute(f"SELECT {column} FROM {table} WHERE {column} IS NOT NULL"):
+                    values += 1
+                    if isinstance(value, bytes):
+                        stored += len(value)
+                        raw += len(codec.decode(value).encode("utf-8"))
+                    else:
+                        size = len(str(value).encode("utf-8"))
+                        stored += size
+                        raw += size
+                stats[column] = (values, stored, raw)
+        return stats
+    
+    @track_query
+    def vacuum(self):
+        """Rebuild the file to return pages freed by compression to the filesystem"""
+        self.connect()
+        self.cursor.execute("VACUUM")
+        self.close()
+    
+    @track_query
+    def apply_cube_delta(self, cells, expected, state, reset=False):
+        """Add cells (cuboid, a, b, entries, rating_sum, rated, mood_change_sum,
+        mood_changes) to the cube and move its watermarks from expected to state
+        
+        reset empties the cube first. Returns False, writing nothing, when the
+        stored watermarks are no longer expected (another process got there first).
+        """
+        self.connect()
+        self._begin_write("apply_cube_delta")
+        try:
+            if dict(self.cursor.execute("SELECT key, value FROM cube_state").fetchall()) != expected:
+                self.conn.rollback()
+                return False
+            if reset:
+                self.cursor.execute("DELETE FROM cube_cells")
+            self.cursor.executemany('''
+                INSERT INTO cube_cells VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(cuboid, a, b) DO UPDATE SET
+                    entries = entries + excluded.entries,
+                    rating_sum = rating_sum + excluded.rating_sum,
+                    rated = rated + excluded.rated,
+                    mood_change_sum = mood_change_sum + excluded.mood_change_sum,
+                    mood_changes = mood_changes + excluded.mood_changes
+            ''', cells)
+            self.cursor.execute("DELETE FROM cube_state")
+            self.cursor.executemany("INSERT INTO cube_state (key, value) VALUES (?, ?)", state.items())
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            self.close()
+        return True
+    
+    def get_device_id(self):
+        """Identity of this database in sync (see sync.py)"""
+        self.connect()
+        row = self.cursor.execute("SELECT value FROM sync_meta WHERE key = 'device_id'").fetchone()
+        self.close()
+        return row[0]
+    
+    def reset_device_id(self):
+        """Give this database a new sync identity after copying the file
+        
+        The copy already holds every change of the database it was copied
+        from, so syncing the two afterwards only exchanges what changed since.
+        """
+        device_id = uuid.uuid4().hex
+        self.connect()
+        self._begin_write("reset_device_id")
+        old_id = self.cursor.execute("SELECT value FROM sync_meta WHERE key = 'device_id'").fetchone()[0]
+        copied_at = self.cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+        self.cursor.executemany("INSERT OR REPLACE INTO sync_meta (key, value) VALUES (?, ?)", [
+            ("device_id", device_id), ("copied_from", old_id), ("copied_at_seq", str(copied_at)),
+        ])
+        self.cursor.execute("INSERT OR REPLACE INTO sync_peers (peer_id, last_seq) VALUES (?, ?)",
+                            (old_id, copied_at))
+        self.conn.commit()
+        self.close()
+        return device_id
+    
+    def get_sync_cursor(self, peer_id):
+        """Last change_log seq of peer_id already applied here"""
+        self.connect()
+        row = self.cursor.execute("SELECT last_seq FROM sync_peers WHERE peer_id = ?", (peer_id,)).fetchone()
+        self.close()
+        return row[0] if row else 0
+    
+    def export_changes(self, since_seq=0, exclude_origin=None, limit=5000):
+        """Rows changed after since_seq, in their current state
+        
+        Covers at most `limit` change_log entries; a row changed several
+        times is sent once. Rows whose latest version came from
+        exclude_origin (the peer asking) are left out. Returns a dict with
+        this device_id, the last_seq covered and the list of changes.
+        """
+        self.connect()
+        try:
+            meta = dict(self.cursor.execute("SELECT key, value FROM sync_meta").fetchall())
+            if exclude_origin is not None and exclude_origin == meta.get("copied_from"):
+                # Everything up to the copy came from the peer in the first place
+                since_seq = max(since_seq, int(meta["copied_at_seq"]))
+            row = self.cursor.execute(
+                "SELECT seq FROM change_log WHERE seq > ? ORDER BY seq LIMIT 1 OFFSET ?",
+                (since_seq, limit - 1)).fetchone()
+            last_seq = row[0] if row else self.cursor.execute(
+                "SELECT COALESCE(MAX(seq), ?) FROM change_log", (since_seq,)).fetchone()[0]
+            changes = []
+            for table, fields, extra_select, extra_join in (
+                ("content", CONTENT_FIELDS, "", ""),
+                ("mood_logs", MOOD_FIELDS,
+                 ", cs.origin, cs.origin_id",
+                 "LEFT JOIN sync_rows cs ON cs.table_name = 'content' AND cs.local_id = t.content_id"),
+            ):
+                columns = ", ".join(f"t.{field}" for field in fields)
+                rows = self.cursor.execute(f'''
+                    SELECT s.origin, s.origin_id, s.version_at, s.version_origin, s.deleted,
+                           {columns}{extra_select}
+                    FROM (SELECT DISTINCT local_id FROM change_log
+                          WHERE table_name = ? AND seq > ? AND seq <= ?) l
+                    JOIN sync_rows s ON s.table_name = ? AND s.local_id = l.local_id
+                    LEFT JOIN {table} t ON t.id = l.local_id AND s.deleted = 0
+                    {extra_join}
+                    WHERE s.version_origin IS NOT ?
+                    ORDER BY s.version_at, s.origin, s.origin_id
+                ''', (table, since_seq, last_seq, table, exclude_origin)).fetchall()
+                for row in rows:
+                    change = {"table": table, "origin": row[0], "origin_id": row[1],
+                              "version_at": row[2], "version_origin": row[3], "deleted": bool(row[4])}
+                    if not row[4]:
+                        change["row"] = dict(zip(fields, row[5:5 + len(fields)]))
+                        text_field = TEXT_COLUMNS[table]
+                        change["row"][text_field] = self.decode_text(change["row"][text_field])
+                        if table == "mood_logs":
+                            change["content"] = list(row[5 + len(fields):])
+                    changes.append(change)
+        finally:
+            self.close()
+        return {"device_id": meta["device_id"], "last_seq": last_seq, "changes": changes}
+    
+    @track_query
+    def apply_changes(self, changes, peer_id=None, peer_seq=None):
+        """Merge changes from export_changes() of another database
+        
+        A change wins when its (version_at, version_origin) is greater than
+        the version stored for the row here, so every database ends up with
+        the same rows whatever order it syncs in. Records peer_seq as the
+        cursor for peer_id in the same transaction. Returns how many
+        changes were applied.
+        """
+        applied = 0
+        self.connect()
+        self._begin_write("apply_changes")
+        try:
+            # Content first, so mood logs can find the rows they belong to
+            for change in sorted(changes, key=lambda change: change["table"] != "content"):
+                table = change["table"]
+                if table not in SYNC_FIELDS:
+                    raise ValueError(f"Unknown table in change: {table}")
+                identity = (table, change["origin"], change["origin_id"])
+                incoming = (change["version_at"], change["version_origin"])
+                current = self.cursor.execute('''
+                    SELECT local_id, version_at, version_origin, deleted FROM sync_rows
+                    WHERE table_name = ? AND origin = ? AND origin_id = ?
+                ''', identity).fetchone()
+                if current is not None and (current[1], current[2]) >= incoming:
+                    continue
+                self.cursor.execute("DELETE FROM sync_apply")
+                self.cursor.execute("INSERT INTO sync_apply VALUES (?, ?, ?, ?)",
+                                    (change["origin"], change["origin_id"]) + incoming)
+                live = current is not None and current[0] is not None and not current[3]
+                if change["deleted"]:
+                    if live:
+                        self.cursor.execute(f"DELETE FROM {table} WHERE id = ?", (current[0],))
+                    else:
+                        # Remember the delete so an older update cannot bring the row back
+                        self.cursor.execute('''
+                            INSERT OR REPLACE INTO sync_rows
+                                (table_name, origin, origin_id, local_id, version_at, version_origin, deleted)
+                            VALUES (?, ?, ?, ?, ?, ?, 1)
+                        ''', identity + (current[0] if current else None,) + incoming)
+                    applied += 1
+                    continue
+                values = dict(change["row"])
+                # Column names are spliced into the SQL below: only known ones get there
+                unknown = [name for name in values if name not in SYNC_FIELDS[table]]
+                if unknown:
+                    raise ValueError(f"Unknown {table} column in change: {unknown[0]!r}")
+                text_field = TEXT_COLUMNS[table]
+                if text_field in values:
+                    values[text_field] = self.encode_text(text_field, values[text_field])
+                if table == "mood_logs":
+                    content_row = self.cursor.execute('''
+                        SELECT local_id FROM sync_rows
+                        WHERE table_name = 'content' AND origin = ? AND origin_id = ? AND deleted = 0
+                    ''', tuple(change.get("content") or (None, None))).fetchone()
+                    values["content_id"] = content_row[0] if content_row else None
+                names = list(values)
+                if live:
+                    self.cursor.execute(
+                        f"UPDATE {table} SET {', '.join(f'{name} = ?' for name in names)} WHERE id = ?",
+                        [values[name] for name in names] + [current[0]])
+                else:
+                    self.cursor.execute(
+                        f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+                        [values[name] for name in names])
+                applied += 1
+            self.cursor.execute("DELETE FROM sync_apply")
+            if peer_id is not None:
+                self.cursor.execute('''
+                    INSERT INTO sync_peers (peer_id, last_seq) VALUES (?, ?)
+                    ON CONFLICT(peer_id) DO UPDATE SET last_seq = MAX(last_seq, excluded.last_seq)
+                ''', (peer_id, peer_seq))
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            self.close()
+        if applied:
+            self._written()
+        return applied
+    
+    def _open_reader(self):
+        if self.snapshot is not None:
+            return self.snapshot.connect()
+        return sqlite3.connect(self.db_name)
+    
+    @contextmanager
+    def _reader(self):
+        """Connection for read queries: the pinned one inside read_session(),
+        else from the pool when configured, else a fresh one"""
+        pinned = getattr(self._session, "conn", None)
+        if pinned is not None:
+            yield pinned
+            return
+        if self.pool is not None and self.snapshot is None:
+            with self.pool.connection() as conn:
+                yield conn
+            return
+        conn = self._open_reader()
+        try:
+            yield conn
+        finally:
+            conn.close()
+    
+    @contextmanager
+    def read_session(self):
+        """Run every read in the block against one consistent point-in-time view
+        
+        On the primary this holds a single read transaction open (under WAL it
+        does not block writers); in snapshot mode all reads share one snapshot.
+        """
+        if getattr(self._session, "conn", None) is not None:
+            yield self
+            return
+        conn = self._open_reader()
+        try:
+            conn.execute("BEGIN")
+            self._session.conn = conn
+            yield self
+        finally:
+            self._session.conn = None
+            conn.rollback()
+            conn.close()
+    
+    def fetch_many(self, calls):
+        """Results of independent read calls (zero-argument callables), in order
+        
+        With parallel_reads each call runs on its own thread and connection,
+        so the batch takes about as long as its slowest query rather than the
+        sum. The results still form one consistent view: if a write commits
+        while they run, the batch is read again in a read_session(). Inside a
+        read_session(), or without parallel_reads, the calls run one after
+        another on the session's view.
+        """
+        if self.parallel is None or getattr(self._session, "conn", None) is not None:
+            with self.read_session():
+                return [call() for call in calls]
+        version = self._versions(SESSION_COUNTERS)
+        futures = [self.parallel.submit(call) for call in calls]
+        results = [future.result() for future in futures]
+        if self._versions(SESSION_COUNTERS) != version:
+            with self.read_session():
+                return [call() for call in calls]
+        return results
+    
+    def _versions(self, counters):
+        """Current values of db_meta counters, in order"""
+        placeholders = ", ".join("?" * len(counters))
+        with self._reader() as conn:
+            values = dict(conn.execute(f"SELECT key, value FROM db_meta WHERE key IN ({placeholders})",
+                                       counters).fetchall())
+        return tuple(values.get(counter, 0) for counter in counters)
+    
+    def _cached(self, key, compute, counters=("data_version",)):
+        """Result of compute(), memoized on key plus the counters' values it was read at
+        
+        A miss in this process's cache is looked up in the shared cache, where
+        another worker may have computed it already. Only one worker computes
+        a missing shared result; the others wait for it.
+        """
+        if self.cache is None and self.shared_cache is None:
+            return compute()
+        version = self._versions(counters)
+        result = self.cache.get((key, version)) if self.cache is not None else MISSING
+        if result is not MISSING:
+            return result
+        if self.shared_cache is None:
+            return self._computed(key, version, compute, counters)
+        # The directory may be shared by several databases
+        shared_key = (os.path.abspath(self.db_name), key, version)
+        with self.shared_cache.compute_lock(shared_key):
+            result = self.shared_cache.get(shared_key)
+            if result is MISSING:
+                return self._computed(key, version, compute, counters, shared_key)
+        if self.cache is not None:
+            self.cache.put((key, version), result)
+        return protect(result)
+    
+    def _computed(self, key, version, compute, counters, shared_key=None):
+        """compute(), stored in the caches when it belongs to version"""
+        result = compute()
+        # Outside read_session() a write may land mid-query; only cache a
+        # result known to belong to the version it is keyed on
+        if getattr(self._session, "conn", None) is None and self._versions(counters) != version:
+            return result
+        if shared_key is not None:
+            result = self.shared_cache.put(shared_key, result)
+        if self.cache is not None:
+            self.cache.put((key, version), result)
+            result = protect(result)
+        return result
+    
+    def _read_frame(self, query, params=(), texts=()):
+        """Run a read query on the configured backend and return a DataFrame
+        
+        texts lists (column, table, id_column, after_column) for decoded text
+        to add to the result: table's stored text for the ids in id_column,
+        placed after after_column.
+        """
+        def compute():
+            # Backends import pandas on first read so the write path never needs it
+            frame = self.backend.read_frame(query, params)
+            for column, table, id_column, after_column in texts:
+                frame.insert(frame.columns.get_loc(after_column) + 1, column,
+                             self.get_texts(table, frame[id_column]))
+            return frame
+        
+        return self._cached((self.backend.name, query, tuple(params), tuple(texts)), compute)
+    
+    def get_texts(self, table, ids):
+        """Decoded notes (content) or emotional_tags (mood_logs) for ids, in order
+        
+        Always read from SQLite, whatever the backend; missing ids give None.
+        """
+        column = TEXT_COLUMNS[table]
+        ids = [None if id_ != id_ or id_ is None else int(id_) for id_ in ids]
+        wanted = sorted({id_ for id_ in ids if id_ is not None})
+        stored = {}
+        with self._reader() as conn:
+            if len(wanted) > TEXT_SCAN_IDS:
+                stored.update(conn.execute(f"SELECT id, {column} FROM {table}"))
+            else:
+                for start in range(0, len(wanted), 500):
+                    chunk = wanted[start:start + 500]
+                    stored.update(conn.execute(
+                        f"SELECT id, {column} FROM {table} WHERE id IN ({', '.join('?' * len(chunk))})", chunk))
+        codec = self._text_codec()
+        return [codec.decode(stored.get(id_)) for id_ in ids]
+    
+    @track_query
+    def get_quick_stats(self, filters=None):
+        """Total entries and average mood change, without loading any rows"""
+        where, params = where_clause(filters)
+        
+        def compute():
+            with self._reader() as conn:
+                total, avg_mood_change = conn.execute(f'''
+                    SELECT
+                        (SELECT COUNT(*) FROM content c{where}),
+                        (SELECT AVG(m.mood_after - m.mood_before)
+                         FROM mood_logs m JOIN content c ON c.id = m.content_id{where})
+                ''', params + params).fetchone()
+            return {"total_content": total, "avg_mood_change": avg_mood_change}
+        
+        return self._cached(("quick_stats", where, params), compute)
+    
+    @track_query
+    def get_content_summary(self, filters=None):
+        """Entry count, average rating and entries per content type"""
+        where, params = where_clause(filters)
+        
+        def compute():
+            with self._reader() as conn:
+                rows = conn.execute(f'''
+                    SELECT c.content_type, COUNT(*), SUM(c.rating), COUNT(c.rating)
+                    FROM content c{where}
+                    GROUP BY c.content_type
+                ''', params).fetchall()
+            rated = sum(row[3] for row in rows)
+            return {
+                "total_content": sum(row[1] for row in rows),
+                "avg_rating": sum(row[2] or 0 for row in rows) / rated if rated else None,
+                "type_counts": {row[0]: row[1] for row in rows},
+            }
+        
+        return self._cached(("content_summary", where, params), compute)
+    
+    @track_query
+    def get_filter_options(self):
+        """Values offered by the sidebar filters (distinct types and genres, date range)"""
+        def compute():
+            with self._reader() as conn:
+                content_types = [row[0] for row in conn.execute(
+                    "SELECT DISTINCT content_type FROM content ORDER BY content_type")]
+                genres = [row[0] for row in conn.execute(
+                    "SELECT DISTINCT genre FROM content WHERE genre IS NOT NULL AND genre != '' ORDER BY genre")]
+                first_date, last_date = conn.execute(
+                    "SELECT MIN(date_consumed), MAX(date_consumed) FROM content").fetchone()
+            return {"content_types": content_types, "genres": genres,
+                    "first_date": first_date, "last_date": last_date}
+        
+        return self._cached(("filter_options",), compute)
+    
+    @track_query
+    def get_all_content(self, limit=None, filters=None, with_notes=False):
+        """Retrieve all content entries (the most recent `limit` when given)
+        
+        notes are left out unless with_notes is set.
+        """
+        where, params = where_clause(filters, alias="")
+        query = f"SELECT {', '.join(CONTENT_COLUMNS)} FROM content{where} ORDER BY date_consumed DESC, id DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params += (limit,)
+        return self._read_frame(query, params, NOTES_TEXT if with_notes else ())
+    
+    @track_query
+    def search_content(self, term, limit=50, filters=None, with_notes=False):
+        """Find content whose title, creator or genre contains term"""
+        pattern = f"%{term}%"
+        where, params = where_clause(filters, alias="", prefix="AND")
+        return self._read_frame(f'''
+            SELECT {', '.join(CONTENT_COLUMNS)} FROM content
+            WHERE (title LIKE ? OR creator LIKE ? OR genre LIKE ?){where}
+            ORDER BY date_consumed DESC, id DESC
+            LIMIT ?
+        ''', (pattern, pattern, pattern) + params + (limit,), NOTES_TEXT if with_notes else ())
+    
+    @track_query
+    def get_all_moods(self, filters=None):
+        """Retrieve all mood logs"""
+        columns = ", ".join(f"m.{column}" for column in MOOD_COLUMNS)
+        where, params = where_clause(filters)
+        join = " JOIN content c ON c.id = m.content_id" if where else ""
+        return self._read_frame(f'''
+            SELECT {columns} FROM mood_logs m{join}{where}
+            ORDER BY m.log_date DESC, m.id DESC
+        ''', params, (("emotional_tags", "mood_logs", "id", "mood_after"),))
+    
+    @track_query
+    def get_content_with_moods(self, filters=None, with_text=False, with_tags=False):
+        """Get content joined with mood data
+        
+        notes and emotional_tags are left out unless with_text is set;
+        with_tags brings back emotional_tags alone.
+        """
+        where, params = where_clause(filters)
+        query = f'''
+            SELECT
                 c.id,
                 c.title,
                 c.content_type,
@@ -105,23 +1745,139 @@ class ContentDatabase:
                 c.creator,
                 c.rating,
                 c.date_consumed,
-                c.notes,
+                m.id as mood_log_id,
                 m.mood_before,
                 m.mood_after,
-                m.emotional_tags,
                 (m.mood_after - m.mood_before) as mood_change
             FROM content c
-            LEFT JOIN mood_logs m ON c.id = m.content_id
-            ORDER BY c.date_consumed DESC
+            LEFT JOIN mood_logs m ON c.id = m.content_id{where}
+            ORDER BY c.date_consumed DESC, c.id DESC, m.id
         '''
-        df = pd.read_sql_query(query, self.conn)
-        self.close()
-        return df
+        texts = (NOTES_TEXT if with_text else ()) + (TAGS_TEXT if with_text or with_tags else ())
+        return self._read_frame(query, params, texts)
+    
+    @track_query
+    def get_session_rollups(self, filters=None, limit=None):
+        """Per-item totals of logged checkpoints, most recently active first;
+        read from SQLite whatever the backend"""
+        where, params = where_clause(filters)
+        query = f'''
+            SELECT
+                c.id,
+                c.title,
+                c.content_type,
+                r.events,
+                r.minutes,
+                CAST(r.mood_sum AS REAL) / r.events as avg_mood,
+                r.min_mood,
+                r.max_mood,
+                r.first_at,
+                r.first_mood,
+                r.last_at,
+                r.last_mood,
+                r.last_chapter,
+                r.last_episode
+            FROM session_rollups r
+            JOIN content c ON c.id = r.content_id{where}
+            ORDER BY r.last_at DESC, c.id DESC
+            {"LIMIT ?" if limit else ""}
+        '''
+        params = params + ((limit,) if limit else ())
+        
+        def compute():
+            import pandas as pd
+            with self._reader() as conn:
+                return pd.read_sql_query(query, conn, params=params)
+        
+        return self._cached(("session_rollups", query, params), compute, SESSION_COUNTERS)
+    
+    @track_query
+    def get_session_choices(self, in_progress=20, recent=50):
+        """Items to log a checkpoint for, as dicts: those with checkpoints
+        (most recently active first, with their last one), then the latest
+        entries. Plain rows, so the Add page never loads pandas for them"""
+        with self._reader() as conn:
+            active = conn.execute('''
+                SELECT c.id, c.title, c.content_type, r.events, r.minutes, r.last_mood,
+                       r.last_chapter, r.last_episode
+                FROM session_rollups r
+                JOIN content c ON c.id = r.content_id
+                ORDER BY r.last_at DESC, c.id DESC
+                LIMIT ?
+            ''', (in_progress,)).fetchall()
+            latest = conn.execute('''
+                SELECT id, title, content_type FROM content
+                ORDER BY date_consumed DESC, id DESC
+                LIMIT ?
+            ''', (recent,)).fetchall()
+        names = ("id", "title", "content_type", "events", "minutes", "last_mood", "last_chapter", "last_episode")
+        return [dict(zip(names, row)) for row in active + latest]
+    
+    @track_query
+    def get_session_curves(self, content_ids):
+        """Checkpoints of the given items in time order, numbered per item
+        (checkpoint) with the minutes spent so far (elapsed_minutes)"""
+        content_ids = tuple(int(content_id) for content_id in content_ids)
+        # Index order: no sort step (same-second checkpoints fall back to chapter order)
+        query = f'''
+            SELECT content_id, logged_at, chapter, episode, minutes, mood
+            FROM session_events
+            WHERE content_id IN ({', '.join('?' * len(content_ids))})
+            ORDER BY content_id, logged_at
+        '''
+        
+        def compute():
+            import pandas as pd
+            with self._reader() as conn:
+                frame = pd.read_sql_query(query, conn, params=content_ids)
+            # Cheaper here than as SQL window functions
+            items = frame.groupby("content_id", sort=False)
+            frame["checkpoint"] = items.cumcount() + 1
+            minutes = frame["minutes"].astype(float).fillna(0.0)
+            frame["elapsed_minutes"] = minutes.groupby(frame["content_id"], sort=False).cumsum()
+            return frame
+        
+        return self._cached(("session_curves", content_ids), compute, SESSION_COUNTERS)
+    
+    @track_query
+    def get_note_sentiment(self, filters=None):
+        """Scored notes with their mood log; read from SQLite whatever the backend"""
+        where, params = where_clause(filters)
+        query = f'''
+            SELECT
+                c.id,
+                c.title,
+                c.content_type,
+                c.genre,
+                m.mood_before,
+                m.mood_after,
+                (m.mood_after - m.mood_before) as mood_change,
+                s.sentiment,
+                s.joy,
+                s.sadness,
+                s.anger,
+                s.fear,
+                s.calm,
+                s.matched_words
+            FROM content c
+            JOIN content_note_scores cs ON cs.content_id = c.id
+            JOIN note_scores s ON s.notes_hash = cs.notes_hash
+            LEFT JOIN mood_logs m ON m.content_id = c.id{where}
+            ORDER BY c.date_consumed DESC, c.id DESC, m.id
+        '''
+        
+        def compute():
+            import pandas as pd
+            with self._reader() as conn:
+                return pd.read_sql_query(query, conn, params=params)
+        
+        return self._cached(("note_sentiment", query, params), compute)
     
-    def get_genre_stats(self):
+    @track_query
+    def get_genre_stats(self, filters=None):
         """Get statistics by genre"""
-        self.connect()
-        query = '''
+        where, params = where_clause(filters, prefix="AND")
+        query = f'''
             SELECT 
                 c.genre,
                 COUNT(*) as count,
@@ -129,31 +1885,99 @@ class ContentDatabase:
                 AVG(m.mood_after - m.mood_before) as avg_mood_change
             FROM content c
             LEFT JOIN mood_logs m ON c.id = m.content_id
-            WHERE c.genre IS NOT NULL
+            WHERE c.genre IS NOT NULL{where}
             GROUP BY c.genre
-            ORDER BY count DESC
+            ORDER BY count DESC, c.genre
         '''
-        df = pd.read_sql_query(query, self.conn)
-        self.close()
-        return df
+        return self._read_frame(query, params)
     
-    def get_content_type_stats(self):
+    @track_query
+    def get_content_type_stats(self, filters=None):
         """Get statistics by content type"""
-        self.connect()
-        query = '''
+        where, params = where_clause(filters)
+        query = f'''
             SELECT 
                 c.content_type,
                 COUNT(*) as count,
                 AVG(c.rating) as avg_rating,
                 AVG(m.mood_after - m.mood_before) as avg_mood_change
             FROM content c
-            LEFT JOIN mood_logs m ON c.id = m.content_id
+            LEFT JOIN mood_logs m ON c.id = m.content_id{where}
             GROUP BY c.content_type
-            ORDER BY count DESC
+            ORDER BY count DESC, c.content_type
         '''
-        df = pd.read_sql_query(query, self.conn)
+        return self._read_frame(query, params)
+    
+    @track_query
+    def get_streaks(self, today):
+        """Current and longest runs of consecutive days with an entry
+        
+        A streak stays current through today even before today's entry is
+        logged, as long as yesterday was active.
+        """
+        today = str(today)
+        with self._reader() as conn:
+            current = conn.execute('''
+                SELECT start_day, end_day FROM activity_runs
+                WHERE start_day <= ? ORDER BY start_day DESC LIMIT 1
+            ''', (today,)).fetchone()
+            longest = conn.execute(f'''
+                SELECT start_day, end_day, {RUN_LENGTH} + 1 FROM activity_runs
+                ORDER BY {RUN_LENGTH} DESC, start_day DESC LIMIT 1
+            ''').fetchone()
+            yesterday, logged_today = conn.execute(
+                "SELECT date(?, '-1 day'), EXISTS (SELECT 1 FROM daily_activity WHERE day = ?)",
+                (today, today)).fetchone()
+        streak = {"current": 0, "current_start": None, "active_today": bool(logged_today),
+                  "longest": 0, "longest_start": None, "longest_end": None}
+        if current is not None and current[1] >= yesterday:
+            end = min(current[1], today)
+            streak["current"] = (datetime.strptime(end, "%Y-%m-%d") - datetime.strptime(current[0], "%Y-%m-%d")).days + 1
+            streak["current_start"] = current[0]
+        if longest is not None:
+            streak.update(longest=longest[2], longest_start=longest[0], longest_end=longest[1])
+        return streak
+        
+    @track_query
+    def get_goal_progress(self, today):
+        """Every goal with the entries counted toward it in the period containing today"""
+        period_key = " ".join(f"WHEN '{name}' THEN {key.format(day='?')}" for name, key in PERIOD_KEYS.items())
+        with self._reader() as conn:
+            rows = conn.execute(f'''
+                SELECT g.id, g.title, g.period, g.content_type, g.target,
+                       (SELECT COALESCE(SUM(p.entries), 0) FROM period_counts p
+                        WHERE p.period = CASE g.period {period_key} END
+                          AND (g.content_type IS NULL OR p.content_type = g.content_type))
+                FROM goals g
+                ORDER BY g.id
+            ''', (str(today),) * len(PERIOD_KEYS)).fetchall()
+        return [{"id": row[0], "title": row[1], "period": row[2], "content_type": row[3],
+                 "target": row[4], "done": row[5]} for row in rows]
+        
+    @track_query
+    def add_goal(self, title, period, target, content_type=None):
+        """Add a goal: target entries (of content_type, or any type) per week, month or year"""
+        self.connect()
+        self._begin_write("add_goal")
+        self.cursor.execute(
+            "INSERT INTO goals (title, period, content_type, target) VALUES (?, ?, ?, ?)",
+            (title, period, content_type or None, target))
+        self.cursor.execute("UPDATE db_meta SET value = value + 1 WHERE key = 'goals_version'")
+        self.conn.commit()
+        goal_id = self.cursor.lastrowid
+        self.close()
+        self._written()
+        return goal_id
+        
+    @track_query
+    def delete_goal(self, goal_id):
+        self.connect()
+        self._begin_write("delete_goal")
+        self.cursor.execute("DELETE FROM goals WHERE id = ?", (goal_id,))
+        self.cursor.execute("UPDATE db_meta SET value = value + 1 WHERE key = 'goals_version'")
+        self.conn.commit()
         self.close()
-        return df
+        self._written()
     
     def seed_sample_data(self):
         """Seed database with 110+ sample entries"""
@@ -0,0 +1,64 @@
+"""Global content filters compiled to parameterized SQL"""
+
+
+class ContentFilter:
+    """Sidebar filter selection shared by every page
+
+    Empty fields mean "no restriction". to_sql() turns the selection into a
+    WHERE fragment over the content table so ContentDatabase can push it into
+    its queries and let SQLite use the content indexes.
+    """
+
+    def __init__(self, date_from=None, date_to=None, content_types=None, genres=None,
+                 min_rating=None, max_rating=None):
+        self.date_from = date_from
+        self.date_to = date_to
+        self.content_types = tuple(content_types or ())
+        self.genres = tuple(genres or ())
+        self.min_rating = min_rating
+        self.max_rating = max_rating
+
+    def is_empty(self):
+        return not self.to_sql()[0]
+
+    def to_sql(self, alias="c"):
+        """Return (condition, params); condition is "" when nothing is filtered"""
+        column = f"{alias}." if alias else ""
+        conditions, params = [], []
+        if self.date_from is not None:
+            conditions.append(f"{column}date_consumed >= ?")
+            params.append(str(self.date_from))
+        if self.date_to is not None:
+            conditions.append(f"{column}date_consumed <= ?")
+            params.append(str(self.date_to))
+        if self.content_types:
+            conditions.append(f"{column}content_type IN ({', '.join('?' * len(self.content_types))})")
+            params.extend(self.content_types)
+        if self.genres:
+            conditions.append(f"{column}genre IN ({', '.join('?' * len(self.genres))})")
+            params.extend(self.genres)
+        if self.min_rating is not None:
+            conditions.append(f"{column}rating >= ?")
+            params.append(self.min_rating)
+        if self.max_rating is not None:
+            conditions.append(f"{column}rating <= ?")
+            params.append(self.max_rating)
+        return " AND ".join(conditions), tuple(params)
+
+    def key(self):
+        """Hashable identity of the selection, e.g. for caching"""
+        return self.to_sql()
+
+    def __repr__(self):
+        condition, params = self.to_sql()
+        return f"ContentFilter({condition or 'all'}, {params})"
+
+
+def where_clause(filters, alias="c", prefix="WHERE"):
+    """SQL fragment (with leading keyword) and params for an optional filter"""
+    if filters is None:
+        return "", ()
+    condition, params = filters.to_sql(alias)
+    if not condition:
+        return "", ()
+    return f" {prefix} {condition}", params
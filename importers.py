@@ -0,0 +1,288 @@
+"""Streaming importers for Goodreads, Letterboxd and MyAnimeList exports
+
+    python importers.py goodreads goodreads_library_export.csv
+    python importers.py letterboxd diary.csv --db contentmood.db
+    python importers.py myanimelist animelist.xml.gz
+
+Exports are parsed record by record and written in batched transactions, so
+memory stays flat however large the file is. Each batch commits a checkpoint
+alongside its rows; re-running the same command after an interruption picks
+up after the last committed batch.
+"""
+import argparse
+import csv
+import gzip
+import hashlib
+import io
+import itertools
+import os
+import re
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+from database import ContentDatabase
+
+DEFAULT_BATCH_SIZE = 5000
+# Bytes hashed from each end of an export into its checkpoint key
+FINGERPRINT_BYTES = 64 * 1024
+
+# Goodreads shelves that describe reading status rather than genre
+GOODREADS_STATUS_SHELVES = {"read", "to-read", "currently-reading", "favorites", "owned"}
+
+_DATE_RE = re.compile(r"(\d{4})[-/](\d{1,2})[-/](\d{1,2})")
+_BR_RE = re.compile(r"<br\s*/?>")
+
+
+def _csv_records(lines, skip=0):
+    """Yield CSV rows as dicts after discarding the first skip records unparsed"""
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return
+    for _ in itertools.islice(reader, skip):
+        pass
+    for row in reader:
+        yield dict(zip(header, row))
+
+
+def _clean(value):
+    value = (value or "").strip()
+    return value or None
+
+
+def _int_or_none(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _iso_date(value):
+    """Normalise 2024/10/15, 2024-10-15 and 2024-10-15 20:01:00 to 2024-10-15"""
+    value = _clean(value)
+    if not value or value.startswith("0000"):
+        return None
+    match = _DATE_RE.match(value)
+    if not match:
+        return None
+    year, month, day = match.groups()
+    if month == "00" or day == "00":
+        return None
+    return f"{year}-{int(month):02d}-{int(day):02d}"
+
+
+def _scaled_rating(value, scale):
+    """Convert a source rating to the app's 0-10 scale; 0 means unrated"""
+    try:
+        rating = float(value)
+    except (TypeError, ValueError):
+        return None
+    return round(rating * scale, 1) if rating > 0 else None
+
+
+def parse_goodreads(lines, skip=0):
+    """Yield entries (or None for skipped records) from a Goodreads library export"""
+    for row in _csv_records(lines, skip):
+        if (row.get("Exclusive Shelf") or "read").strip() != "read":
+            yield None
+            continue
+        date_consumed = _iso_date(row.get("Date Read")) or _iso_date(row.get("Date Added"))
+        if not _clean(row.get("Title")) or not date_consumed:
+            yield None
+            continue
+        shelves = [shelf.strip() for shelf in (row.get("Bookshelves") or "").split(",")]
+        genres = [shelf for shelf in shelves if shelf and shelf not in GOODREADS_STATUS_SHELVES]
+        review = _BR_RE.sub("\n", row.get("My Review") or "")
+        notes = "\n".join(part for part in (_clean(review), _clean(row.get("Private Notes"))) if part)
+        yield {
+            "title": row["Title"].strip(),
+            "content_type": "Book",
+            "genre": genres[0].replace("-", " ").title() if genres else None,
+            "creator": _clean(row.get("Author")),
+            "release_year": _int_or_none(row.get("Original Publication Year"))
+                            or _int_or_none(row.get("Year Published")),
+            "date_consumed": date_consumed,
+            "rating": _scaled_rating(row.get("My Rating"), 2),
+            "notes": notes,
+        }
+
+
+def parse_letterboxd(lines, skip=0):
+    """Yield entries from a Letterboxd diary.csv, ratings.csv, reviews.csv or watched.csv"""
+    for row in _csv_records(lines, skip):
+        date_consumed = _iso_date(row.get("Watched Date")) or _iso_date(row.get("Date"))
+        if not _clean(row.get("Name")) or not date_consumed:
+            yield None
+            continue
+        entry = {
+            "title": row["Name"].strip(),
+            "content_type": "Movie",
+            "genre": None,
+            "creator": None,
+            "release_year": _int_or_none(row.get("Year")),
+            "date_consumed": date_consumed,
+            "rating": _scaled_rating(row.get("Rating"), 2),
+            "notes": _clean(row.get("Review")) or "",
+        }
+        tags = _clean(row.get("Tags"))
+        if tags:
+            # Letterboxd tags are free-form feelings more often than not
+            entry["emotional_tags"] = ",".join(tag.strip() for tag in tags.split(","))
+        yield entry
+
+
+def parse_myanimelist(stream, skip=0):
+    """Yield entries from a MyAnimeList anime or manga XML export"""
+    context = ET.iterparse(stream, events=("start", "end"))
+    _, root = next(context)
+    for event, element in context:
+        if event != "end" or element.tag not in ("anime", "manga"):
+            continue
+        if skip:
+            skip -= 1
+            element.clear()
+            root.clear()
+            continue
+        is_anime = element.tag == "anime"
+        title = _clean(element.findtext("series_title" if is_anime else "manga_title"))
+        status = (element.findtext("my_status") or "").strip()
+        date_consumed = _iso_date(element.findtext("my_finish_date"))
+        if status == "Completed" and not date_consumed:
+            date_consumed = _iso_date(element.findtext("my_start_date"))
+        if not title or not date_consumed:
+            yield None
+        else:
+            entry = {
+                "title": title,
+                "content_type": "Anime" if is_anime else "Manga",
+                "genre": None,
+                "creator": None,
+                "release_year": None,
+                "date_consumed": date_consumed,
+                "rating": _scaled_rating(element.findtext("my_score"), 1),
+                "notes": _clean(element.findtext("my_comments")) or "",
+            }
+            tags = _clean(element.findtext("my_tags"))
+            if tags:
+                entry["emotional_tags"] = ",".join(tag.strip() for tag in tags.split(","))
+            yield entry
+        # Drop parsed records so memory does not grow with the file
+        element.clear()
+        root.clear()
+
+
+PARSERS = {
+    "goodreads": (parse_goodreads, "text"),
+    "letterboxd": (parse_letterboxd, "text"),
+    "myanimelist": (parse_myanimelist, "binary"),
+}
+
+
+def _open_stream(fileobj, name, mode):
+    """Wrap a binary file object (optionally gzipped) for the parser"""
+    if name.endswith(".gz"):
+        fileobj = gzip.GzipFile(fileobj=fileobj)
+    if mode == "text":
+        return io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    return fileobj
+
+
+def _fingerprint(fileobj):
+    """First and last FINGERPRINT_BYTES of a seekable file (b"" otherwise),
+    leaving its position where it was"""
+    if not fileobj.seekable():
+        return b""
+    start = fileobj.tell()
+    head = fileobj.read(FINGERPRINT_BYTES)
+    end = fileobj.seek(0, os.SEEK_END)
+    fileobj.seek(max(start + len(head), end - FINGERPRINT_BYTES))
+    tail = fileobj.read()
+    fileobj.seek(start)
+    return head + tail
+
+
+def import_key(source, name, size, fingerprint=b""):
+    """Checkpoint key identifying one export file
+
+    Exports keep their name from one download to the next (Goodreads' is
+    always goodreads_library_export.csv), so the bytes at both ends of the
+    file go into the key too.
+    """
+    digest = hashlib.sha1(f"{source}:{name}:{size}:".encode("utf-8"))
+    digest.update(fingerprint)
+    return digest.hexdigest()
+
+
+def import_stream(db, source, fileobj, name, size=None, batch_size=DEFAULT_BATCH_SIZE,
+                  resume=True, progress=None):
+    """Import an export from a binary file object into db
+
+    progress, when given, is called after every batch with
+    (records_read, entries_imported, bytes_read, total_bytes).
+    Returns (records_read, entries_imported, records_skipped).
+    """
+    if source not in PARSERS:
+        raise ValueError(f"Unknown import source: {source}")
+    parser, mode = PARSERS[source]
+    key = import_key(source, os.path.basename(name), size, _fingerprint(fileobj))
+    done = db.get_import_checkpoint(key) if resume else 0
+    raw = fileobj
+    records = done
+    imported = skipped = 0
+    batch = []
+    for entry in parser(_open_stream(fileobj, name, mode), skip=done):
+        records += 1
+        if entry is None:
+            skipped += 1
+        else:
+            batch.append(entry)
+        if len(batch) >= batch_size:
+            db.add_entries(batch, checkpoint=(key, records))
+            imported += len(batch)
+            batch = []
+            if progress:
+                progress(records, imported, raw.tell(), size)
+    db.add_entries(batch, checkpoint=(key, records))
+    imported += len(batch)
+    if progress:
+        progress(records, imported, size or raw.tell(), size)
+    return records, imported, skipped
+
+
+def import_file(db, source, path, **kwargs):
+    """Import an export file from disk; see import_stream for options"""
+    with open(path, "rb") as fileobj:
+        return import_stream(db, source, fileobj, os.path.abspath(path), os.path.getsize(path), **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import Goodreads, Letterboxd or MyAnimeList exports")
+    parser.add_argument("source", choices=sorted(PARSERS))
+    parser.add_argument("path")
+    parser.add_argument("--db", default="contentmood.db")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--no-resume", action="store_true", help="ignore a previous checkpoint")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+
+    def report(records, imported, bytes_read, total_bytes):
+        elapsed = time.perf_counter() - started
+        percent = f"{bytes_read / total_bytes:6.1%}" if total_bytes else ""
+        sys.stderr.write(f"\r📥 {percent} {records:,} records, {imported:,} imported "
+                         f"({imported / max(elapsed, 1e-9):,.0f}/s)")
+        sys.stderr.flush()
+
+    db = ContentDatabase(args.db)
+    records, imported, skipped = import_file(
+        db, args.source, args.path, batch_size=args.batch_size,
+        resume=not args.no_resume, progress=report,
+    )
+    sys.stderr.write("\n")
+    print(f"✨ Imported {imported:,} entries from {records:,} records "
+          f"({skipped:,} skipped) in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
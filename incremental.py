@@ -0,0 +1,81 @@
+"""Shared plumbing for the structures caught up incrementally from the database
+
+The sketches, the tag graph, the pivot cube and the Add form's suggestions
+each fold in rows with ids past their watermarks, and start over after an
+in-place update or delete (the *_rewrites counters in db_meta). The sketches
+and the tag graph also keep their state in an .npz file next to the database.
+Each is shared per database file within a process.
+"""
+import io
+import os
+import threading
+
+import numpy as np
+
+
+def read_meta(conn):
+    """db_meta as a dict"""
+    return dict(conn.execute("SELECT key, value FROM db_meta").fetchall())
+
+
+def rewritten(state, meta, tables):
+    """True if any of tables was updated or deleted from in place since state"""
+    return any(state.get(f"{table}_rewrites") != meta.get(f"{table}_rewrites", 0) for table in tables)
+
+
+def rewrite_counts(meta, tables):
+    """The *_rewrites counters of tables, to store with a caught-up state"""
+    return {f"{table}_rewrites": meta.get(f"{table}_rewrites", 0) for table in tables}
+
+
+def meta_arrays(meta):
+    """A dict of ints (or None) as two arrays, for an .npz file"""
+    return {
+        "meta_names": np.array(list(meta), dtype=str),
+        "meta_values": np.array([-1 if value is None else value for value in meta.values()], dtype=np.int64),
+    }
+
+
+def meta_from_arrays(arrays):
+    return {name: (None if value < 0 else int(value))
+            for name, value in zip(arrays["meta_names"].tolist(), arrays["meta_values"])}
+
+
+def save_arrays(path, arrays):
+    """Write arrays to path as a compressed .npz, replacing it atomically"""
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as output:
+        output.write(buffer.getvalue())
+    os.replace(temporary, path)
+
+
+def load_arrays(path, load):
+    """Call load with the arrays saved at path; False if there is no usable
+    file (missing, unreadable or from an older layout) and the caller should
+    rebuild from the database"""
+    if not os.path.exists(path):
+        return False
+    try:
+        with np.load(path, allow_pickle=False) as arrays:
+            load(arrays)
+    except (OSError, KeyError, ValueError):
+        return False
+    return True
+
+
+class PerDatabase:
+    """One shared factory(db) per database file"""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._instances = {}
+        self._lock = threading.Lock()
+
+    def get(self, db):
+        key = os.path.abspath(db.db_name)
+        with self._lock:
+            if key not in self._instances:
+                self._instances[key] = self.factory(db)
+            return self._instances[key]
@@ -0,0 +1,384 @@
+"""Background SQLite maintenance for long-running databases
+
+    python maintenance.py --db contentmood.db run [--force]   # run whatever is due now
+    python maintenance.py --db contentmood.db report          # fragmentation and recommendations
+    python maintenance.py --db contentmood.db log             # recent maintenance steps
+    python maintenance.py --db contentmood.db vacuum [--page-size 8192]
+
+ContentDatabase only issues DDL and DML, so without this a busy file never
+refreshes its planner statistics, lets the WAL grow between automatic
+checkpoints and keeps freed pages forever. MaintenanceScheduler checks a few
+cheap numbers every interval and runs only the steps whose threshold is hit:
+
+    checkpoint          WAL larger than wal_bytes (PASSIVE, then TRUNCATE if it drained)
+    analyze             data_version moved by analyze_rows or analyze_share of the rows
+    optimize            PRAGMA optimize whenever data changed since the last run
+    incremental_vacuum  freelist above freelist_share of the file (auto_vacuum=INCREMENTAL only)
+    backup              newest backup older than backup_interval and data changed since (see backup.py)
+
+Every step that takes the write lock waits at most busy_timeout and skips the
+tick when an app writer holds it; incremental vacuum frees pages in small
+transactions and pauses between them so writers slip in. Each step is recorded in the
+maintenance_log table with its duration.
+"""
+import argparse
+import os
+import sqlite3
+import threading
+import time
+
+from metrics import MAINTENANCE_SECONDS
+
+# Defaults for MaintenanceScheduler thresholds
+WAL_CHECKPOINT_BYTES = 16 * 1024 * 1024
+ANALYZE_ROWS = 1000
+ANALYZE_SHARE = 0.1
+FREELIST_SHARE = 0.1
+FREELIST_MIN_PAGES = 256
+# ANALYZE samples this many rows per index so it stays fast on big tables
+ANALYSIS_LIMIT = 1000
+# Pages freed per incremental_vacuum transaction, and the time spent per tick
+VACUUM_PAGES_PER_STEP = 512
+VACUUM_SECONDS_PER_TICK = 1.0
+# maintenance_log rows kept
+LOG_ROWS = 1000
+
+AUTO_VACUUM_MODES = {0: "none", 1: "full", 2: "incremental"}
+
+
+def database_stats(conn, db_name):
+    """Cheap numbers the scheduler decides on"""
+    stats = {
+        "page_size": conn.execute("PRAGMA page_size").fetchone()[0],
+        "page_count": conn.execute("PRAGMA page_count").fetchone()[0],
+        "freelist_count": conn.execute("PRAGMA freelist_count").fetchone()[0],
+        "auto_vacuum": conn.execute("PRAGMA auto_vacuum").fetchone()[0],
+        "journal_mode": conn.execute("PRAGMA journal_mode").fetchone()[0],
+        "wal_bytes": os.path.getsize(db_name + "-wal") if os.path.exists(db_name + "-wal") else 0,
+    }
+    row = conn.execute("SELECT value FROM db_meta WHERE key = 'data_version'").fetchone()
+    stats["data_version"] = row[0] if row else 0
+    # Highest ids rather than COUNT(*): close enough, and an index lookup
+    stats["rows"] = sum(conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+                        for table in ("content", "mood_logs"))
+    return stats
+
+
+class MaintenanceScheduler:
+    """Run due maintenance steps on a database every interval seconds"""
+
+    def __init__(self, db_name, interval=300.0, wal_bytes=WAL_CHECKPOINT_BYTES, analyze_rows=ANALYZE_ROWS,
+                 analyze_share=ANALYZE_SHARE, freelist_share=FREELIST_SHARE, busy_timeout=0.25,
+                 backup_interval=0, backup_dir=None, backup_keep=None):
+        self.db_name = db_name
+        self.interval = interval
+        self.wal_bytes = wal_bytes
+        self.analyze_rows = analyze_rows
+        self.analyze_share = analyze_share
+        self.freelist_share = freelist_share
+        self.busy_timeout = busy_timeout
+        self.backup_interval = backup_interval
+        self.backup_dir = backup_dir
+        self.backup_keep = backup_keep
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Run in a daemon thread, first after one interval"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="db-maintenance", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except sqlite3.Error:
+                # Try again next interval, e.g. when the disk was briefly full
+                pass
+
+    def _last_version(self, conn, *steps):
+        """data_version at the last successful run of any of steps"""
+        row = conn.execute(f'''
+            SELECT data_version FROM maintenance_log
+            WHERE step IN ({', '.join('?' * len(steps))}) AND ok = 1
+            ORDER BY id DESC LIMIT 1
+        ''', steps).fetchone()
+        return row[0] if row else None
+
+    def due_steps(self, conn, stats, force=False):
+        """Names of the steps whose threshold is hit"""
+        steps = []
+        if stats["journal_mode"] == "wal" and (force or stats["wal_bytes"] >= self.wal_bytes):
+            steps.append("checkpoint")
+        analyzed = self._last_version(conn, "analyze")
+        changed = stats["data_version"] - (analyzed or 0)
+        if stats["rows"] and (force or analyzed is None
+                              or changed >= max(self.analyze_rows, self.analyze_share * stats["rows"])):
+            steps.append("analyze")
+        elif self._last_version(conn, "analyze", "optimize") != stats["data_version"]:
+            steps.append("optimize")
+        freelist_due = stats["freelist_count"] >= max(FREELIST_MIN_PAGES, self.freelist_share * stats["page_count"])
+        if stats["auto_vacuum"] == 2 and stats["freelist_count"] and (force or freelist_due):
+            steps.append("incremental_vacuum")
+        if self.backup_interval and self._backup_due(stats):
+            steps.append("backup")
+        return steps
+
+    def _backup_due(self, stats):
+        import backup
+
+        newest = next(iter(backup.list_backups(self.db_name, self.backup_dir)), None)
+        if newest is None:
+            return True
+        age = time.time() - os.path.getmtime(newest["path"])
+        return age >= self.backup_interval and newest["data_version"] != stats["data_version"]
+
+    def _checkpoint(self, conn, stats):
+        busy, frames, done = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+        if busy or frames != done:
+            return busy == 0, f"{done}/{frames} frames copied, readers still on the WAL"
+        # Everything is in the main file: truncating now only waits on
+        # writers that started since, and gives up after busy_timeout
+        busy, _, _ = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        return True, f"{frames} frames copied, WAL {'kept (busy)' if busy else 'truncated'}"
+
+    def _analyze(self, conn, stats):
+        conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+        conn.execute("ANALYZE")
+        return True, f"{stats['rows']:,} rows, sampled {ANALYSIS_LIMIT} per index"
+
+    def _optimize(self, conn, stats):
+        conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+        conn.execute("PRAGMA optimize")
+        return True, "planner statistics checked"
+
+    def _incremental_vacuum(self, conn, stats):
+        start_free = left = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        deadline = time.perf_counter() + VACUUM_SECONDS_PER_TICK
+        while left and time.perf_counter() < deadline:
+            started = time.perf_counter()
+            # Its own short write transaction; executescript steps the pragma
+            # to completion (execute would free a single page)
+            conn.executescript(f"PRAGMA incremental_vacuum({VACUUM_PAGES_PER_STEP});")
+            left = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            # Stay off the lock as long as we held it so waiting writers get in
+            time.sleep(time.perf_counter() - started)
+        freed = start_free - left
+        return True, f"{freed:,} pages returned ({freed * stats['page_size'] / 2**20:.1f} MiB), {left:,} left"
+
+    def _backup(self, conn, stats):
+        import backup
+
+        keep = self.backup_keep or backup.KEEP_BACKUPS
+        try:
+            manifest = backup.create_backup(self.db_name, self.backup_dir, keep)
+        except (backup.BackupError, OSError) as exc:
+            return False, f"failed: {exc}"
+        return True, (f"{os.path.basename(manifest['path'])}, {manifest['bytes'] / 2**20:,.1f} MiB → "
+                      f"{manifest['compressed_bytes'] / 2**20:,.1f} MiB, {manifest['restarts']} restarts, "
+                      f"longest step {manifest['longest_step_ms']:.0f} ms")
+
+    def run_once(self, force=False):
+        """Run the due steps now; returns [(step, seconds, ok, detail)]"""
+        results = []
+        with self._lock:
+            conn = sqlite3.connect(self.db_name, timeout=self.busy_timeout, isolation_level=None)
+            try:
+                stats = database_stats(conn, self.db_name)
+                for step in self.due_steps(conn, stats, force):
+                    start = time.perf_counter()
+                    try:
+                        ok, detail = getattr(self, f"_{step}")(conn, stats)
+                    except sqlite3.OperationalError as exc:
+                        # Usually "database is locked": an app writer had it
+                        # longer than busy_timeout, so leave it for next time
+                        ok, detail = False, f"skipped: {exc}"
+                    seconds = time.perf_counter() - start
+                    MAINTENANCE_SECONDS.observe(seconds, step=step)
+                    results.append((step, seconds, ok, detail))
+                if results:
+                    self._log(conn, stats["data_version"], results)
+            finally:
+                conn.close()
+        return results
+
+    def _log(self, conn, data_version, results):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT INTO maintenance_log (step, seconds, ok, detail, data_version) VALUES (?, ?, ?, ?, ?)",
+                [(step, seconds, int(ok), detail, data_version) for step, seconds, ok, detail in results])
+            conn.execute(
+                "DELETE FROM maintenance_log WHERE id <= (SELECT MAX(id) FROM maintenance_log) - ?", (LOG_ROWS,))
+            conn.execute("COMMIT")
+        except sqlite3.OperationalError:
+            # Losing a log line beats holding up a writer; the steps re-run if needed
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+
+
+def maintenance_log(db_name, limit=20):
+    """Most recent maintenance steps as (ran_at, step, seconds, ok, detail)"""
+    conn = sqlite3.connect(db_name)
+    try:
+        return conn.execute(
+            "SELECT ran_at, step, seconds, ok, detail FROM maintenance_log ORDER BY id DESC LIMIT ?",
+            (limit,)).fetchall()
+    finally:
+        conn.close()
+
+
+def fragmentation_report(db_name):
+    """File layout, per-table fragmentation and recommendations
+
+    Per-table numbers come from the dbstat virtual table and are left out
+    when SQLite was built without it. "scattered" is the share of a table's
+    pages that do not directly follow the previous page in key order, which
+    is what makes range scans seek.
+    """
+    conn = sqlite3.connect(f"file:{db_name}?mode=ro", uri=True)
+    try:
+        stats = database_stats(conn, db_name)
+        tables = []
+        try:
+            tables = conn.execute('''
+                SELECT name, COUNT(*), SUM(pgsize), SUM(unused), SUM(pagetype = 'overflow'),
+                       SUM(pageno != previous + 1)
+                FROM (
+                    SELECT name, pageno, pgsize, unused, pagetype,
+                           LAG(pageno) OVER (PARTITION BY name ORDER BY path) AS previous
+                    FROM dbstat
+                )
+                GROUP BY name
+                ORDER BY SUM(pgsize) DESC
+            ''').fetchall()
+        except sqlite3.OperationalError:
+            pass
+    finally:
+        conn.close()
+    report = dict(stats, tables=[
+        {"name": name, "pages": pages, "bytes": size, "unused": unused / size if size else 0.0,
+         "overflow": overflow / pages, "scattered": (scattered or 0) / pages}
+        for name, pages, size, unused, overflow, scattered in tables])
+    report["recommendations"] = _recommendations(report)
+    return report
+
+
+def _recommendations(report):
+    advice = []
+    page_size = report["page_size"]
+    free_share = report["freelist_count"] / max(report["page_count"], 1)
+    if report["freelist_count"] >= FREELIST_MIN_PAGES and free_share >= FREELIST_SHARE:
+        if report["auto_vacuum"] == 2:
+            advice.append(f"{free_share:.0%} of the file is free pages; the scheduler returns them "
+                          "with incremental vacuum")
+        else:
+            advice.append(f"{free_share:.0%} of the file is free pages; run `python maintenance.py vacuum` "
+                          "once to reclaim them and enable incremental vacuum")
+    elif report["auto_vacuum"] == 0:
+        advice.append("auto_vacuum is off, so freed pages are never returned; `python maintenance.py vacuum` "
+                      "enables incremental vacuum")
+    if page_size < 4096:
+        advice.append(f"page_size {page_size} is below the 4096-byte filesystem block; "
+                      "`python maintenance.py vacuum --page-size 4096`")
+    overflowing = [table for table in report["tables"] if table["pages"] >= 100 and table["overflow"] > 0.05]
+    if overflowing and page_size < 65536:
+        names = ", ".join(table["name"] for table in overflowing)
+        advice.append(f"{names} spill rows onto overflow pages; "
+                      f"`python maintenance.py vacuum --page-size {page_size * 2}` keeps them inline")
+    scattered = [table for table in report["tables"] if table["pages"] >= 100 and table["scattered"] > 0.5]
+    if scattered:
+        names = ", ".join(table["name"] for table in scattered[:5])
+        advice.append(f"{names} are mostly out of page order; a vacuum rewrites them contiguously")
+    if report["journal_mode"] == "wal" and report["wal_bytes"] > WAL_CHECKPOINT_BYTES:
+        advice.append(f"the WAL is {report['wal_bytes'] / 2**20:.0f} MiB; a long-lived reader may be "
+                      "holding checkpoints back")
+    return advice
+
+
+def rebuild(db_name, page_size=None):
+    """VACUUM the file, switching on incremental auto_vacuum and optionally a new page size
+
+    Takes the write lock for the whole rebuild: run it while the app is idle.
+    """
+    conn = sqlite3.connect(db_name, isolation_level=None)
+    try:
+        journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        if page_size and journal_mode == "wal":
+            # The page size of a WAL database can't change
+            conn.execute("PRAGMA journal_mode = DELETE")
+        if page_size:
+            conn.execute(f"PRAGMA page_size = {int(page_size)}")
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        if page_size and journal_mode == "wal":
+            conn.execute("PRAGMA journal_mode = WAL")
+    finally:
+        conn.close()
+
+
+# Schedulers shared by every ContentDatabase on the same file in this process
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(db_name, interval=300.0, backup_interval=0):
+    """The started scheduler for db_name, created on first use"""
+    key = os.path.abspath(db_name)
+    with _schedulers_lock:
+        if key not in _schedulers:
+            _schedulers[key] = MaintenanceScheduler(db_name, interval, backup_interval=backup_interval).start()
+        return _schedulers[key]
+
+
+def main():
+    from database import ContentDatabase
+
+    parser = argparse.ArgumentParser(description="SQLite maintenance for a ContentMood database")
+    parser.add_argument("--db", default="contentmood.db")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="run the steps that are due")
+    run_parser.add_argument("--force", action="store_true", help="run every applicable step")
+    subparsers.add_parser("report", help="fragmentation and page-size recommendations")
+    log_parser = subparsers.add_parser("log", help="recent maintenance steps")
+    log_parser.add_argument("--limit", type=int, default=20)
+    vacuum_parser = subparsers.add_parser("vacuum", help="rebuild the file with incremental auto_vacuum")
+    vacuum_parser.add_argument("--page-size", type=int)
+    args = parser.parse_args()
+
+    # Brings the schema (maintenance_log included) up to date
+    ContentDatabase(args.db, cache_bytes=0)
+    if args.command == "run":
+        results = MaintenanceScheduler(args.db, busy_timeout=5.0).run_once(force=args.force)
+        for step, seconds, ok, detail in results:
+            print(f"{'🧹' if ok else '⏭️'} {step:<19} {seconds * 1000:8.1f} ms  {detail}")
+        if not results:
+            print("✨ Nothing due")
+    elif args.command == "report":
+        report = fragmentation_report(args.db)
+        print(f"📦 {report['page_count'] * report['page_size'] / 2**20:,.1f} MiB in {report['page_count']:,} "
+              f"pages of {report['page_size']} bytes, {report['freelist_count']:,} free, "
+              f"auto_vacuum {AUTO_VACUUM_MODES.get(report['auto_vacuum'], report['auto_vacuum'])}, "
+              f"journal {report['journal_mode']} ({report['wal_bytes'] / 2**20:.1f} MiB WAL)")
+        for table in report["tables"][:15]:
+            print(f"   {table['name']:<32} {table['bytes'] / 2**20:8.1f} MiB   unused {table['unused']:4.0%}   "
+                  f"overflow {table['overflow']:4.0%}   scattered {table['scattered']:4.0%}")
+        for advice in report["recommendations"] or ["Nothing to do"]:
+            print(f"💡 {advice}")
+    elif args.command == "log":
+        for ran_at, step, seconds, ok, detail in maintenance_log(args.db, args.limit):
+            print(f"{ran_at}  {'🧹' if ok else '⏭️'} {step:<19} {seconds * 1000:8.1f} ms  {detail}")
+    else:
+        started = time.perf_counter()
+        rebuild(args.db, args.page_size)
+        print(f"✨ Rebuilt in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
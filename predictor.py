@@ -0,0 +1,153 @@
+"""Online mood_after predictor
+
+A linear model over hashed genre, content type and creator indicators plus
+the rating and mood_before, fitted with recursive least squares in NumPy.
+The fitted state is stored in the model_state table: it is built once from
+the existing mood logs, then every add_mood_log folds its row in with one
+O(dim^2) update, so the model never retrains from scratch. Logs written
+another way (imports, sync) are folded in as a batch the next time the
+model is loaded.
+"""
+import os
+import threading
+import zlib
+
+import numpy as np
+
+MODEL_NAME = "mood_after"
+
+# Bias, mood_before, rating, rating-missing flag, then hashed categories
+DIMENSIONS = 64
+NUMERIC_FEATURES = 4
+# Ridge prior: weights start at 0 with variance PRIOR_VARIANCE
+PRIOR_VARIANCE = 10.0
+TRAINING_CHUNK_ROWS = 50000
+
+_bucket_cache = {}
+# Loaded models per database file, with the data version they were loaded at
+_models = {}
+_models_lock = threading.Lock()
+
+
+def _bucket(field, value):
+    """Hashed feature index for a categorical value (stable across processes)"""
+    key = (field, value)
+    index = _bucket_cache.get(key)
+    if index is None:
+        text = f"{field}={(value or '').strip().lower()}"
+        index = NUMERIC_FEATURES + zlib.crc32(text.encode("utf-8")) % (DIMENSIONS - NUMERIC_FEATURES)
+        if len(_bucket_cache) < 100000:
+            _bucket_cache[key] = index
+    return index
+
+
+def features(genre, content_type, creator, rating, mood_before):
+    """Sparse feature vector as (indices, values)"""
+    indices = [0, 1, 2, 3, _bucket("genre", genre), _bucket("type", content_type), _bucket("creator", creator)]
+    values = [
+        1.0,
+        (mood_before - 5.5) / 4.5,
+        (rating - 5.0) / 5.0 if rating is not None else 0.0,
+        1.0 if rating is None else 0.0,
+        1.0, 1.0, 1.0,
+    ]
+    return indices, values
+
+
+def _dense(indices, values):
+    x = np.zeros(DIMENSIONS)
+    np.add.at(x, indices, values)
+    return x
+
+
+class MoodPredictor:
+    """Recursive least squares over the hashed features"""
+
+    def __init__(self, weights=None, covariance=None, updates=0, trained_through=0):
+        self.weights = np.zeros(DIMENSIONS) if weights is None else weights
+        self.covariance = np.eye(DIMENSIONS) * PRIOR_VARIANCE if covariance is None else covariance
+        self.updates = updates
+        self.trained_through = trained_through
+        self._weight_list = self.weights.tolist()
+
+    @classmethod
+    def from_state(cls, state):
+        """Rebuild from a model_state row (weights, covariance, updates, trained_through)"""
+        weights, covariance, updates, trained_through = state
+        return cls(np.frombuffer(weights, dtype=np.float64).copy(),
+                   np.frombuffer(covariance, dtype=np.float64).reshape(DIMENSIONS, DIMENSIONS).copy(),
+                   updates, trained_through)
+
+    def to_state(self):
+        return (self.weights.tobytes(), self.covariance.tobytes(), self.updates, self.trained_through)
+
+    def predict(self, genre, content_type, creator, rating, mood_before):
+        """Expected mood_after on the 1-10 scale"""
+        indices, values = features(genre, content_type, creator, rating, mood_before)
+        # A handful of multiply-adds: plain Python beats NumPy call overhead here
+        weights = self._weight_list
+        estimate = sum(weights[index] * value for index, value in zip(indices, values))
+        return min(10.0, max(1.0, estimate))
+
+    def update(self, genre, content_type, creator, rating, mood_before, mood_after, log_id=None):
+        """Fold in one observed mood log: O(DIMENSIONS^2), independent of history size"""
+        x = _dense(*features(genre, content_type, creator, rating, mood_before))
+        px = self.covariance @ x
+        gain = px / (1.0 + x @ px)
+        self.weights += gain * (mood_after - self.weights @ x)
+        self.covariance -= np.outer(gain, px)
+        self.updates += 1
+        if log_id is not None:
+            self.trained_through = log_id
+        self._weight_list = self.weights.tolist()
+
+    def fit_batch(self, rows):
+        """Fold in many (log_id, genre, content_type, creator, rating, mood_before, mood_after)
+
+        Same result as calling update() row by row, computed through the
+        normal equations in one pass.
+        """
+        if not rows:
+            return
+        x = np.zeros((len(rows), DIMENSIONS))
+        y = np.empty(len(rows))
+        for row_index, (_, genre, content_type, creator, rating, mood_before, mood_after) in enumerate(rows):
+            indices, values = features(genre, content_type, creator, rating, mood_before)
+            np.add.at(x[row_index], indices, values)
+            y[row_index] = mood_after
+        precision = np.linalg.inv(self.covariance)
+        target = precision @ self.weights + x.T @ y
+        precision += x.T @ x
+        self.covariance = np.linalg.inv(precision)
+        self.weights = self.covariance @ target
+        self.updates += len(rows)
+        self.trained_through = rows[-1][0]
+        self._weight_list = self.weights.tolist()
+
+
+def load_predictor(db):
+    """The stored predictor for db, caught up with every mood log
+
+    Kept in memory until the data version moves, so repeated predictions
+    (one per keystroke in the Add form) do not touch the database.
+    """
+    key = os.path.abspath(db.db_name)
+    version = db.get_data_version()
+    with _models_lock:
+        cached = _models.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    state = db.get_model_state(MODEL_NAME)
+    model = MoodPredictor.from_state(state) if state else MoodPredictor()
+    caught_up = False
+    while True:
+        rows = db.get_training_rows(after_id=model.trained_through, limit=TRAINING_CHUNK_ROWS)
+        if not rows:
+            break
+        model.fit_batch(rows)
+        caught_up = True
+    if caught_up or state is None:
+        db.save_model_state(MODEL_NAME, model.to_state())
+    with _models_lock:
+        _models[key] = (version, model)
+    return model
@@ -0,0 +1,306 @@
+"""Year in Review reports
+
+    python report.py --db contentmood.db --year 2025                 # reports/contentmood-2025.html
+    python report.py --dir users/ --year 2025 --workers 8            # one report per database in users/
+
+A report is one static HTML file: charts are inline SVG and print styles lay
+it out for A4, so a browser's "Save as PDF" gives a clean copy. It is built
+from the Analytics and Insights pages' own ContentDatabase queries filtered
+to the year, read once in one read session; every section is derived from
+those frames rather than querying again.
+
+Many databases (one per user) are reported on in a process pool. Each
+worker keeps its imports and a cache of drawn charts across users, keyed on
+the chart's data, so a dataset that repeats (the same genre mix, an empty
+year) is drawn once per worker.
+"""
+import argparse
+import glob
+import html
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from database import ContentDatabase
+from filters import ContentFilter
+
+MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+CONTENT_ICONS = {"Book": "📚", "Movie": "🎬", "TV Show": "📺", "Anime": "🎌", "Manga": "📖",
+                 "Game": "🎮", "Podcast": "🎙️"}
+TOP_BOOSTERS = 5
+TOP_GENRES = 10
+CLOUD_TAGS = 40
+# Drawn charts kept per process
+CHART_CACHE_SIZE = 4096
+
+ACCENT = "#A0826D"
+TEXT = "#6B5444"
+GRID = "#E8D5C4"
+STYLE = f"""
+body {{ background: #FAF6F0; color: {TEXT}; font-family: Georgia, serif; max-width: 760px;
+        margin: 2em auto; padding: 0 1em; }}
+h1 {{ text-align: center; margin-bottom: 0.2em; }}
+.subtitle {{ text-align: center; font-style: italic; margin-top: 0; }}
+section {{ margin: 2em 0; break-inside: avoid; }}
+.numbers {{ display: flex; flex-wrap: wrap; gap: 1em; justify-content: space-between; }}
+.number {{ background: #F5EFE6; border: 2px solid #D4A574; border-radius: 10px; padding: 0.8em 1em;
+           flex: 1 1 140px; text-align: center; }}
+.number strong {{ display: block; font-size: 1.6em; }}
+table {{ border-collapse: collapse; width: 100%; }}
+th, td {{ border-bottom: 1px solid {GRID}; padding: 0.35em 0.5em; text-align: left; }}
+td.value {{ text-align: right; }}
+.cloud {{ line-height: 2.2; text-align: center; }}
+.cloud span {{ margin: 0 0.4em; white-space: nowrap; }}
+svg text {{ fill: {TEXT}; font-family: Georgia, serif; }}
+@page {{ size: A4; margin: 16mm; }}
+@media print {{ body {{ background: white; margin: 0; max-width: none; }} }}
+"""
+
+
+def year_filter(year):
+    return ContentFilter(date_from=f"{year}-01-01", date_to=f"{year}-12-31")
+
+
+def _longest_run(days):
+    """Longest run of consecutive dates in days (sorted datetimes) as (length, first, last)"""
+    best = (0, None, None)
+    start = previous = None
+    for day in days:
+        if previous is None or (day - previous).days != 1:
+            start = day
+        previous = day
+        length = (day - start).days + 1
+        if length > best[0]:
+            best = (length, start, day)
+    return best
+
+
+def _optional(value):
+    """float(value), or None for NULL/NaN"""
+    return None if value is None or value != value else float(value)
+
+
+def collect(db, year):
+    """Everything a report shows for one database and year, as plain Python values"""
+    import numpy as np
+    import pandas as pd
+
+    filters = year_filter(year)
+    with db.read_session():
+        content_df = db.get_all_content(filters=filters)
+        mood_df = db.get_content_with_moods(filters=filters, with_text=True)
+        genre_df = db.get_genre_stats(filters=filters)
+
+    data = {"year": year, "entries": len(content_df)}
+    if content_df.empty:
+        return data
+    consumed = pd.to_datetime(content_df["date_consumed"].str[:10], errors="coerce").dropna()
+    days = pd.DatetimeIndex(consumed.unique()).sort_values()
+    streak, streak_start, streak_end = _longest_run(days.to_pydatetime())
+    ratings = content_df["rating"].dropna()
+    monthly = consumed.dt.month.value_counts()
+    data.update(
+        active_days=len(days),
+        average_rating=float(ratings.mean()) if not ratings.empty else None,
+        mood_boost=float(mood_df["mood_change"].sum()),
+        streak=streak,
+        streak_start=streak_start.strftime("%b %d") if streak_start else None,
+        streak_end=streak_end.strftime("%b %d") if streak_end else None,
+        monthly=tuple(int(monthly.get(month, 0)) for month in range(1, 13)),
+        types=tuple((str(kind), int(count)) for kind, count in content_df["content_type"].value_counts().items()),
+        ratings=tuple(int(count) for count in np.bincount(ratings.clip(0, 10).to_numpy(dtype=int), minlength=11)),
+        genres=tuple((str(genre), int(count), _optional(rating), _optional(change))
+                     for genre, count, rating, change in genre_df.head(TOP_GENRES)[
+                         ["genre", "count", "avg_rating", "avg_mood_change"]].itertuples(index=False, name=None)),
+    )
+    # As on the Analytics and Insights pages
+    genre_mood = mood_df.groupby("genre")["mood_change"].mean().dropna().sort_values(ascending=False)
+    data["genre_mood"] = tuple((str(genre), round(float(change), 2)) for genre, change in genre_mood.head(TOP_GENRES).items())
+    data["happy_place"] = data["genre_mood"][0] if data["genre_mood"] else None
+    boosters = mood_df.nlargest(TOP_BOOSTERS, "mood_change")
+    data["boosters"] = [(row.title, row.content_type, float(row.mood_change),
+                         row.emotional_tags if isinstance(row.emotional_tags, str) else "")
+                        for row in boosters.itertuples()]
+    tags = mood_df["emotional_tags"].dropna().str.lower().str.split(",").explode().str.strip()
+    data["tags"] = tuple((str(tag), int(count)) for tag, count in tags[tags != ""].value_counts().head(CLOUD_TAGS).items())
+    return data
+
+
+@lru_cache(maxsize=CHART_CACHE_SIZE)
+def bar_chart(labels, values, horizontal=False, value_format="{:,.0f}"):
+    """Inline SVG bar chart; labels and values are tuples so the drawing is cached"""
+    if not values:
+        return ""
+    low, high = min(0, min(values)), max(0, max(values))
+    span = (high - low) or 1
+    parts = []
+    if horizontal:
+        label_width, bar_width, row = 170, 420, 26
+        width, height = label_width + bar_width + 60, row * len(values) + 10
+        zero = label_width + bar_width * (-low / span)
+        for index, (label, value) in enumerate(zip(labels, values)):
+            y = 5 + index * row
+            x = zero + min(0, value) / span * bar_width
+            end = zero + max(0, value) / span * bar_width
+            parts.append(f'<text x="{label_width - 8}" y="{y + 17}" text-anchor="end">{html.escape(str(label))}</text>'
+                         f'<rect x="{x:.1f}" y="{y + 3}" width="{max(end - x, 1):.1f}" height="{row - 8}" fill="{ACCENT}"/>'
+                         f'<text x="{end + 6:.1f}" y="{y + 17}">{value_format.format(value)}</text>')
+        parts.append(f'<line x1="{zero:.1f}" y1="0" x2="{zero:.1f}" y2="{height}" stroke="{GRID}"/>')
+    else:
+        width, height, top, bottom = 680, 220, 20, 30
+        slot = width / len(values)
+        zero = top + (height - top - bottom) * (high / span)
+        for index, (label, value) in enumerate(zip(labels, values)):
+            x = index * slot
+            y = zero - max(0, value) / span * (height - top - bottom)
+            bar = abs(value) / span * (height - top - bottom)
+            parts.append(f'<rect x="{x + slot * 0.15:.1f}" y="{y:.1f}" width="{slot * 0.7:.1f}" height="{max(bar, 0.5):.1f}" '
+                         f'fill="{ACCENT}"/>'
+                         f'<text x="{x + slot / 2:.1f}" y="{y - 5:.1f}" text-anchor="middle" font-size="12">'
+                         f'{value_format.format(value) if value else ""}</text>'
+                         f'<text x="{x + slot / 2:.1f}" y="{height - 10}" text-anchor="middle" font-size="12">'
+                         f'{html.escape(str(label))}</text>')
+        parts.append(f'<line x1="0" y1="{zero:.1f}" x2="{width}" y2="{zero:.1f}" stroke="{GRID}"/>')
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width} {height}" width="100%" '
+            f'role="img">{"".join(parts)}</svg>')
+
+
+def _tag_cloud(tags):
+    if not tags:
+        return ""
+    most = tags[0][1]
+    return "".join(f'<span style="font-size: {12 + 20 * (count / most) ** 0.5:.0f}px">{html.escape(tag)}</span> '
+                   for tag, count in tags)
+
+
+def render(data, name=None):
+    """The report's HTML page, titled for name (or "Your")"""
+    year = data["year"]
+    title = f"{html.escape(name)}'s {year} in Review" if name else f"Your {year} in Review"
+    head = (f'<!DOCTYPE html><html lang="en"><head><meta charset="utf-8"><title>{title}</title>'
+            f'<style>{STYLE}</style></head><body><h1>📖 {title}</h1>')
+    if not data["entries"]:
+        return head + f'<p class="subtitle">Nothing logged in {year} yet.</p></body></html>'
+    numbers = [("💪 Entries", f"{data['entries']:,}"), ("📅 Active days", f"{data['active_days']:,}"),
+               ("🔥 Longest streak", f"{data['streak']} day{'s' if data['streak'] != 1 else ''}"),
+               ("✨ Total mood boost", f"{data['mood_boost']:+.1f}")]
+    if data["average_rating"] is not None:
+        numbers.append(("⭐ Average rating", f"{data['average_rating']:.1f}/10"))
+    sections = [
+        '<p class="subtitle">What you read, watched and played, and how it made you feel</p>',
+        '<section class="numbers">' + "".join(f'<div class="number"><strong>{value}</strong>{label}</div>'
+                                              for label, value in numbers) + "</section>",
+    ]
+    if data["streak"] > 1:
+        sections.append(f'<p class="subtitle">Your longest run was {data["streak"]} days in a row, '
+                        f'{data["streak_start"]} to {data["streak_end"]}.</p>')
+    sections.append(f'<section><h2>📅 Month by Month</h2>{bar_chart(MONTHS, data["monthly"])}</section>')
+    labels = tuple(f"{CONTENT_ICONS.get(kind, '')} {kind}" for kind, _ in data["types"])
+    values = tuple(count for _, count in data["types"])
+    sections.append(f'<section><h2>📚 What You Picked Up</h2>{bar_chart(labels, values, True)}</section>')
+    if data["happy_place"]:
+        genre, boost = data["happy_place"]
+        sections.append(f'<section class="number"><h2>☀️ Your Happy Place: {html.escape(genre)}</h2>'
+                        f'<p>This genre lifted your mood by <strong>{boost:+.1f} points</strong> on average.</p></section>')
+    if data["boosters"]:
+        rows = "".join(f'<tr><td>{CONTENT_ICONS.get(kind, "")} <strong>{html.escape(str(title))}</strong></td>'
+                       f'<td>{html.escape(tags)}</td><td class="value">{change:+.1f}</td></tr>'
+                       for title, kind, change, tags in data["boosters"])
+        sections.append('<section><h2>✨ Top Mood Boosters</h2><table><tr><th>Title</th><th>Tags</th>'
+                        f'<th class="value">Mood boost</th></tr>{rows}</table></section>')
+    if data["genre_mood"]:
+        labels = tuple(genre for genre, _ in data["genre_mood"])
+        values = tuple(change for _, change in data["genre_mood"])
+        chart = bar_chart(labels, values, True, "{:+.1f}")
+        sections.append(f'<section><h2>🎭 Mood Impact by Genre</h2>{chart}</section>')
+    if data["genres"]:
+        rows = "".join(f'<tr><td>{html.escape(genre)}</td><td class="value">{count:,}</td>'
+                       f'<td class="value">{"" if rating is None else format(rating, ".1f")}</td>'
+                       f'<td class="value">{"" if change is None else format(change, "+.1f")}</td></tr>'
+                       for genre, count, rating, change in data["genres"])
+        sections.append('<section><h2>🏷️ Genres</h2><table><tr><th>Genre</th><th class="value">Entries</th>'
+                        f'<th class="value">Avg rating</th><th class="value">Avg mood change</th></tr>{rows}</table>'
+                        '</section>')
+    sections.append('<section><h2>⭐ Ratings</h2>'
+                    f'{bar_chart(tuple(str(point) for point in range(11)), data["ratings"])}</section>')
+    if data["tags"]:
+        sections.append(f'<section><h2>💭 How It Felt</h2><p class="cloud">{_tag_cloud(data["tags"])}</p></section>')
+    return head + "".join(sections) + "</body></html>"
+
+
+def report_path(db_name, year, directory):
+    return os.path.join(directory, f"{os.path.splitext(os.path.basename(db_name))[0]}-{year}.html")
+
+
+def write_report(db_name, year, directory="reports"):
+    """Build and write the report for one database; returns (db_name, path, entries, seconds)"""
+    started = time.perf_counter()
+    data = collect(ContentDatabase(db_name, cache_bytes=0), year)
+    path = report_path(db_name, year, directory)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        file.write(render(data, os.path.splitext(os.path.basename(db_name))[0]))
+    os.replace(tmp_path, path)
+    return db_name, path, data["entries"], time.perf_counter() - started
+
+
+def _write_report(task):
+    return write_report(*task)
+
+
+def generate_reports(db_names, year, directory="reports", workers=1, progress=None):
+    """Write the year's report for every database; returns write_report's results in order
+
+    With workers > 1 databases are handed to a process pool in chunks, so
+    each worker amortizes its imports and chart cache over many users.
+    progress, when given, is called with (done, total) as reports finish.
+    """
+    os.makedirs(directory, exist_ok=True)
+    tasks = [(db_name, year, directory) for db_name in db_names]
+    results = []
+    if workers <= 1:
+        for task in tasks:
+            results.append(_write_report(task))
+            if progress:
+                progress(len(results), len(tasks))
+        return results
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for result in pool.map(_write_report, tasks, chunksize=max(1, len(tasks) // (workers * 8))):
+            results.append(result)
+            if progress:
+                progress(len(results), len(tasks))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Year in Review reports")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--db", default="contentmood.db")
+    source.add_argument("--dir", help="report on every *.db in this directory (one per user)")
+    parser.add_argument("--year", type=int, default=time.localtime().tm_year)
+    parser.add_argument("--out", default="reports")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    db_names = sorted(glob.glob(os.path.join(glob.escape(args.dir), "*.db"))) if args.dir else [args.db]
+    started = time.perf_counter()
+
+    def report(done, total):
+        elapsed = time.perf_counter() - started
+        sys.stderr.write(f"\r📄 {done:,}/{total:,} reports ({done / max(elapsed, 1e-9) * 60:,.0f}/min)")
+        sys.stderr.flush()
+
+    results = generate_reports(db_names, args.year, args.out, min(args.workers, len(db_names)), report)
+    sys.stderr.write("\n")
+    elapsed = time.perf_counter() - started
+    if len(results) == 1:
+        print(f"✨ Wrote {results[0][1]} ({results[0][2]:,} entries in {args.year})")
+    else:
+        print(f"✨ Wrote {len(results):,} {args.year} reports to {args.out}/ in {elapsed:.1f}s "
+              f"({len(results) / elapsed * 60:,.0f} reports/min)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""Lexicon-based sentiment and emotion scoring for content notes
+
+    python sentiment.py --db contentmood.db --workers 8
+
+Notes are scored in batches with NumPy and stored in the database keyed by a
+hash of the note text, so identical notes are scored once and only new or
+edited notes are ever rescored. The command above backfills every unscored
+note across a pool of worker processes.
+"""
+import argparse
+import hashlib
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from database import ContentDatabase
+
+EMOTIONS = ("joy", "sadness", "anger", "fear", "calm")
+
+# word: (valence from -4 to 4, emotion or None)
+LEXICON = {
+    # joy
+    "happy": (3, "joy"), "happiest": (3, "joy"), "happiness": (3, "joy"), "joy": (3, "joy"),
+    "joyful": (3, "joy"), "fun": (2, "joy"), "funny": (2, "joy"), "hilarious": (3, "joy"),
+    "laugh": (2, "joy"), "laughed": (2, "joy"), "laughing": (2, "joy"), "love": (3, "joy"),
+    "loved": (3, "joy"), "loving": (3, "joy"), "lovely": (3, "joy"), "amazing": (3, "joy"),
+    "awesome": (3, "joy"), "great": (3, "joy"), "good": (2, "joy"), "best": (3, "joy"),
+    "beautiful": (3, "joy"), "wonderful": (3, "joy"), "fantastic": (3, "joy"),
+    "brilliant": (3, "joy"), "excellent": (3, "joy"), "perfect": (3, "joy"),
+    "delightful": (3, "joy"), "charming": (2, "joy"), "sweet": (2, "joy"), "cute": (2, "joy"),
+    "wholesome": (3, "joy"), "heartwarming": (3, "joy"), "uplifting": (3, "joy"),
+    "inspiring": (3, "joy"), "inspired": (2, "joy"), "hyped": (2, "joy"), "excited": (3, "joy"),
+    "exciting": (2, "joy"), "epic": (2, "joy"), "magic": (2, "joy"), "magical": (2, "joy"),
+    "enjoyed": (2, "joy"), "enjoy": (2, "joy"), "satisfying": (2, "joy"), "masterpiece": (4, "joy"),
+    "favorite": (3, "joy"), "favourite": (3, "joy"), "adorable": (3, "joy"), "chaos": (1, "joy"),
+    "romantic": (2, "joy"), "hope": (2, "joy"), "hopeful": (2, "joy"), "grateful": (3, "joy"),
+    "proud": (2, "joy"), "triumphant": (3, "joy"), "thrilling": (2, "joy"), "gripping": (2, "joy"),
+    "engaging": (2, "joy"), "intrigued": (1, "joy"), "interesting": (1, "joy"), "interested": (1, "joy"),
+    "mindblown": (2, "joy"),
+    # sadness
+    "sad": (-2, "sadness"), "sadness": (-2, "sadness"), "cry": (-2, "sadness"),
+    "cried": (-2, "sadness"), "crying": (-2, "sadness"), "tears": (-2, "sadness"),
+    "heartbreaking": (-3, "sadness"), "heartbroken": (-3, "sadness"), "devastating": (-3, "sadness"),
+    "devastated": (-3, "sadness"), "destroyed": (-3, "sadness"), "depressing": (-3, "sadness"),
+    "depressed": (-3, "sadness"), "lonely": (-2, "sadness"), "grief": (-3, "sadness"),
+    "tragic": (-3, "sadness"), "tragedy": (-3, "sadness"), "miss": (-1, "sadness"),
+    "melancholy": (-2, "sadness"), "bittersweet": (-1, "sadness"), "emotional": (-1, "sadness"),
+    "gutted": (-3, "sadness"), "sobbing": (-3, "sadness"), "loss": (-2, "sadness"),
+    "disappointed": (-2, "sadness"), "disappointing": (-2, "sadness"), "boring": (-2, "sadness"),
+    "bored": (-2, "sadness"), "dull": (-2, "sadness"), "slow": (-1, "sadness"), "meh": (-1, "sadness"),
+    "nostalgic": (1, "sadness"),
+    # anger
+    "angry": (-3, "anger"), "anger": (-3, "anger"), "furious": (-3, "anger"), "hate": (-3, "anger"),
+    "hated": (-3, "anger"), "annoying": (-2, "anger"), "annoyed": (-2, "anger"),
+    "frustrating": (-2, "anger"), "frustrated": (-2, "anger"), "awful": (-3, "anger"),
+    "terrible": (-3, "anger"), "horrible": (-3, "anger"), "worst": (-3, "anger"), "bad": (-2, "anger"),
+    "stupid": (-2, "anger"), "ridiculous": (-2, "anger"), "rage": (-3, "anger"), "mad": (-2, "anger"),
+    "infuriating": (-3, "anger"), "overrated": (-2, "anger"), "waste": (-2, "anger"),
+    # fear
+    "scary": (-2, "fear"), "scared": (-2, "fear"), "terrifying": (-2, "fear"), "terrified": (-3, "fear"),
+    "creepy": (-1, "fear"), "horror": (-1, "fear"), "anxious": (-2, "fear"), "anxiety": (-2, "fear"),
+    "tense": (-1, "fear"), "stressful": (-2, "fear"), "stressed": (-2, "fear"), "nervous": (-2, "fear"),
+    "dread": (-2, "fear"), "disturbing": (-2, "fear"), "unsettling": (-2, "fear"),
+    "shocked": (-1, "fear"), "shocking": (-1, "fear"), "haunting": (-1, "fear"), "dark": (-1, "fear"),
+    "worried": (-2, "fear"), "panic": (-3, "fear"), "nightmare": (-3, "fear"),
+    # calm
+    "calm": (2, "calm"), "cozy": (2, "calm"), "cosy": (2, "calm"), "comfort": (2, "calm"),
+    "comforting": (2, "calm"), "relaxing": (2, "calm"), "relaxed": (2, "calm"), "peaceful": (2, "calm"),
+    "chill": (1, "calm"), "gentle": (1, "calm"), "soothing": (2, "calm"), "lazy": (1, "calm"),
+    "warm": (2, "calm"), "healing": (2, "calm"), "quiet": (1, "calm"), "serene": (2, "calm"),
+    "content": (1, "calm"), "safe": (1, "calm"), "vibes": (1, "calm"),
+}
+
+NEGATIONS = {"not", "no", "never", "didn't", "don't", "doesn't", "wasn't", "isn't", "aren't",
+             "won't", "can't", "couldn't", "nothing", "hardly", "barely", "without"}
+INTENSIFIERS = {"so", "very", "really", "extremely", "super", "incredibly", "totally",
+                "absolutely", "completely", "utterly", "deeply", "truly", "much"}
+
+# Squashes the summed valence into (-1, 1); the same normalisation VADER uses
+NORMALIZATION_ALPHA = 15.0
+NEGATION_SCALAR = -0.74
+INTENSIFIER_SCALAR = 1.3
+
+DEFAULT_BATCH_SIZE = 10000
+
+_TOKEN_RE = re.compile(r"[a-z]+(?:'[a-z]+)?")
+
+# Word index 0 is reserved for words outside the lexicon
+_VOCAB = {word: index for index, word in enumerate(LEXICON, start=1)}
+_VALENCE = np.array([0.0] + [valence for valence, _ in LEXICON.values()])
+_EMOTION = np.array([-1] + [EMOTIONS.index(emotion) if emotion else -1 for _, emotion in LEXICON.values()])
+
+
+def notes_hash(notes):
+    return hashlib.sha1(notes.encode("utf-8")).hexdigest()
+
+
+def score_batch(texts):
+    """Score many notes at once
+
+    Returns (sentiment, emotions, matched_words): sentiment in (-1, 1) per
+    note, an array with the share of each EMOTIONS column among the note's
+    emotion words, and how many lexicon words the note contained.
+    """
+    tokenized = [_TOKEN_RE.findall(text.lower()) for text in texts]
+    lengths = np.fromiter((len(tokens) for tokens in tokenized), dtype=np.int64, count=len(texts))
+    words = [token for tokens in tokenized for token in tokens]
+    count = len(texts)
+    if not words:
+        return np.zeros(count), np.zeros((count, len(EMOTIONS))), np.zeros(count, dtype=np.int64)
+
+    doc = np.repeat(np.arange(count), lengths)
+    ids = np.fromiter((_VOCAB.get(word, 0) for word in words), dtype=np.int64, count=len(words))
+    negation = np.fromiter((word in NEGATIONS for word in words), dtype=bool, count=len(words))
+    intensifier = np.fromiter((word in INTENSIFIERS for word in words), dtype=bool, count=len(words))
+
+    # A modifier applies to the next one or two words of the same note
+    def preceded_by(flags):
+        hit = np.zeros(len(words), dtype=bool)
+        for distance in (1, 2):
+            hit[distance:] |= flags[:-distance] & (doc[distance:] == doc[:-distance])
+        return hit
+
+    negated = preceded_by(negation)
+    intensified = preceded_by(intensifier)
+
+    valence = _VALENCE[ids] * np.where(negated, NEGATION_SCALAR, 1.0) * np.where(intensified, INTENSIFIER_SCALAR, 1.0)
+    total = np.bincount(doc, weights=valence, minlength=count)
+    sentiment = total / np.sqrt(total * total + NORMALIZATION_ALPHA)
+
+    # Negated emotion words ("not scary") say little about the emotion felt
+    emotion = _EMOTION[ids]
+    counted = (emotion >= 0) & ~negated
+    emotions = np.zeros((count, len(EMOTIONS)))
+    np.add.at(emotions, (doc[counted], emotion[counted]), 1.0)
+    emotion_words = emotions.sum(axis=1, keepdims=True)
+    emotions = np.divide(emotions, emotion_words, out=emotions, where=emotion_words > 0)
+
+    matched_words = np.bincount(doc, weights=ids > 0, minlength=count).astype(np.int64)
+    return sentiment, emotions, matched_words
+
+
+def score_rows(hashed_texts):
+    """Score [(notes_hash, text)] into rows for ContentDatabase.save_note_scores"""
+    sentiment, emotions, matched = score_batch([text for _, text in hashed_texts])
+    return [
+        (notes_hash_, float(sentiment[row]), *(float(share) for share in emotions[row]), int(matched[row]))
+        for row, (notes_hash_, _) in enumerate(hashed_texts)
+    ]
+
+
+def _pending_batches(db, batch_size):
+    """Yield (assignments, unscored) per batch of content rows whose notes need a score"""
+    last_id = 0
+    while True:
+        rows = db.get_unscored_notes(after_id=last_id, limit=batch_size)
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        texts = {}
+        assignments = []
+        for content_id, notes in rows:
+            digest = notes_hash(notes)
+            texts[digest] = notes
+            assignments.append((content_id, digest))
+        known = db.get_scored_hashes(texts)
+        yield assignments, [(digest, text) for digest, text in texts.items() if digest not in known]
+
+
+def update_scores(db, workers=1, batch_size=DEFAULT_BATCH_SIZE, max_rows=None, progress=None):
+    """Score every note that is new or changed since it was last scored
+
+    With workers > 1 batches are scored in a process pool while this process
+    keeps reading and writing. max_rows stops after roughly that many rows.
+    progress, when given, is called after every batch with (rows, scored).
+    Returns (rows_assigned, notes_scored).
+    """
+    rows = scored = 0
+
+    def save(assignments, scores):
+        nonlocal rows, scored
+        db.save_note_scores(scores, assignments)
+        rows += len(assignments)
+        scored += len(scores)
+        if progress:
+            progress(rows, scored)
+
+    batches = _pending_batches(db, batch_size)
+    if workers <= 1:
+        for assignments, unscored in batches:
+            save(assignments, score_rows(unscored))
+            if max_rows is not None and rows >= max_rows:
+                break
+        return rows, scored
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = []
+        for assignments, unscored in batches:
+            in_flight.append((assignments, pool.submit(score_rows, unscored)))
+            # Keep every worker busy without reading the whole backlog into memory
+            if len(in_flight) >= 2 * workers:
+                assignments, future = in_flight.pop(0)
+                save(assignments, future.result())
+            if max_rows is not None and rows >= max_rows:
+                break
+        for assignments, future in in_flight:
+            save(assignments, future.result())
+    return rows, scored
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score the sentiment of content notes")
+    parser.add_argument("--db", default="contentmood.db")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+
+    def report(rows, scored):
+        elapsed = time.perf_counter() - started
+        sys.stderr.write(f"\r💭 {rows:,} notes, {scored:,} scored ({rows / max(elapsed, 1e-9):,.0f}/s)")
+        sys.stderr.flush()
+
+    rows, scored = update_scores(ContentDatabase(args.db), workers=args.workers,
+                                 batch_size=args.batch_size, progress=report)
+    sys.stderr.write("\n")
+    print(f"✨ Scored {scored:,} distinct notes for {rows:,} entries with {args.workers} worker(s) "
+          f"in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""Approximate analytics over the whole history with probabilistic sketches
+
+    t-digest     rating and mood-change quantiles
+    HyperLogLog  distinct creators and genres
+    count-min    emotional tag frequencies (plus a short list of heavy hitters)
+
+The sketches are kept in a file next to the database (contentmood.sketches.npz)
+and maintained incrementally the same way the DuckDB mirror is: rows with
+ids past the last sketched id are folded in, and only an in-place update or
+delete (the *_rewrites counters in db_meta) forces a rebuild, since these
+sketches cannot forget a value. Every estimate comes with its error bound.
+"""
+import hashlib
+import math
+import os
+import threading
+
+import numpy as np
+
+from incremental import (PerDatabase, load_arrays, meta_arrays, meta_from_arrays, read_meta, rewrite_counts,
+                         rewritten, save_arrays)
+
+SKETCH_CHUNK_ROWS = 200000
+HLL_PRECISION = 14
+CMS_WIDTH = 2048
+CMS_DEPTH = 5
+HEAVY_HITTERS = 100
+TDIGEST_COMPRESSION = 100
+# Two standard errors, i.e. roughly 95% confidence
+CONFIDENCE_SIGMAS = 2
+
+
+def _hash64(values):
+    """Stable 64-bit hashes (uint64 array) for a sequence of strings"""
+    return np.array([int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "little")
+                     for value in values], dtype=np.uint64)
+
+
+class TDigest:
+    """Merging t-digest: quantiles with small rank error, tightest at the tails
+
+    Each centroid also keeps the lowest and highest value it absorbed; a
+    centroid holding a single distinct value answers exactly.
+    """
+
+    def __init__(self, compression=TDIGEST_COMPRESSION):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.lows = np.empty(0)
+        self.highs = np.empty(0)
+
+    @property
+    def count(self):
+        return float(self.weights.sum())
+
+    def _k(self, q):
+        return self.compression / (2 * math.pi) * math.asin(2 * min(max(q, 0.0), 1.0) - 1)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        # Repeated values (ratings come in half steps) enter as one weighted point
+        points, counts = np.unique(values, return_counts=True)
+        self._merge(np.concatenate([self.means, points]), np.concatenate([self.weights, counts]),
+                    np.concatenate([self.lows, points]), np.concatenate([self.highs, points]))
+
+    def _merge(self, means, weights, lows, highs):
+        order = np.argsort(means, kind="stable")
+        means, weights, lows, highs = means[order], weights[order], lows[order], highs[order]
+        total = weights.sum()
+        merged = []
+        mean, weight, low, high = means[0], weights[0], lows[0], highs[0]
+        before = 0.0
+        k_start = self._k(0.0)
+        for next_mean, next_weight, next_low, next_high in zip(means[1:], weights[1:], lows[1:], highs[1:]):
+            if self._k((before + weight + next_weight) / total) - k_start <= 1:
+                weight += next_weight
+                mean += (next_mean - mean) * next_weight / weight
+                low, high = min(low, next_low), max(high, next_high)
+            else:
+                merged.append((mean, weight, low, high))
+                before += weight
+                k_start = self._k(before / total)
+                mean, weight, low, high = next_mean, next_weight, next_low, next_high
+        merged.append((mean, weight, low, high))
+        self.means, self.weights, self.lows, self.highs = (np.array(column) for column in zip(*merged))
+
+    def quantile(self, q):
+        """(value, rank_error) for quantile q; rank_error is a fraction of the count"""
+        if not len(self.means):
+            return float("nan"), 0.0
+        total = self.weights.sum()
+        cumulative = np.cumsum(self.weights)
+        index = min(int(np.searchsorted(cumulative, q * total)), len(self.means) - 1)
+        if self.lows[index] == self.highs[index]:
+            return float(self.means[index]), 0.0
+        centers = cumulative - self.weights / 2
+        return float(np.interp(q * total, centers, self.means)), float(self.weights[index] / (2 * total))
+
+    def histogram(self, bins, value_range):
+        """Approximate (counts, edges), placing each centroid's weight at its mean"""
+        return np.histogram(self.means, bins=bins, range=value_range, weights=self.weights)
+
+    def to_arrays(self, prefix):
+        return {f"{prefix}_centroids": np.stack([self.means, self.weights, self.lows, self.highs])}
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix):
+        digest = cls()
+        digest.means, digest.weights, digest.lows, digest.highs = arrays[f"{prefix}_centroids"]
+        return digest
+
+
+class HyperLogLog:
+    """Distinct count in 2^precision one-byte registers"""
+
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def update(self, values):
+        distinct = {value for value in values if value}
+        if not distinct:
+            return
+        hashes = _hash64(distinct)
+        index = (hashes >> np.uint64(64 - self.precision)).astype(np.int64)
+        rest_bits = 64 - self.precision
+        rest = hashes & np.uint64((1 << rest_bits) - 1)
+        # Position of the first set bit after the index bits (bit_length is exact)
+        ranks = np.array([rest_bits - int(value).bit_length() + 1 for value in rest], dtype=np.uint8)
+        np.maximum.at(self.registers, index, ranks)
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            return m * math.log(m / zeros)
+        return float(raw)
+
+    @property
+    def relative_error(self):
+        """Standard error of estimate() as a fraction"""
+        return 1.04 / math.sqrt(len(self.registers))
+
+
+class CountMinSketch:
+    """Frequencies that are never underestimated, plus the current heavy hitters
+
+    An estimate exceeds the true count by at most e / width of the total with
+    probability 1 - exp(-depth).
+    """
+
+    def __init__(self, width=CMS_WIDTH, depth=CMS_DEPTH, heavy_hitters=HEAVY_HITTERS):
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self.total = 0
+        self.heavy_hitters = heavy_hitters
+        self.candidates = []
+
+    def _columns(self, keys):
+        hashes = _hash64(keys)
+        first, second = hashes & np.uint64(0xFFFFFFFF), (hashes >> np.uint64(32)) | np.uint64(1)
+        width = np.uint64(self.table.shape[1])
+        return [((first + np.uint64(row) * second) % width).astype(np.int64) for row in range(len(self.table))]
+
+    def update(self, counts):
+        """Add a {key: count} batch"""
+        if not counts:
+            return
+        keys = list(counts)
+        values = np.array([counts[key] for key in keys], dtype=np.int64)
+        for row, columns in enumerate(self._columns(keys)):
+            np.add.at(self.table[row], columns, values)
+        self.total += int(values.sum())
+        candidates = list(dict.fromkeys(self.candidates + keys))
+        estimates = self.estimate(candidates)
+        order = np.argsort(-estimates, kind="stable")[:self.heavy_hitters]
+        self.candidates = [candidates[index] for index in order]
+
+    def estimate(self, keys):
+        if not keys:
+            return np.empty(0, dtype=np.int64)
+        return np.min([self.table[row, columns] for row, columns in enumerate(self._columns(keys))], axis=0)
+
+    def top(self, n=10):
+        """[(key, estimated_count)] for the n most frequent keys seen"""
+        keys = self.candidates[:n]
+        return list(zip(keys, self.estimate(keys).tolist()))
+
+    @property
+    def error_bound(self):
+        """Largest overestimate (in counts) at confidence 1 - exp(-depth)"""
+        return math.e / self.table.shape[1] * self.total
+
+    @property
+    def confidence(self):
+        return 1 - math.exp(-len(self.table))
+
+
+class HistorySketches:
+    """All sketches for one database, caught up on demand"""
+
+    def __init__(self, db, path=None):
+        self.db = db
+        self.path = path or f"{os.path.splitext(db.db_name)[0]}.sketches.npz"
+        self._lock = threading.Lock()
+        self._reset()
+        if not load_arrays(self.path, self._load):
+            self._reset()
+
+    def _reset(self):
+        self.ratings = TDigest()
+        self.mood_changes = TDigest()
+        self.creators = HyperLogLog()
+        self.genres = HyperLogLog()
+        self.tags = CountMinSketch()
+        self.meta = {"content_through": 0, "mood_logs_through": 0, "content_rewrites": None,
+                     "mood_logs_rewrites": None, "data_version": None, "content_rows": 0, "mood_log_rows": 0}
+
+    def _load(self, arrays):
+        self.ratings = TDigest.from_arrays(arrays, "ratings")
+        self.mood_changes = TDigest.from_arrays(arrays, "mood_changes")
+        self.creators.registers = arrays["creators"]
+        self.genres.registers = arrays["genres"]
+        self.tags.table = arrays["tags_table"]
+        self.tags.candidates = arrays["tags_candidates"].tolist()
+        self.tags.total = int(arrays["tags_total"])
+        self.meta = meta_from_arrays(arrays)
+
+    def _save(self):
+        save_arrays(self.path, {
+            **self.ratings.to_arrays("ratings"), **self.mood_changes.to_arrays("mood_changes"),
+            "creators": self.creators.registers, "genres": self.genres.registers,
+            "tags_table": self.tags.table, "tags_candidates": np.array(self.tags.candidates, dtype=str),
+            "tags_total": np.int64(self.tags.total), **meta_arrays(self.meta),
+        })
+
+    def sync(self):
+        """Fold in rows written since the last sync; True if any were folded in"""
+        import pandas as pd
+        with self._lock, self.db._reader() as source:
+            meta = read_meta(source)
+            if self.meta["data_version"] == meta.get("data_version"):
+                return False
+            folded = self.meta["data_version"] is None
+            if rewritten(self.meta, meta, ("content", "mood_logs")):
+                self._reset()
+                folded = True
+            for chunk in pd.read_sql_query(
+                    "SELECT id, genre, creator, rating FROM content WHERE id > ? ORDER BY id", source,
+                    params=(self.meta["content_through"],), chunksize=SKETCH_CHUNK_ROWS):
+                # pandas yields one empty chunk when there is nothing new
+                if chunk.empty:
+                    continue
+                self.ratings.update(chunk["rating"].to_numpy(dtype=float, na_value=np.nan))
+                self.creators.update(chunk["creator"].dropna().unique())
+                self.genres.update(chunk["genre"].dropna().unique())
+                self.meta["content_rows"] += len(chunk)
+                self.meta["content_through"] = int(chunk["id"].iloc[-1])
+                folded = True
+            for chunk in pd.read_sql_query(
+                    "SELECT id, mood_after - mood_before AS mood_change, emotional_tags FROM mood_logs "
+                    "WHERE id > ? ORDER BY id", source,
+                    params=(self.meta["mood_logs_through"],), chunksize=SKETCH_CHUNK_ROWS):
+                if chunk.empty:
+                    continue
+                self.mood_changes.update(chunk["mood_change"].to_numpy(dtype=float, na_value=np.nan))
+                tags = (chunk["emotional_tags"].dropna().map(self.db.decode_text)
+                        .str.lower().str.split(",").explode().str.strip())
+                self.tags.update(tags[tags != ""].value_counts().to_dict())
+                self.meta["mood_log_rows"] += len(chunk)
+                self.meta["mood_logs_through"] = int(chunk["id"].iloc[-1])
+                folded = True
+            self.meta.update(data_version=meta.get("data_version"),
+                             **rewrite_counts(meta, ("content", "mood_logs")))
+            if folded:
+                self._save()
+        return folded
+
+    def summary(self, quantiles=(0.1, 0.25, 0.5, 0.75, 0.9), top_tags=10):
+        """Estimates with their error bounds, as plain dicts"""
+        self.sync()
+        with self._lock:
+            def distinct(sketch):
+                estimate = sketch.estimate()
+                return {"estimate": estimate,
+                        "error": CONFIDENCE_SIGMAS * sketch.relative_error * estimate}
+
+            def quantile_rows(digest):
+                rows = []
+                for q in quantiles:
+                    value, rank_error = digest.quantile(q)
+                    rows.append({"quantile": q, "value": value, "rank_error": rank_error})
+                return rows
+
+            return {
+                "content_rows": self.meta["content_rows"],
+                "mood_log_rows": self.meta["mood_log_rows"],
+                "distinct_creators": distinct(self.creators),
+                "distinct_genres": distinct(self.genres),
+                "distinct_confidence": 0.95,
+                "rating_quantiles": quantile_rows(self.ratings),
+                "rating_histogram": self.ratings.histogram(20, (0, 10)),
+                "mood_change_quantiles": quantile_rows(self.mood_changes),
+                "top_tags": self.tags.top(top_tags),
+                "tag_error": self.tags.error_bound,
+                "tag_confidence": self.tags.confidence,
+                "sketch_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            }
+
+
+_instances = PerDatabase(HistorySketches)
+
+
+def get_sketches(db):
+    """The shared HistorySketches for db's file"""
+    return _instances.get(db)
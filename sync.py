@@ -0,0 +1,148 @@
+"""Incremental sync between ContentMood databases
+
+    python sync.py sync other-device.db
+    python sync.py sync http://server:8000
+    python sync.py export --since 0 -o changes.json.gz
+    python sync.py apply changes.json.gz
+    python sync.py device-id --new
+
+Both sides keep an append-only change log (filled by triggers, see
+ContentDatabase._create_sync_tables). A sync pulls the peer's changes made
+since the last sync and pushes ours the other way, so after a day of
+activity only that day's rows travel. Conflicting edits of the same row are
+settled by last-writer-wins on (change time, device id), which every
+database evaluates the same way.
+
+After copying a database file to a new device, give the copy its own
+identity with `python sync.py device-id --new` before editing it.
+"""
+import argparse
+import gzip
+import json
+import sys
+import time
+import urllib.request
+from urllib.parse import urlencode
+
+from database import ContentDatabase
+
+DEFAULT_BATCH_SIZE = 5000
+
+
+class RemoteDatabase:
+    """The sync side of ContentDatabase, spoken over the JSON API (api.py)"""
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+
+    def _request(self, path, body=None):
+        headers = {"Accept-Encoding": "gzip"}
+        data = None
+        if body is not None:
+            data = gzip.compress(json.dumps(body).encode("utf-8"))
+            headers.update({"Content-Type": "application/json", "Content-Encoding": "gzip"})
+        request = urllib.request.Request(self.url + path, data=data, headers=headers)
+        with urllib.request.urlopen(request) as response:
+            payload = response.read()
+            if response.headers.get("Content-Encoding") == "gzip":
+                payload = gzip.decompress(payload)
+        return json.loads(payload)
+
+    def get_device_id(self):
+        return self._request("/sync/cursor")["device_id"]
+
+    def get_sync_cursor(self, peer_id):
+        return self._request("/sync/cursor?" + urlencode({"peer": peer_id}))["last_seq"]
+
+    def export_changes(self, since_seq=0, exclude_origin=None, limit=DEFAULT_BATCH_SIZE):
+        params = {"since": since_seq, "limit": limit}
+        if exclude_origin:
+            params["exclude_origin"] = exclude_origin
+        return self._request("/changes?" + urlencode(params))
+
+    def apply_changes(self, changes, peer_id=None, peer_seq=None):
+        body = {"changes": changes, "device_id": peer_id, "last_seq": peer_seq}
+        return self._request("/changes", body)["applied"]
+
+
+def open_database(target):
+    """ContentDatabase for a path, RemoteDatabase for an http(s) URL"""
+    if target.startswith(("http://", "https://")):
+        return RemoteDatabase(target)
+    return ContentDatabase(target)
+
+
+def export_size(export):
+    """Bytes an export takes on the wire (gzipped JSON)"""
+    return len(gzip.compress(json.dumps(export).encode("utf-8")))
+
+
+def pull(local, remote, batch_size=DEFAULT_BATCH_SIZE):
+    """Apply remote's changes since the last pull to local
+
+    Returns (changes_received, changes_applied, bytes).
+    """
+    local_id = local.get_device_id()
+    since = local.get_sync_cursor(remote.get_device_id())
+    received = applied = size = 0
+    while True:
+        export = remote.export_changes(since, exclude_origin=local_id, limit=batch_size)
+        if export["last_seq"] == since:
+            return received, applied, size
+        received += len(export["changes"])
+        size += export_size(export)
+        applied += local.apply_changes(export["changes"], peer_id=export["device_id"],
+                                       peer_seq=export["last_seq"])
+        since = export["last_seq"]
+
+
+def sync(local, remote, batch_size=DEFAULT_BATCH_SIZE):
+    """Two-way sync; returns {"pulled": ..., "pushed": ...} as (received, applied, bytes)"""
+    return {"pulled": pull(local, remote, batch_size), "pushed": pull(remote, local, batch_size)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync ContentMood databases")
+    parser.add_argument("--db", default="contentmood.db")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    sync_parser = subparsers.add_parser("sync", help="two-way sync with a database file or API URL")
+    sync_parser.add_argument("remote")
+    sync_parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+
+    export_parser = subparsers.add_parser("export", help="write changes after --since to a file")
+    export_parser.add_argument("--since", type=int, default=0)
+    export_parser.add_argument("-o", "--output", required=True)
+
+    apply_parser = subparsers.add_parser("apply", help="apply a file written by export")
+    apply_parser.add_argument("path")
+
+    device_parser = subparsers.add_parser("device-id", help="show (or with --new, replace) the device id")
+    device_parser.add_argument("--new", action="store_true")
+
+    args = parser.parse_args()
+    db = ContentDatabase(args.db)
+    started = time.perf_counter()
+
+    if args.command == "sync":
+        remote = open_database(args.remote)
+        result = sync(db, remote, args.batch_size)
+        for direction, (received, applied, size) in result.items():
+            print(f"🔄 {direction}: {applied:,} of {received:,} changes applied ({size / 1024:,.1f} KiB)")
+        print(f"✨ Synced with {args.remote} in {time.perf_counter() - started:.2f}s")
+    elif args.command == "export":
+        export = db.export_changes(args.since, limit=sys.maxsize)
+        with gzip.open(args.output, "wt", encoding="utf-8") as output:
+            json.dump(export, output)
+        print(f"📤 Exported {len(export['changes']):,} changes up to seq {export['last_seq']} to {args.output}")
+    elif args.command == "apply":
+        with gzip.open(args.path, "rt", encoding="utf-8") as source:
+            export = json.load(source)
+        applied = db.apply_changes(export["changes"], peer_id=export["device_id"], peer_seq=export["last_seq"])
+        print(f"📥 Applied {applied:,} of {len(export['changes']):,} changes from {args.path}")
+    elif args.command == "device-id":
+        print(db.reset_device_id() if args.new else db.get_device_id())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""Which emotional tags go together, and with which genres
+
+    python taggraph.py --db contentmood.db related sobbing
+    python taggraph.py --db contentmood.db pairs
+
+Every mood log with tags is a row of a sparse logs × tags incidence matrix X.
+Its Gram matrix X'X counts how many logs share each pair of tags (the
+diagonal is how many logs carry each tag), and X'G, with G the logs × genres
+incidence, counts tags per genre. Both are kept as SciPy sparse matrices in a
+file next to the database (contentmood.taggraph.npz) and maintained like the
+sketches: new mood logs are folded in by adding their own X'X and X'G, and an
+in-place update or delete (the *_rewrites counters) rebuilds them.
+
+Pairs are scored by lift, PMI and normalized PMI (NPMI, from -1 for tags that
+never meet to 1 for tags that always do). Scores are recomputed from the
+counts once per data version and kept in memory; a query then reads one row.
+"""
+import argparse
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+from incremental import (PerDatabase, load_arrays, meta_arrays, meta_from_arrays, read_meta, rewrite_counts,
+                         rewritten, save_arrays)
+
+TAGGRAPH_CHUNK_ROWS = 200000
+# Pairs seen together fewer times than this are too noisy to score
+MIN_PAIR_LOGS = 3
+# Writing the file costs far more than folding in one log, so small folds are
+# saved at most this often; anything folded after the last save is simply
+# folded in again from the database by the next process
+SAVE_EVERY_LOGS = 1000
+SAVE_INTERVAL_SECONDS = 60
+
+
+def _sparse():
+    try:
+        from scipy import sparse
+    except ImportError as exc:
+        raise ImportError("The tag graph needs the scipy package: pip install scipy") from exc
+    return sparse
+
+
+def _codes(values, vocabulary, index):
+    """Integer codes for values, adding unseen ones to vocabulary and index"""
+    for value in values.unique():
+        if value not in index:
+            index[value] = len(vocabulary)
+            vocabulary.append(value)
+    return values.map(index).to_numpy(dtype=np.int64)
+
+
+class TagGraph:
+    """Tag co-occurrence and tag/genre counts for one database, caught up on demand"""
+
+    def __init__(self, db, path=None):
+        self.db = db
+        self.path = path or f"{os.path.splitext(db.db_name)[0]}.taggraph.npz"
+        self._lock = threading.Lock()
+        self._scores = None
+        self._unsaved = 0
+        self._saved_at = 0.0
+        self._reset()
+        if not load_arrays(self.path, self._load):
+            self._reset()
+
+    def _reset(self):
+        sparse = _sparse()
+        self.tags, self.genres = [], []
+        self.tag_index, self.genre_index = {}, {}
+        self.pairs = sparse.csr_matrix((0, 0), dtype=np.int64)
+        self.tag_genres = sparse.csr_matrix((0, 0), dtype=np.int64)
+        self.meta = {"mood_logs_through": 0, "content_rewrites": None, "mood_logs_rewrites": None,
+                     "data_version": None, "tagged_logs": 0}
+
+    def _load(self, arrays):
+        sparse = _sparse()
+        self.tags = arrays["tags"].tolist()
+        self.genres = arrays["genres"].tolist()
+        self.pairs = sparse.csr_matrix(
+            (arrays["pairs_data"], (arrays["pairs_rows"], arrays["pairs_columns"])),
+            shape=(len(self.tags), len(self.tags)))
+        self.tag_genres = sparse.csr_matrix(
+            (arrays["tag_genres_data"], (arrays["tag_genres_rows"], arrays["tag_genres_columns"])),
+            shape=(len(self.tags), len(self.genres)))
+        self.meta = meta_from_arrays(arrays)
+        self.tag_index = {tag: code for code, tag in enumerate(self.tags)}
+        self.genre_index = {genre: code for code, genre in enumerate(self.genres)}
+
+    def _save(self):
+        pairs, tag_genres = self.pairs.tocoo(), self.tag_genres.tocoo()
+        save_arrays(self.path, {
+            "tags": np.array(self.tags, dtype=str), "genres": np.array(self.genres, dtype=str),
+            "pairs_rows": pairs.row, "pairs_columns": pairs.col, "pairs_data": pairs.data,
+            "tag_genres_rows": tag_genres.row, "tag_genres_columns": tag_genres.col,
+            "tag_genres_data": tag_genres.data, **meta_arrays(self.meta),
+        })
+        self._unsaved = 0
+        self._saved_at = time.monotonic()
+
+    def sync(self):
+        """Fold in mood logs written since the last sync; True if any were folded in"""
+        import pandas as pd
+        sparse = _sparse()
+        with self._lock, self.db._reader() as source:
+            meta = read_meta(source)
+            if self.meta["data_version"] == meta.get("data_version"):
+                return False
+            folded = self.meta["data_version"] is None
+            # Genres come from content, so a content rewrite can move tags too
+            if rewritten(self.meta, meta, ("content", "mood_logs")):
+                self._reset()
+                folded = True
+            for chunk in pd.read_sql_query(
+                    "SELECT m.id, m.emotional_tags, c.genre FROM mood_logs m "
+                    "JOIN content c ON c.id = m.content_id WHERE m.id > ? ORDER BY m.id", source,
+                    params=(self.meta["mood_logs_through"],), chunksize=TAGGRAPH_CHUNK_ROWS):
+                # pandas yields one empty chunk when there is nothing new
+                if chunk.empty:
+                    continue
+                self.meta["mood_logs_through"] = int(chunk["id"].iloc[-1])
+                folded = True
+                tags = (chunk["emotional_tags"].dropna().map(self.db.decode_text)
+                        .str.lower().str.split(",").explode().str.strip())
+                tags = pd.DataFrame({"log": tags.index, "tag": tags.to_numpy()})
+                tags = tags[tags["tag"].notna() & (tags["tag"] != "")].drop_duplicates()
+                if tags.empty:
+                    continue
+                # One incidence row per tagged log in this chunk
+                logs, log_rows = np.unique(tags["log"].to_numpy(), return_inverse=True)
+                tag_codes = _codes(tags["tag"], self.tags, self.tag_index)
+                incidence = sparse.csr_matrix((np.ones(len(tags), dtype=np.int64), (log_rows, tag_codes)),
+                                              shape=(len(logs), len(self.tags)))
+                genres = chunk["genre"].iloc[logs].reset_index(drop=True).dropna()
+                genre_codes = _codes(genres, self.genres, self.genre_index)
+                genre_incidence = sparse.csr_matrix(
+                    (np.ones(len(genres), dtype=np.int64), (genres.index.to_numpy(), genre_codes)),
+                    shape=(len(logs), len(self.genres)))
+                self.pairs.resize((len(self.tags), len(self.tags)))
+                self.tag_genres.resize((len(self.tags), len(self.genres)))
+                self.pairs = (self.pairs + incidence.T @ incidence).tocsr()
+                self.tag_genres = (self.tag_genres + incidence.T @ genre_incidence).tocsr()
+                self.meta["tagged_logs"] += len(logs)
+                self._unsaved += len(logs)
+            self.meta.update(data_version=meta.get("data_version"),
+                             **rewrite_counts(meta, ("content", "mood_logs")))
+            if folded and (self._unsaved >= SAVE_EVERY_LOGS or not os.path.exists(self.path)
+                           or time.monotonic() - self._saved_at >= SAVE_INTERVAL_SECONDS):
+                self._save()
+        return folded
+
+    def scores(self):
+        """(together, lift, pmi, npmi) as sparse tag × tag matrices, off the
+        diagonal and over pairs seen at least MIN_PAIR_LOGS times"""
+        self.sync()
+        with self._lock:
+            if self._scores is None or self._scores[0] != self.meta["data_version"]:
+                self._scores = (self.meta["data_version"], self._score_pairs())
+            return self._scores[1]
+
+    def _score_pairs(self):
+        sparse = _sparse()
+        together = sparse.triu(self.pairs, k=1).tocoo()
+        keep = together.data >= MIN_PAIR_LOGS
+        rows, columns, counts = together.row[keep], together.col[keep], together.data[keep].astype(float)
+        logs = float(self.meta["tagged_logs"])
+        carrying = self.pairs.diagonal().astype(float)
+        # lift = P(a, b) / (P(a) P(b)); NPMI divides PMI by -log P(a, b)
+        lift = counts * logs / (carrying[rows] * carrying[columns])
+        pmi = np.log(lift)
+        joint = counts / logs
+        npmi = np.divide(pmi, -np.log(joint), out=np.ones_like(pmi), where=joint < 1)
+        size = len(self.tags)
+
+        def symmetric(values):
+            half = sparse.coo_matrix((values, (rows, columns)), shape=(size, size))
+            return (half + half.T).tocsr()
+
+        return tuple(symmetric(values) for values in (counts, lift, pmi, npmi))
+
+    def tag_counts(self, limit=None):
+        """[(tag, tagged logs)], most common first"""
+        self.sync()
+        with self._lock:
+            carrying = self.pairs.diagonal()
+            order = np.argsort(-carrying, kind="stable")[:limit]
+            return [(self.tags[code], int(carrying[code])) for code in order]
+
+    def related(self, tag, limit=10):
+        """Tags most associated with tag (by NPMI), as dicts with the pair's
+        logs together, lift, pmi and npmi"""
+        together, lift, pmi, npmi = self.scores()
+        code = self.tag_index.get(tag.strip().lower())
+        if code is None:
+            return []
+        row = npmi.getrow(code)
+        order = row.indices[np.argsort(-row.data, kind="stable")][:limit]
+        return [{"tag": self.tags[other], "together": int(together[code, other]),
+                 "lift": float(lift[code, other]), "pmi": float(pmi[code, other]),
+                 "npmi": float(npmi[code, other])} for other in order]
+
+    def top_pairs(self, limit=20, min_npmi=0.0):
+        """Strongest pairs overall, most associated first"""
+        together, lift, _, npmi = self.scores()
+        strongest = _sparse().triu(npmi, k=1).tocoo()
+        keep = strongest.data >= min_npmi
+        rows, columns, values = strongest.row[keep], strongest.col[keep], strongest.data[keep]
+        order = np.argsort(-values, kind="stable")[:limit]
+        return [{"tag": self.tags[rows[i]], "other": self.tags[columns[i]],
+                 "together": int(together[rows[i], columns[i]]), "lift": float(lift[rows[i], columns[i]]),
+                 "npmi": float(values[i])} for i in order]
+
+    def genres_for(self, tag, limit=5):
+        """Genres tag shows up in more than chance (lift over the genre's share of tagged logs)"""
+        self.sync()
+        with self._lock:
+            code = self.tag_index.get(tag.strip().lower())
+            if code is None:
+                return []
+            row = self.tag_genres.getrow(code)
+            per_genre = np.asarray(self.tag_genres.sum(axis=0)).ravel().astype(float)
+            carrying = float(self.pairs[code, code])
+            lift = row.data * float(self.meta["tagged_logs"]) / (carrying * per_genre[row.indices])
+            # Most shared logs first, so a single log in a rare genre doesn't lead
+            order = [i for i in np.lexsort((-lift, -row.data)) if lift[i] > 1][:limit]
+            return [{"genre": self.genres[row.indices[i]], "together": int(row.data[i]), "lift": float(lift[i])}
+                    for i in order]
+
+    def network(self, max_tags=30, min_npmi=0.1):
+        """Nodes [(tag, logs)] for the most common tags and edges [(a, b, npmi)]
+        between them, with 2-D positions from a spectral layout of the edges"""
+        nodes = self.tag_counts(max_tags)
+        npmi = self.scores()[3]
+        codes = [self.tag_index[tag] for tag, _ in nodes]
+        weights = npmi[codes][:, codes].toarray()
+        weights[weights < min_npmi] = 0.0
+        edges = [(nodes[i][0], nodes[j][0], float(weights[i, j]))
+                 for i in range(len(codes)) for j in range(i + 1, len(codes)) if weights[i, j] > 0]
+        return nodes, edges, _spectral_layout(weights)
+
+
+def _spectral_layout(weights):
+    """2-D positions placing strongly linked nodes close together (the second
+    and third eigenvectors of the normalized Laplacian), on a circle if the
+    graph is too sparse for that"""
+    size = len(weights)
+    angles = np.linspace(0, 2 * math.pi, size, endpoint=False)
+    circle = np.column_stack([np.cos(angles), np.sin(angles)])
+    degrees = weights.sum(axis=1)
+    if size < 4 or (degrees == 0).any():
+        return circle
+    scale = 1 / np.sqrt(degrees)
+    laplacian = np.eye(size) - scale[:, None] * weights * scale[None, :]
+    _, vectors = np.linalg.eigh(laplacian)
+    positions = vectors[:, 1:3] * scale[:, None]
+    spread = np.abs(positions).max(axis=0)
+    return positions / np.where(spread > 0, spread, 1)
+
+
+_instances = PerDatabase(TagGraph)
+
+
+def get_tag_graph(db):
+    """The shared TagGraph for db's file"""
+    return _instances.get(db)
+
+
+def main():
+    from database import ContentDatabase
+
+    parser = argparse.ArgumentParser(description="Explore how emotional tags go together")
+    parser.add_argument("--db", default="contentmood.db")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    related = subparsers.add_parser("related", help="tags and genres that go with one tag")
+    related.add_argument("tag")
+    related.add_argument("--limit", type=int, default=10)
+    pairs = subparsers.add_parser("pairs", help="the strongest tag pairs overall")
+    pairs.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    graph = get_tag_graph(ContentDatabase(args.db, cache_bytes=0))
+    if args.command == "related":
+        for row in graph.related(args.tag, args.limit):
+            print(f"🏷️ {row['tag']:<20} together {row['together']:>6}  lift {row['lift']:6.2f}  "
+                  f"npmi {row['npmi']:+.2f}")
+        for row in graph.genres_for(args.tag, args.limit):
+            print(f"🎭 {row['genre']:<20} together {row['together']:>6}  lift {row['lift']:6.2f}")
+    else:
+        for row in graph.top_pairs(args.limit):
+            print(f"🏷️ {row['tag'] + ' + ' + row['other']:<32} together {row['together']:>6}  "
+                  f"lift {row['lift']:6.2f}  npmi {row['npmi']:+.2f}")
+
+
+if __name__ == "__main__":
+    main()
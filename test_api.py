@@ -0,0 +1,74 @@
+"""The JSON API answers every request, errors included, and its ETags move
+whenever the data behind a response does
+
+    python -m pytest test_api.py
+"""
+import gzip
+import http.client
+import json
+import sqlite3
+import threading
+
+import pytest
+
+from api import make_server
+from benchmark import make_synthetic_db
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = make_server(make_synthetic_db(str(tmp_path / "contentmood.db"), 50), port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def request(server, method, path, body=None, headers=None):
+    conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=10)
+    try:
+        conn.request(method, path, body, headers or {})
+        response = conn.getresponse()
+        payload = response.read()
+        return response.status, response.getheader("ETag"), json.loads(payload) if payload else None
+    finally:
+        conn.close()
+
+
+def test_bad_gzip_body_is_a_400(server):
+    for body in (b"not gzip at all", gzip.compress(b'{"title": "x"}')[:-6]):
+        status, _, data = request(server, "POST", "/content", body,
+                                  {"Content-Type": "application/json", "Content-Encoding": "gzip"})
+        assert status == 400
+        assert "gzip" in data["error"]
+
+
+def test_gzip_body_still_accepted(server):
+    entry = {"title": "Zipped", "content_type": "Book", "date_consumed": "2024-06-01"}
+    status, _, data = request(server, "POST", "/content", gzip.compress(json.dumps(entry).encode()),
+                              {"Content-Type": "application/json", "Content-Encoding": "gzip"})
+    assert status == 201 and len(data["ids"]) == 1
+
+
+def test_unexpected_errors_are_a_500(server, monkeypatch):
+    def broken(*args, **kwargs):
+        raise sqlite3.OperationalError("database disk image is malformed")
+
+    monkeypatch.setattr(server.RequestHandlerClass.db, "get_all_moods", broken)
+    monkeypatch.setattr(server.RequestHandlerClass.db, "apply_changes", broken)
+    status, _, data = request(server, "GET", "/moods")
+    assert status == 500 and "malformed" in data["error"]
+    status, _, data = request(server, "POST", "/changes", json.dumps({"changes": []}),
+                              {"Content-Type": "application/json"})
+    assert status == 500 and "malformed" in data["error"]
+    assert request(server, "GET", "/health")[0] == 200
+
+
+def test_sync_cursor_etag_follows_the_cursor(server):
+    status, etag, data = request(server, "GET", "/sync/cursor?peer=laptop")
+    assert status == 200 and data["last_seq"] == 0
+    assert request(server, "GET", "/sync/cursor?peer=laptop", headers={"If-None-Match": etag})[0] == 304
+    # Nothing to apply: the cursor moves but the data version doesn't
+    server.RequestHandlerClass.db.apply_changes([], "laptop", 42)
+    status, new_etag, data = request(server, "GET", "/sync/cursor?peer=laptop", headers={"If-None-Match": etag})
+    assert status == 200 and data["last_seq"] == 42 and new_etag != etag
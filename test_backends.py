@@ -0,0 +1,87 @@
+"""The SQLite and DuckDB backends must answer every read identically
+
+    python -m pytest test_backends.py
+"""
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import backends
+from benchmark import BACKEND_METHODS, make_synthetic_db
+from database import ContentDatabase
+from filters import ContentFilter
+
+pytest.importorskip("duckdb")
+
+
+@pytest.fixture
+def engines(tmp_path):
+    path = make_synthetic_db(str(tmp_path / "contentmood.db"), 500)
+    return {name: ContentDatabase(path, backend=name, cache_bytes=0) for name in ("sqlite", "duckdb")}
+
+
+def assert_same(engines, method, **kwargs):
+    results = {name: getattr(db, method)(**kwargs) for name, db in engines.items()}
+    assert len(results["sqlite"]) > 0
+    pd.testing.assert_frame_equal(results["sqlite"], results["duckdb"], check_dtype=False)
+
+
+@pytest.mark.parametrize("method", BACKEND_METHODS)
+def test_same_results(engines, method):
+    assert_same(engines, method)
+
+
+@pytest.mark.parametrize("method", BACKEND_METHODS)
+def test_same_results_filtered(engines, method):
+    filters = ContentFilter(date_from="2018-01-01", content_types=["Book", "Anime"], min_rating=4)
+    assert_same(engines, method, filters=filters)
+
+
+@pytest.mark.parametrize("method", BACKEND_METHODS)
+def test_same_results_after_writes(engines, method):
+    db = engines["sqlite"]
+    assert_same(engines, method)
+    # An append is copied over by id; an in-place update reloads the table
+    content_id = db.add_content("Brand New", "Book", None, None, 2024, "2024-06-01", None)
+    db.add_mood_log(content_id, 3, 8, "hopeful", "2024-06-01")
+    conn = sqlite3.connect(db.db_name)
+    conn.execute("UPDATE content SET genre = 'Romance', rating = 9.5 WHERE id <= 25")
+    conn.commit()
+    conn.close()
+    assert_same(engines, method)
+
+
+def test_readers_never_see_a_partial_reload(engines, monkeypatch):
+    monkeypatch.setattr(backends, "MIRROR_CHUNK_ROWS", 100)
+    mirror = engines["duckdb"].backend
+    mirror.sync()
+    conn = sqlite3.connect(engines["sqlite"].db_name)
+    conn.execute("UPDATE content SET rating = 1 WHERE id = 1")
+    conn.commit()
+    conn.close()
+    # What another reader sees each time a chunk is about to be copied in
+    seen = []
+    register = mirror.conn.register
+
+    def watching_register(name, frame):
+        cursor = mirror.conn.cursor()
+        seen.append(cursor.execute("SELECT COUNT(*) FROM content").fetchone()[0])
+        cursor.close()
+        return register(name, frame)
+
+    monkeypatch.setattr(mirror, "conn", _Proxy(mirror.conn, register=watching_register))
+    assert mirror.sync()
+    assert seen and set(seen) == {500}
+    assert_same(engines, "get_all_content")
+
+
+class _Proxy:
+    """Stands in for a DuckDB connection, overriding some of its methods"""
+
+    def __init__(self, conn, **overrides):
+        self._conn = conn
+        self.__dict__.update(overrides)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
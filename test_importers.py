@@ -0,0 +1,60 @@
+"""Imported exports, unrated records included, render on every page
+
+    python -m pytest test_importers.py
+"""
+import os
+import shutil
+import sqlite3
+import threading
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+from database import ContentDatabase
+from importers import import_file
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+GOODREADS_EXPORT = """Title,Author,My Rating,Exclusive Shelf,Date Read,Date Added,Bookshelves
+Rated Book,Some Author,4,read,2025/01/10,2025/01/01,fantasy
+Unrated Book,Some Author,0,read,2025/01/12,2025/01/02,fantasy
+No Rating Column Value,Other Author,,read,,2025/01/03,
+Still Reading,Other Author,0,currently-reading,,2025/01/04,
+"""
+
+
+@pytest.fixture
+def imported(tmp_path, monkeypatch):
+    shutil.copy(os.path.join(ROOT, "contentmood.db"), tmp_path)
+    export = tmp_path / "goodreads_library_export.csv"
+    export.write_text(GOODREADS_EXPORT, encoding="utf-8")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("CONTENTMOOD_MAINTENANCE_INTERVAL", "0")
+    monkeypatch.setenv("CONTENTMOOD_BACKUP_INTERVAL", "0")
+    db = ContentDatabase(str(tmp_path / "contentmood.db"), cache_bytes=0)
+    db.create_tables()
+    return db, import_file(db, "goodreads", str(export))
+
+
+def test_unrated_records_import_without_a_rating(imported):
+    db, (records, entries, skipped) = imported
+    assert (records, entries, skipped) == (4, 3, 1)
+    conn = sqlite3.connect(db.db_name)
+    ratings = dict(conn.execute("SELECT title, rating FROM content WHERE creator LIKE '% Author'").fetchall())
+    conn.close()
+    assert ratings == {"Rated Book": 8.0, "Unrated Book": None, "No Rating Column Value": None}
+
+
+@pytest.mark.parametrize("page", ["🏠 Dashboard", "📊 Analytics", "💡 Insights"])
+def test_pages_render_unrated_entries(imported, page):
+    app = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=60)
+    app.run()
+    if page != "🏠 Dashboard":
+        app.sidebar.radio[0].set_value(page).run()
+    # The app opens contentmood.db relative to the working directory: let the
+    # pivot cube's background build finish before the test moves back out
+    for thread in threading.enumerate():
+        if thread.name == "cube-build":
+            thread.join()
+    assert not app.exception, [exception.value for exception in app.exception]
+    if page == "🏠 Dashboard":
+        assert any("unrated" in markdown.value for markdown in app.markdown)
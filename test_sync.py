@@ -0,0 +1,76 @@
+"""Changes from another database (POST /changes) only ever set known columns
+
+    python -m pytest test_sync.py
+"""
+import http.client
+import json
+import sqlite3
+import threading
+
+import pytest
+
+from api import make_server
+from benchmark import make_synthetic_db
+from database import ContentDatabase
+
+HOSTILE_KEY = "title = 'owned', rating = 0 WHERE 1 = 1; DROP TABLE mood_logs; --"
+
+
+def change(row, table="content", origin_id=1):
+    return {"table": table, "origin": "peer-device", "origin_id": origin_id,
+            "version_at": 2 ** 40, "version_origin": "peer-device", "deleted": False, "row": row}
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return make_synthetic_db(str(tmp_path / "contentmood.db"), 50)
+
+
+def table_state(path):
+    conn = sqlite3.connect(path)
+    try:
+        return (conn.execute("SELECT id, title, rating FROM content ORDER BY id").fetchall(),
+                conn.execute("SELECT COUNT(*) FROM mood_logs").fetchone()[0])
+    finally:
+        conn.close()
+
+
+def test_known_columns_apply(db_path):
+    db = ContentDatabase(db_path, cache_bytes=0)
+    row = {"title": "From Another Device", "content_type": "Book", "date_consumed": "2024-06-01", "rating": 8.0}
+    assert db.apply_changes([change(row)]) == 1
+    assert "From Another Device" in db.get_all_content()["title"].tolist()
+
+
+@pytest.mark.parametrize("table, key", [
+    ("content", HOSTILE_KEY),
+    ("content", "id"),
+    ("content", "notes_dict"),
+    ("mood_logs", "content_id"),
+    ("mood_logs", "title"),
+])
+def test_unknown_columns_rejected(db_path, table, key):
+    db = ContentDatabase(db_path, cache_bytes=0)
+    before = table_state(db_path)
+    with pytest.raises(ValueError, match="Unknown"):
+        db.apply_changes([change({"title": "x", key: 1}, table=table)])
+    assert table_state(db_path) == before
+
+
+def test_hostile_key_over_api_is_a_400(db_path):
+    server = make_server(db_path, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    before = table_state(db_path)
+    try:
+        conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=10)
+        body = json.dumps({"device_id": "peer-device", "last_seq": 1,
+                           "changes": [change({"title": "x", HOSTILE_KEY: 1})]})
+        conn.request("POST", "/changes", body, {"Content-Type": "application/json"})
+        response = conn.getresponse()
+        assert response.status == 400
+        assert "Unknown content column" in json.loads(response.read())["error"]
+        conn.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert table_state(db_path) == before
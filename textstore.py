@@ -0,0 +1,254 @@
+"""Dictionary compression for the free-text columns
+
+    python textstore.py --db contentmood.db compress   # train dictionaries, compress existing rows
+    python textstore.py --db contentmood.db stats
+
+content.notes and mood_logs.emotional_tags are short and repetitive: on their
+own they barely compress, but against a dictionary trained on the user's own
+texts they shrink to a fraction. Compressed values stay in their columns as
+BLOBs laid out as
+
+    byte 0      codec (1 = zstd, 2 = raw deflate)
+    bytes 1-2   id of the dictionary in text_dictionaries (little endian)
+    rest        compressed UTF-8
+
+Values written before a dictionary existed stay TEXT and read back as they
+are. Training builds a candidate per available codec (zstd needs the
+zstandard package) and keeps whichever compresses held-out samples best; for
+notes and tags a few dozen bytes long, raw deflate with a preset dictionary
+usually beats zstd's frame overhead.
+"""
+import argparse
+import random
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Compressed column of each table
+TEXT_COLUMNS = {"content": "notes", "mood_logs": "emotional_tags"}
+
+CODEC_ZSTD = 1
+CODEC_DEFLATE = 2
+CODEC_NAMES = {CODEC_ZSTD: "zstd", CODEC_DEFLATE: "deflate"}
+HEADER = struct.Struct("<BH")
+
+# Raw deflate only looks back 32 KiB, so a bigger preset dictionary is wasted
+DICTIONARY_BYTES = 32 * 1024
+TRAINING_SAMPLES = 20000
+HOLDOUT_SHARE = 0.2
+ZSTD_LEVEL = 19
+
+
+class UnknownDictionary(KeyError):
+    """A value was compressed with a dictionary this process has not loaded"""
+
+
+def _frequent_content(samples, size=DICTIONARY_BYTES):
+    """Raw-content dictionary: the commonest whole texts, then the commonest words
+
+    Deflate finds matches near the end of the dictionary most cheaply, so the
+    most frequent strings go last.
+    """
+    texts, words = [], []
+    used = 0
+    for text, count in Counter(samples).most_common():
+        encoded = text.encode("utf-8")
+        if count < 2 or used + len(encoded) > size // 2:
+            break
+        texts.append(encoded)
+        used += len(encoded)
+    word_counts = Counter(word for text in samples for word in text.replace(",", " , ").split())
+    for word, _ in word_counts.most_common():
+        encoded = word.encode("utf-8") + b" "
+        if used + len(encoded) > size:
+            break
+        words.append(encoded)
+        used += len(encoded)
+    return b"".join(reversed(words)) + b"".join(reversed(texts))
+
+
+class _Compressors(threading.local):
+    """Per-thread compressor objects (zstd contexts are not thread safe)"""
+
+    def __init__(self):
+        self.zstd = {}
+
+
+class TextCodec:
+    """Encode and decode free-text values against stored dictionaries
+
+    loader() returns every stored dictionary as (id, field, codec, data);
+    it is called again when a value names a dictionary not seen yet, e.g.
+    one trained by another process.
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._local = _Compressors()
+        self.reload()
+
+    def reload(self):
+        dictionaries, current = {}, {}
+        for dictionary_id, field, codec, data in self._loader():
+            dictionaries[dictionary_id] = (codec, bytes(data))
+            current[field] = dictionary_id
+        with self._lock:
+            self._dictionaries = dictionaries
+            self._current = current
+            self._zstd_dictionaries = {}
+
+    def dictionary_for(self, field):
+        """(id, codec) of the dictionary new values of field are compressed with, or None"""
+        dictionary_id = self._current.get(field)
+        return None if dictionary_id is None else (dictionary_id, self._dictionaries[dictionary_id][0])
+
+    def _zstd_dictionary(self, dictionary_id):
+        dictionary = self._zstd_dictionaries.get(dictionary_id)
+        if dictionary is None:
+            dictionary = zstandard.ZstdCompressionDict(self._dictionaries[dictionary_id][1])
+            self._zstd_dictionaries[dictionary_id] = dictionary
+        return dictionary
+
+    def _zstd(self, dictionary_id):
+        compressors = self._local.zstd.get(dictionary_id)
+        if compressors is None:
+            dictionary = self._zstd_dictionary(dictionary_id)
+            params = zstandard.ZstdCompressionParameters.from_level(
+                ZSTD_LEVEL, format=zstandard.FORMAT_ZSTD1_MAGICLESS,
+                write_content_size=1, write_checksum=0, write_dict_id=0)
+            compressors = (zstandard.ZstdCompressor(dict_data=dictionary, compression_params=params),
+                           zstandard.ZstdDecompressor(dict_data=dictionary, format=zstandard.FORMAT_ZSTD1_MAGICLESS))
+            self._local.zstd[dictionary_id] = compressors
+        return compressors
+
+    def _compress(self, codec, dictionary_id, raw):
+        if codec == CODEC_ZSTD:
+            return self._zstd(dictionary_id)[0].compress(raw)
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -15, 9, zdict=self._dictionaries[dictionary_id][1])
+        return compressor.compress(raw) + compressor.flush()
+
+    def encode(self, field, text):
+        """Stored form of text: a compressed BLOB, or text itself when that is no bigger"""
+        if not text or not isinstance(text, str):
+            return text
+        chosen = self.dictionary_for(field)
+        if chosen is None:
+            return text
+        dictionary_id, codec = chosen
+        raw = text.encode("utf-8")
+        blob = HEADER.pack(codec, dictionary_id) + self._compress(codec, dictionary_id, raw)
+        return blob if len(blob) < len(raw) else text
+
+    def decode(self, value):
+        """Text for a stored value (TEXT and NULL pass through)"""
+        if not isinstance(value, bytes):
+            return value
+        codec, dictionary_id = HEADER.unpack_from(value)
+        if dictionary_id not in self._dictionaries:
+            self.reload()
+            if dictionary_id not in self._dictionaries:
+                raise UnknownDictionary(dictionary_id)
+        payload = value[HEADER.size:]
+        if codec == CODEC_ZSTD:
+            return self._zstd(dictionary_id)[1].decompress(payload).decode("utf-8")
+        decompressor = zlib.decompressobj(-15, zdict=self._dictionaries[dictionary_id][1])
+        return (decompressor.decompress(payload) + decompressor.flush()).decode("utf-8")
+
+
+def _candidates(samples):
+    """(codec, dictionary) pairs worth trying for these samples"""
+    candidates = [(CODEC_DEFLATE, _frequent_content(samples))]
+    if zstandard is not None:
+        try:
+            trained = zstandard.train_dictionary(DICTIONARY_BYTES, [text.encode("utf-8") for text in samples])
+            candidates.append((CODEC_ZSTD, trained.as_bytes()))
+        except zstandard.ZstdError:
+            # Too few or too uniform samples to train on
+            candidates.append((CODEC_ZSTD, candidates[0][1]))
+    return candidates
+
+
+def train(samples, seed=17):
+    """Best (codec, dictionary, stored_bytes, raw_bytes) for a list of sample texts
+
+    The sizes are measured on a held-out share of the samples.
+    """
+    samples = [text for text in samples if text]
+    random.Random(seed).shuffle(samples)
+    cut = max(1, int(len(samples) * HOLDOUT_SHARE))
+    holdout, training = samples[:cut], samples[cut:] or samples
+    raw_bytes = sum(len(text.encode("utf-8")) for text in holdout)
+    best = None
+    for codec, dictionary in _candidates(training):
+        trial = TextCodec(lambda: [(1, "trial", codec, dictionary)])
+        stored = 0
+        for text in holdout:
+            value = trial.encode("trial", text)
+            stored += len(value) if isinstance(value, bytes) else len(text.encode("utf-8"))
+        if best is None or stored < best[2]:
+            best = (codec, dictionary, stored, raw_bytes)
+    return best
+
+
+def compress(db, batch_size=5000, progress=None):
+    """Train a dictionary per text column and compress every TEXT value with it
+
+    Returns {column: (codec, rows_compressed, holdout_ratio)}.
+    """
+    results = {}
+    for table, column in TEXT_COLUMNS.items():
+        samples = db.get_text_samples(table, TRAINING_SAMPLES)
+        if not samples:
+            continue
+        codec, dictionary, stored, raw = train(samples)
+        db.save_text_dictionary(column, codec, dictionary)
+        rows = 0
+        after_id = 0
+        while True:
+            after_id, count = db.recompress_texts(table, after_id, batch_size)
+            if after_id is None:
+                break
+            rows += count
+            if progress is not None:
+                progress(column, rows)
+        results[column] = (CODEC_NAMES[codec], rows, stored / raw if raw else 1.0)
+    return results
+
+
+def main():
+    from database import ContentDatabase
+
+    parser = argparse.ArgumentParser(description="Compress notes and emotional tags")
+    parser.add_argument("--db", default="contentmood.db")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    compress_parser = subparsers.add_parser("compress", help="train dictionaries and compress existing rows")
+    compress_parser.add_argument("--batch-size", type=int, default=5000)
+    compress_parser.add_argument("--vacuum", action="store_true", help="VACUUM afterwards to return the space")
+    subparsers.add_parser("stats", help="stored vs. raw size of each text column")
+    args = parser.parse_args()
+
+    db = ContentDatabase(args.db)
+    if args.command == "compress":
+        started = time.perf_counter()
+        results = compress(db, args.batch_size)
+        for column, (codec, rows, ratio) in results.items():
+            print(f"🗜️ {column}: {rows:,} values compressed with {codec} ({ratio:.0%} of their size)")
+        if args.vacuum:
+            db.vacuum()
+        print(f"✨ Done in {time.perf_counter() - started:.1f}s")
+    else:
+        for column, (values, stored, raw) in db.get_text_stats().items():
+            print(f"📝 {column}: {values:,} values, {stored / 1024:,.1f} KiB stored for "
+                  f"{raw / 1024:,.1f} KiB of text")
+
+
+if __name__ == "__main__":
+    main()